@@ -0,0 +1,659 @@
+"""Reproducible per-stage benchmarks for the pose pipeline.
+
+Every stage is driven in isolation and end-to-end with frames decoded from
+``videos/sample/ray2.mp4``. Runs headless on a CPU-only machine.
+
+Examples:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --save benchmarks/baselines/local.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baselines/local.json --threshold 0.15
+    python benchmarks/run_benchmarks.py --stages preprocess draw_2d layout
+    python benchmarks/run_benchmarks.py --skip-errors   # without MediaPipe models
+
+A stage that raises fails the run unless ``--skip-errors`` is given, and
+``--compare`` fails when a baseline stage was not measured.
+"""
+import os
+
+# Headless before anything pulls in matplotlib or a GUI backend
+os.environ.setdefault('MPLBACKEND', 'Agg')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import argparse
+import copy
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+DEFAULT_VIDEO = os.path.join(ROOT, 'videos', 'sample', 'ray2.mp4')
+
+
+def load_frames(path, count, start=0):
+    """Decode ``count`` consecutive BGR frames starting at ``start``"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise Exception(f"Could not open video: {path}")
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    if not frames:
+        raise Exception(f"No frames decoded from {path}")
+    return frames, fps
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(fn, inputs, warmup=3, track_allocations=True):
+    """Call ``fn`` once per input and return timing/allocation statistics.
+
+    Timing and allocation tracking run in separate passes so tracemalloc's
+    overhead does not leak into the latency numbers.
+    """
+    for item in inputs[:warmup]:
+        fn(item)
+
+    samples = []
+    for item in inputs:
+        start = time.perf_counter_ns()
+        fn(item)
+        samples.append(time.perf_counter_ns() - start)
+
+    stats = {}
+    if track_allocations:
+        tracemalloc.start()
+        peaks = []
+        retained = []
+        for item in inputs[:max(1, min(len(inputs), 20))]:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            fn(item)
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+        tracemalloc.stop()
+        stats['alloc_peak_kb'] = float(np.mean(peaks)) / 1024.0
+        stats['alloc_retained_kb'] = float(np.mean(retained)) / 1024.0
+
+    ordered = sorted(samples)
+    stats.update({
+        'samples': len(samples),
+        'mean_ms': float(np.mean(samples)) / 1e6,
+        'p50_ms': _percentile(ordered, 0.50) / 1e6,
+        'p99_ms': _percentile(ordered, 0.99) / 1e6,
+        'min_ms': ordered[0] / 1e6,
+        'max_ms': ordered[-1] / 1e6,
+    })
+    return stats
+
+
+class BenchmarkContext:
+    """Lazily builds the components and intermediate inputs stages share"""
+
+    def __init__(self, frames, fps):
+        self.frames = frames
+        self.fps = fps
+        self._visualizer = None
+        self._display = None
+        self._pose_cache = None
+
+    @property
+    def visualizer(self):
+        if self._visualizer is None:
+            from utils.pose_pipeline import PipelineSettings
+            from utils.pose_visualizer import PoseVisualizer
+            self._visualizer = PoseVisualizer(inference_size=PipelineSettings().inference_size)
+        return self._visualizer
+
+    @property
+    def display(self):
+        if self._display is None:
+            from utils.display_manager import DisplayManager
+            self._display = DisplayManager()
+        return self._display
+
+    def preprocessed(self):
+        from utils.pose_pipeline import preprocess_frame
+        return [preprocess_frame(frame) for frame in self.frames]
+
+    def pose_results(self):
+        """(frame, results) pairs from one tracked pass over the input"""
+        if self._pose_cache is None:
+            self.visualizer.reset_tracking()
+            pairs = []
+            for source, frame in zip(self.frames, self.preprocessed()):
+                results = self.visualizer.process_frame(source, bgr=True)
+                pairs.append((frame, copy.deepcopy(results)))
+            self.visualizer.reset_tracking()
+            self._pose_cache = pairs
+        return self._pose_cache
+
+    def detected(self):
+        pairs = [(f, r) for f, r in self.pose_results() if r.pose_landmarks]
+        if not pairs:
+            raise Exception("No pose detected in the benchmark frames")
+        return pairs
+
+    def cleanup(self):
+        if self._visualizer is not None:
+            self._visualizer.cleanup()
+
+
+def bench_preprocess(ctx):
+    from utils.pose_pipeline import preprocess_frame
+    return measure(preprocess_frame, ctx.frames)
+
+
+def bench_prepare_inference(ctx):
+    from utils.letterbox import Letterbox
+    from utils.pose_pipeline import PipelineSettings
+    settings = PipelineSettings()
+
+    def prepare(frame):
+        return Letterbox(frame.shape, settings.inference_size, enhance=settings.enhance).apply(frame)
+
+    return measure(prepare, ctx.frames)
+
+
+def bench_pose_roi(ctx):
+    visualizer = ctx.visualizer
+    visualizer.reset_tracking()
+    stats = measure(lambda frame: visualizer.process_frame(frame, bgr=True), ctx.frames,
+                    track_allocations=False)
+    tracker = visualizer.tracker.stats()
+    print(f"  ROI hit rate {tracker['hit_rate']:.1%}, miss rate {tracker['miss_rate']:.1%}, "
+          f"full-frame fallback rate {tracker['fallback_rate']:.1%}")
+    return stats
+
+
+def bench_pose_full_frame(ctx):
+    visualizer = ctx.visualizer
+
+    def process_without_roi(frame):
+        visualizer.reset_tracking()
+        return visualizer.process_frame(frame, bgr=True)
+
+    return measure(process_without_roi, ctx.frames, track_allocations=False)
+
+
+def bench_keyframe_flow(ctx):
+    """Keyframe inference + optical flow against MediaPipe on every frame:
+    pose frames per CPU-second and landmark error relative to the latter"""
+    from utils.keyframe import KeyframePropagator
+    from utils.landmarks import landmarks_to_array
+    visualizer = ctx.visualizer
+    reference = ctx.pose_results()
+    frames = ctx.frames
+    timestamps = [i / ctx.fps for i in range(len(frames))]
+
+    def full_pass():
+        visualizer.reset_tracking()
+        for frame in frames:
+            visualizer.process_frame(frame, bgr=True)
+
+    propagator = KeyframePropagator()
+    poses = []
+
+    def keyframe_pass():
+        visualizer.reset_tracking()
+        propagator.reset()
+        poses.clear()
+        for frame, timestamp in zip(frames, timestamps):
+            results = None
+            if not propagator.keyframe_due():
+                results = propagator.propagate(frame, timestamp)
+            if results is None:
+                results = visualizer.process_frame(frame, bgr=True)
+                propagator.keyframe(frame, results, timestamp)
+            poses.append(results)
+
+    cpu = {}
+    for name, run in (('full', full_pass), ('keyframe', keyframe_pass)):
+        start = time.process_time()
+        run()
+        cpu[name] = time.process_time() - start
+
+    errors = []
+    for (display_frame, truth), pose in zip(reference, poses):
+        if truth.pose_landmarks and pose is not None and pose.pose_landmarks:
+            a = landmarks_to_array(truth.pose_landmarks)
+            b = landmarks_to_array(pose.pose_landmarks)
+            visible = a[:, 3] >= 0.5
+            h, w = display_frame.shape[:2]
+            delta = (a[visible, :2] - b[visible, :2]) * (w, h)
+            errors.append(float(np.linalg.norm(delta, axis=1).mean()))
+
+    speedup = cpu['full'] / cpu['keyframe'] if cpu['keyframe'] else 0.0
+    print(f"  pose frames per CPU-second: full {len(frames) / cpu['full']:.1f}, "
+          f"keyframe {len(frames) / cpu['keyframe']:.1f} ({speedup:.2f}x), "
+          f"mean error {np.mean(errors) if errors else 0.0:.1f}px, "
+          f"keyframe rate {propagator.stats()['keyframe_rate']:.0%}")
+    # Cost of one propagated frame, chained from the first detected pose
+    propagator.keyframe(frames[0], ctx.detected()[0][1], 0.0)
+    propagate = measure(lambda item: propagator.propagate(*item),
+                        list(zip(frames, timestamps)), track_allocations=False)
+    visualizer.reset_tracking()
+    return {'propagate': propagate}
+
+
+def bench_smooth_landmarks(ctx):
+    detected = ctx.detected()
+    visualizer = ctx.visualizer
+    reference = detected[0][1].pose_landmarks
+    inputs = [copy.deepcopy(results.pose_landmarks) for _, results in detected]
+
+    def smooth(landmarks):
+        visualizer.previous_landmarks = reference
+        return visualizer.smooth_landmarks(landmarks)
+
+    stats = measure(smooth, inputs)
+    visualizer.previous_landmarks = None
+    return stats
+
+
+def bench_draw_2d(ctx):
+    detected = ctx.detected()
+    visualizer = ctx.visualizer
+    inputs = [(frame.copy(), results) for frame, results in detected]
+    return measure(lambda item: visualizer.draw_2d_pose(*item), inputs)
+
+
+def bench_render_3d(ctx):
+    inputs = [results for _, results in ctx.detected()]
+    return measure(ctx.visualizer.visualize_3d_pose, inputs, track_allocations=False)
+
+
+def bench_features(ctx):
+    from utils.features import FeatureEngine, compute_features
+    from utils.landmarks import landmarks_to_array
+    detected = [r for _, r in ctx.detected() if r.pose_world_landmarks]
+    world = np.stack([landmarks_to_array(r.pose_world_landmarks) for r in detected])
+    timestamps = np.arange(len(world)) / ctx.fps
+    engine = FeatureEngine()
+    return {
+        'stream': measure(lambda item: engine.update(*item), list(zip(world, timestamps))),
+        'bulk': measure(lambda seq: compute_features(seq, timestamps), [world] * 10),
+    }
+
+
+def _feature_sequences(ctx):
+    """Streaming and bulk features of the detected frames"""
+    from utils.features import FeatureEngine, compute_features
+    from utils.landmarks import landmarks_to_array
+    detected = [r for _, r in ctx.detected() if r.pose_world_landmarks]
+    world = np.stack([landmarks_to_array(r.pose_world_landmarks) for r in detected])
+    timestamps = np.arange(len(world)) / ctx.fps
+    engine = FeatureEngine()
+    stream = [dict(engine.update(w, t)) for w, t in zip(world, timestamps)]
+    return stream, compute_features(world, timestamps)
+
+
+def bench_swing_phases(ctx):
+    from utils.swing_phases import SwingPhaseSegmenter
+    stream, bulk = _feature_sequences(ctx)
+    segmenter = SwingPhaseSegmenter()
+    return {
+        'stream': measure(segmenter.update, stream),
+        'offline': measure(segmenter.segment, [bulk] * 10),
+    }
+
+
+def bench_reps(ctx):
+    from utils.reps import RepCounter
+    stream, bulk = _feature_sequences(ctx)
+    counter = RepCounter()
+    return {
+        'stream': measure(counter.update, stream),
+        'bulk': measure(counter.count, [bulk] * 10),
+    }
+
+
+def bench_swing_index(ctx, count=100000):
+    from utils.swing_index import SwingIndex
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SwingIndex(tmp)
+        centres = rng.normal(size=(256, index.dim)).astype(np.float32)
+        embeddings = centres[rng.integers(0, len(centres), count)]
+        embeddings += 0.3 * rng.normal(size=embeddings.shape).astype(np.float32)
+        index.add_embeddings(embeddings, [{'name': str(i)} for i in range(count)])
+        queries = [embeddings[i] for i in rng.integers(0, count, 50)]
+        results = {'exact': measure(index.search, queries, track_allocations=False),
+                   'exact_batch': measure(index.search, [np.stack(queries)] * 5,
+                                          track_allocations=False)}
+        index.build_ivf(iterations=5)
+        results['ivf'] = measure(index.search, queries, track_allocations=False)
+        results['insert'] = measure(lambda row: index.add_embeddings(row, [{'name': 'new'}]),
+                                    [row[None] for row in queries[:20]], track_allocations=False)
+    return results
+
+
+def bench_session_store(ctx, minutes=60):
+    from utils.session_store import SessionStore, feature_columns
+    stream, bulk = _feature_sequences(ctx)
+    count = minutes * 60 * 30
+    repeat = -(-count // len(bulk['timestamp']))
+    columns = {name: np.concatenate([values] * repeat)[:count]
+               for name, values in feature_columns(bulk).items()}
+    landmarks = np.random.default_rng(0).random((count, 33, 4), dtype=np.float32)
+    rows = [{name: values[i] for name, values in columns.items()} for i in range(300)]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(tmp)
+        writer = store.create('bench')
+        writer.extend(dict(columns, timestamp=np.arange(count) / 30.0, landmarks=landmarks,
+                           world_landmarks=landmarks))
+        writer.close()
+        session = store.sessions()[0]
+        live = store.create('live')
+        results = {
+            'append': measure(lambda row: live.append(dict(row, timestamp=0.0,
+                                                           landmarks=landmarks[0])), rows),
+            'read_minute': measure(lambda start: session.read(['angle.right_elbow'], start,
+                                                              start + 60),
+                                   [60.0 * i for i in range(minutes)]),
+            'read_column': measure(lambda _: session.read(['angle.right_elbow']), [None] * 10),
+        }
+        store.cleanup()
+    return results
+
+
+def bench_result_cache(ctx, minutes=10):
+    from utils.result_cache import ResultCache
+    count = minutes * 60 * 30
+    rng = np.random.default_rng(0)
+    arrays = {'frame_indices': np.arange(count),
+              'landmarks': rng.random((count, 33, 4), dtype=np.float32),
+              'world_landmarks': rng.random((count, 33, 4), dtype=np.float32)}
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(tmp)
+        keys = [cache.key('landmarks', i) for i in range(5)]
+        return {
+            'store': measure(lambda key: cache.store(key, arrays), keys, warmup=0,
+                             track_allocations=False),
+            'load': measure(cache.load, keys, track_allocations=False),
+        }
+
+
+def bench_trajectory(ctx):
+    from utils.trajectory import Trajectory, draw_trajectory
+    trajectory = Trajectory()
+    pairs = ctx.detected()
+    for index, (_, results) in enumerate(pairs * 3):
+        trajectory.push(results, index / ctx.fps)
+    path = trajectory.path()
+    return {
+        'push': measure(lambda item: trajectory.push(*item),
+                        [(r, i / ctx.fps) for i, (_, r) in enumerate(pairs)]),
+        'draw': measure(lambda frame: draw_trajectory(frame, path),
+                        [frame.copy() for frame, _ in pairs]),
+    }
+
+
+def bench_heatmap(ctx):
+    from utils.heatmap import MotionHeatmap, blend_heatmap, render_heatmap
+    heatmap = MotionHeatmap()
+    pairs = ctx.detected()
+    for index, (_, results) in enumerate(pairs * 3):
+        heatmap.update(results, index / ctx.fps)
+    image = heatmap.image()
+    cache = {}
+    return {
+        'update': measure(lambda item: heatmap.update(*item),
+                          [(r, (len(pairs) * 3 + i) / ctx.fps) for i, (_, r) in enumerate(pairs)]),
+        'render': measure(lambda _: render_heatmap(heatmap.grid), pairs),
+        'blend': measure(lambda frame: blend_heatmap(frame, image, cache),
+                         [frame.copy() for frame, _ in pairs]),
+    }
+
+
+def _layout_inputs(ctx):
+    pairs = ctx.detected()
+    frame_3d = ctx.visualizer.visualize_3d_pose(pairs[0][1])
+    return [(frame.copy(), frame_3d, results) for frame, results in pairs]
+
+
+def bench_layout(ctx):
+    display = ctx.display
+    return measure(lambda item: display.create_quadrant_layout(*item), _layout_inputs(ctx))
+
+
+def bench_overlays(ctx):
+    from utils.lighting import get_lighting_info
+    display = ctx.display
+    frame_2d, frame_3d, results = _layout_inputs(ctx)[0]
+    combined = display.create_quadrant_layout(frame_2d, frame_3d, results)
+    lighting = get_lighting_info(ctx.frames[0])
+    view_info = getattr(ctx.visualizer, 'current_view', None)
+    inputs = [combined.copy() for _ in ctx.frames]
+    return measure(lambda frame: display.add_overlays(frame, 30.0, lighting, view_info), inputs)
+
+
+def bench_lighting(ctx):
+    from utils.lighting import LightingMonitor, get_lighting_info
+    monitor = LightingMonitor()
+    return {
+        'full_frame': measure(get_lighting_info, ctx.frames),
+        'monitor': measure(monitor.update, ctx.frames),
+    }
+
+
+def bench_record(ctx):
+    from utils.video_recorder import VideoRecorder
+    display = ctx.display
+    frame_2d, frame_3d, results = _layout_inputs(ctx)[0]
+    combined = display.create_quadrant_layout(frame_2d, frame_3d, results)
+    inputs = [combined for _ in ctx.frames]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # VideoRecorder writes into the working directory
+        recorder = VideoRecorder()
+        try:
+            recorder.start_recording(combined.shape, ctx.fps)
+            stats = measure(recorder.write_frame, inputs, track_allocations=False)
+        finally:
+            recorder.cleanup()
+            os.chdir(cwd)
+    return stats
+
+
+def bench_ming3_codec(ctx):
+    import base64
+    from ming3 import decode_frame, encode_frame
+    small = [cv2.resize(frame, (320, 240)) for frame in ctx.frames]
+    payloads = [base64.b64encode(encode_frame(frame)) for frame in small]
+    encode_stats = measure(encode_frame, small)
+    decode_stats = measure(decode_frame, payloads)
+    return {'encode': encode_stats, 'decode': decode_stats}
+
+
+def bench_end_to_end(ctx):
+    from utils.frame_source import FramePacket
+    from utils.pose_pipeline import build_pose_pipeline
+    ctx.visualizer.reset_tracking()
+    pipeline = build_pose_pipeline(ctx.visualizer, ctx.display)
+    # Frame-rate timestamps, so the governor, hold and velocities run as live
+    packets = [FramePacket(frame, i / ctx.fps, i) for i, frame in enumerate(ctx.frames)]
+    return measure(pipeline.process, packets, track_allocations=False)
+
+
+# Ordered registry of stage benchmarks
+BENCHMARKS = {
+    'preprocess': bench_preprocess,
+    'prepare_inference': bench_prepare_inference,
+    'lighting': bench_lighting,
+    'pose_roi': bench_pose_roi,
+    'pose_full_frame': bench_pose_full_frame,
+    'keyframe_flow': bench_keyframe_flow,
+    'smooth_landmarks': bench_smooth_landmarks,
+    'features': bench_features,
+    'swing_phases': bench_swing_phases,
+    'reps': bench_reps,
+    'swing_index': bench_swing_index,
+    'session_store': bench_session_store,
+    'result_cache': bench_result_cache,
+    'trajectory': bench_trajectory,
+    'heatmap': bench_heatmap,
+    'draw_2d': bench_draw_2d,
+    'render_3d': bench_render_3d,
+    'layout': bench_layout,
+    'overlays': bench_overlays,
+    'record': bench_record,
+    'ming3_codec': bench_ming3_codec,
+    'end_to_end': bench_end_to_end,
+}
+
+
+def flatten(results):
+    """Flatten nested stage results into {'stage' or 'stage.sub': stats}"""
+    flat = {}
+    for name, stats in results.items():
+        if 'mean_ms' in stats:
+            flat[name] = stats
+        else:
+            for sub, sub_stats in stats.items():
+                flat[f"{name}.{sub}"] = sub_stats
+    return flat
+
+
+def compare(current, baseline, threshold):
+    """Return a list of regressions above ``threshold`` (fractional)"""
+    regressions = []
+    base_stages = flatten(baseline.get('stages', {}))
+    for name, stats in flatten(current['stages']).items():
+        base = base_stages.get(name)
+        if not base:
+            continue
+        for key in ('mean_ms', 'p99_ms'):
+            if base.get(key, 0) <= 0:
+                continue
+            change = stats[key] / base[key] - 1.0
+            if change > threshold:
+                regressions.append((name, key, base[key], stats[key], change))
+    return regressions
+
+
+def missing_stages(current, baseline, stages):
+    """Baseline results of the selected ``stages`` that this run lacks"""
+    measured = flatten(current['stages'])
+    return [name for name in flatten(baseline.get('stages', {}))
+            if name.split('.')[0] in stages and name not in measured]
+
+
+def print_report(results):
+    print(f"{'stage':<24}{'mean ms':>10}{'p99 ms':>10}{'peak KB':>10}{'kept KB':>10}")
+    for name, stats in flatten(results).items():
+        peak = stats.get('alloc_peak_kb')
+        kept = stats.get('alloc_retained_kb')
+        print(f"{name:<24}{stats['mean_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+              f"{(f'{peak:.1f}' if peak is not None else '-'):>10}"
+              f"{(f'{kept:.1f}' if kept is not None else '-'):>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage pipeline benchmarks")
+    parser.add_argument('--video', default=DEFAULT_VIDEO, help="input video (default: ray2.mp4)")
+    parser.add_argument('--frames', type=int, default=60, help="number of frames to decode")
+    parser.add_argument('--start', type=int, default=0, help="first frame index")
+    parser.add_argument('--stages', nargs='+', choices=list(BENCHMARKS), help="subset of stages to run")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="cv2.setNumThreads value for reproducible numbers")
+    parser.add_argument('--save', metavar='PATH', help="write results as a JSON baseline")
+    parser.add_argument('--compare', metavar='PATH', help="compare against a saved baseline")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="fractional slowdown flagged as a regression (default 0.15)")
+    parser.add_argument('--skip-errors', action='store_true',
+                        help="report stages that fail (e.g. without MediaPipe models) as "
+                             "skipped instead of failing the run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+
+    frames, fps = load_frames(args.video, args.frames, args.start)
+    print(f"Loaded {len(frames)} frames ({frames[0].shape[1]}x{frames[0].shape[0]}) from {args.video}")
+
+    ctx = BenchmarkContext(frames, fps)
+    stages = args.stages or list(BENCHMARKS)
+    results = {}
+    failed = {}
+    try:
+        for name in stages:
+            print(f"Running {name}...")
+            try:
+                results[name] = BENCHMARKS[name](ctx)
+            except Exception as e:
+                failed[name] = str(e)
+                print(f"  {'skipped' if args.skip_errors else 'failed'}: {e}")
+    finally:
+        ctx.cleanup()
+
+    report = {
+        'meta': {
+            'video': os.path.relpath(args.video, ROOT),
+            'frames': len(frames),
+            'start': args.start,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'cv2_threads': cv2.getNumThreads(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        'stages': results,
+        'failed': failed,
+    }
+    print_report(results)
+    if failed and not args.skip_errors:
+        print(f"{len(failed)} stages failed: {', '.join(failed)} "
+              f"(--skip-errors to report them as skipped)")
+        return 1
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        missing = missing_stages(report, baseline, stages)
+        if regressions:
+            print(f"Regressions above {args.threshold:.0%}:")
+            for name, key, base, current, change in regressions:
+                print(f"  {name} {key}: {base:.3f} -> {current:.3f} ms ({change:+.0%})")
+        if missing:
+            print(f"Missing from this run but in the baseline: {', '.join(missing)}")
+        if regressions or missing:
+            return 1
+        print(f"No regressions above {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
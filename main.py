@@ -1,39 +1,19 @@
 from utils.pose_visualizer import PoseVisualizer
 from utils.video_recorder import VideoRecorder
 from utils.display_manager import DisplayManager
+from utils.tracing import span, enable_tracing
+from utils.frame_source import add_source_arguments, source_from_args
+from utils.pipeline import RUN_MODES
+from utils.pose_pipeline import build_pose_pipeline, PipelineSettings
+from utils.rate_governor import add_rate_arguments, governor_from_args
+from utils.model_controller import add_model_arguments, controller_from_args
+from utils.reference import add_reference_arguments, library_from_args
+from utils.coach_feedback import add_coach_arguments, coach_from_args
+from utils.swing_index import add_index_arguments, index_from_args
+from utils.session_store import add_store_arguments, store_from_args
+import argparse
 import cv2
-import time
-import numpy as np
 import platform
-import sys
-
-def setup_camera(camera_id=0):
-    """Initialize camera with platform-specific settings"""
-    system = platform.system()
-    
-    if system == "Darwin":  # macOS
-        # Try to use AVFOUNDATION backend specifically
-        cap = cv2.VideoCapture(camera_id, cv2.CAP_AVFOUNDATION)
-        # Use IPhone camera
-        # cap = cv2.VideoCapture(camera_id)
-        if not cap.isOpened():
-            raise Exception("Could not open camera")
-            
-        # Set Mac-specific camera properties
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        cap.set(cv2.CAP_PROP_FPS, 30)
-        
-    elif system == "Windows":
-        cap = cv2.VideoCapture(camera_id)
-        if not cap.isOpened():
-            camera_id = 1
-            cap = cv2.VideoCapture(camera_id)
-            
-    if not cap.isOpened():
-        raise Exception("Could not open camera")
-        
-    return cap
 
 def print_instructions():
     """Print usage instructions with platform-specific details"""
@@ -42,6 +22,7 @@ def print_instructions():
     print("'q' - quit")
     print("'r' - reset camera")
     print("'v' - start/stop recording")
+    print("'c' - clear trajectory and heatmap")
     
     if system == "Darwin":  # macOS
         print("'I/K' or Up/Down arrows - tilt up/down")
@@ -52,51 +33,6 @@ def print_instructions():
         print("'J/L' - rotate left/right")
         print("'U/N' - adjust height up/down")
 
-def process_frame(cap, visualizer):
-    """Process a single frame"""
-    ret, frame = cap.read()
-    if not ret:
-        return None
-    
-    # Preprocess frame
-    height, width = frame.shape[:2]
-    if width > 1280:  # Scale down large frames
-        scale = 1280 / width
-        frame = cv2.resize(frame, (int(width * scale), int(height * scale)))
-    
-    # Enhance image
-    frame = cv2.GaussianBlur(frame, (3, 3), 0)
-    frame = cv2.convertScaleAbs(frame, alpha=1.2, beta=10)  # Contrast and brightness
-    
-    # Process with MediaPipe
-    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    results = visualizer.process_frame(frame_rgb)
-    
-    return frame, results
-
-def get_lighting_info(frame):
-    """Analyze lighting conditions"""
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    brightness = np.mean(gray)
-    contrast = np.std(gray)
-    
-    status = "Lighting: "
-    if brightness < 50:
-        status += "Too Dark"
-        color = (0, 0, 255)
-    elif brightness > 200:
-        status += "Too Bright"
-        color = (0, 0, 255)
-    else:
-        status += "Good"
-        color = (0, 255, 0)
-        
-    return {
-        'status': status,
-        'color': color,
-        'contrast_warning': contrast < 20
-    }
-
 def handle_keys(key, visualizer, recorder, camera, frame=None):
     """Handle keyboard input"""
     if key == ord('q'):
@@ -104,13 +40,15 @@ def handle_keys(key, visualizer, recorder, camera, frame=None):
             recorder.stop_recording()
         return True
     elif key == ord('r'):
-        camera.release()
-        camera = cv2.VideoCapture(0)
+        camera.reset()
     elif key == ord('v'):
         if not recorder.is_recording and frame is not None:
             recorder.start_recording(frame.shape, camera.get(cv2.CAP_PROP_FPS))
         else:
             recorder.stop_recording()
+    elif key == ord('c'):
+        visualizer.trajectory.clear()
+        visualizer.heatmap.clear()
     elif key == ord('i'):
         visualizer.adjust_elevation(5)
     elif key == ord('k'):
@@ -125,69 +63,78 @@ def handle_keys(key, visualizer, recorder, camera, frame=None):
         visualizer.azim = (visualizer.azim - 5) % 360
     return False
 
-def cleanup(camera, visualizer, recorder, display):
+def cleanup(camera, visualizer, recorder, display, coach=None, store=None):
     """Cleanup resources"""
-    camera.release()
-    visualizer.cleanup()
-    recorder.cleanup()
-    display.cleanup()
+    if camera is not None:
+        camera.release()
+    for component in (visualizer, recorder, display, coach, store):
+        if component is not None:
+            component.cleanup()
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Real-time 3D pose analysis")
+    add_source_arguments(parser)
+    add_rate_arguments(parser)
+    add_model_arguments(parser)
+    add_reference_arguments(parser)
+    add_coach_arguments(parser)
+    add_index_arguments(parser)
+    add_store_arguments(parser)
+    parser.add_argument('--pipeline-mode', choices=RUN_MODES, default='inline',
+                        help="run stages inline, one thread per stage, or with a process pool")
+    parser.add_argument('--heatmap', action='store_true',
+                        help="overlay a decaying heatmap of where the hands and feet spent time")
+    parser.add_argument('--trace', metavar='PATH',
+                        help="record per-stage spans and write a Chrome trace to PATH on exit")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    if args.trace:
+        enable_tracing(args.trace)
+
+    camera = visualizer = recorder = display = coach = store = None
     try:
-        # Initialize camera using the platform-specific setup
-        camera = setup_camera()
+        # Initialize the frame source (camera by default)
+        camera = source_from_args(args)
         
         # Initialize components
-        visualizer = PoseVisualizer()
+        visualizer = PoseVisualizer(model_complexity=args.model_complexity,
+                                    min_detection_confidence=args.min_detection_confidence,
+                                    min_tracking_confidence=args.min_tracking_confidence,
+                                    model_controller=controller_from_args(args))
         recorder = VideoRecorder()
         display = DisplayManager()
+        # Feedback requests run on their own threads, never in the frame loop
+        coach = coach_from_args(args)
+        store = store_from_args(args)
         
         print_instructions()
         
-        # FPS calculation
-        fps_start_time = time.time()
-        fps_counter = 0
-        fps = 0
-        fps_update_interval = 0.5
+        # Capture, inference, 3D and display each run at their own rate
+        governor = governor_from_args(args)
+        pipeline = build_pose_pipeline(
+            visualizer, display, recorder,
+            PipelineSettings(governor=governor, extrapolate=args.extrapolate,
+                             keyframe_interval=args.keyframe_interval,
+                             motion_gate=args.motion_gate,
+                             reference_library=library_from_args(args),
+                             heatmap=args.heatmap, coach=coach,
+                             swing_index=index_from_args(args), session_store=store))
         
-        while True:
-            # Process frame
-            frame, results = process_frame(camera, visualizer)
-            if frame is None:
+        for ctx in pipeline.run(governor.throttle(camera), mode=args.pipeline_mode):
+            if not governor.due('display', ctx.timestamp):
                 continue
-            
-            # Create visualizations
-            frame_2d = frame.copy()
-            if results.pose_landmarks:
-                frame_2d = visualizer.draw_2d_pose(frame_2d, results)
-            frame_3d = visualizer.visualize_3d_pose(results)
-            
-            # Create four-quadrant layout with pose detection
-            recording_time = recorder.get_recording_time() if recorder.is_recording else None
-            combined_frame = display.create_quadrant_layout(
-                frame_2d, frame_3d, results, recording_time)
-            
-            # Calculate FPS
-            fps_counter += 1
-            if (time.time() - fps_start_time) > fps_update_interval:
-                fps = fps_counter / (time.time() - fps_start_time)
-                fps_counter = 0
-                fps_start_time = time.time()
-            
-            # Add overlays
-            lighting_info = get_lighting_info(frame)
-            view_info = visualizer.current_view if hasattr(visualizer, 'current_view') else None
-            display.add_overlays(combined_frame, fps, lighting_info, view_info)
-            
-            # Handle recording
-            if recorder.is_recording:
-                recorder.write_frame(combined_frame)
+            combined_frame = ctx['combined']
             
             # Show frame
-            display.show_frame(combined_frame)
+            with span("display"):
+                display.show_frame(combined_frame)
             
             # Handle keyboard input
-            key = cv2.waitKey(1) & 0xFF
+            with span("wait_key"):
+                key = cv2.waitKey(1) & 0xFF
             if handle_keys(key, visualizer, recorder, camera, combined_frame):
                 break
                 
@@ -196,7 +143,7 @@ def main():
         import traceback
         traceback.print_exc()
     finally:
-        cleanup(camera, visualizer, recorder, display)
+        cleanup(camera, visualizer, recorder, display, coach, store)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,19 +1,197 @@
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QPushButton, QLabel, QFrame)
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QImage, QPixmap, QFont
+from PyQt5.QtCore import Qt, QTimer, QThread, QRect, pyqtSignal
+from PyQt5.QtGui import QImage, QFont, QPainter, QColor
 import sys
+import argparse
+import queue
+import threading
 import cv2
-import numpy as np
 
 # Import your existing components
 from utils.pose_visualizer import PoseVisualizer
 from utils.video_recorder import VideoRecorder
 from utils.display_manager import DisplayManager
+from utils.tracing import span, traced, enable_tracing
+from utils.frame_source import open_source, add_source_arguments, source_from_args
+from utils.pose_pipeline import build_pose_pipeline, PipelineSettings
+from utils.rate_governor import RateGovernor, add_rate_arguments, governor_from_args
+from utils.model_controller import add_model_arguments, controller_from_args
+from utils.reference import add_reference_arguments, library_from_args
+from utils.coach_feedback import add_coach_arguments, coach_from_args
+from utils.swing_index import add_index_arguments, index_from_args
+from utils.session_store import add_store_arguments, store_from_args
+from utils.pipeline import FpsMeter
+
+class PipelineWorker(QThread):
+    """Runs capture and the pose pipeline off the GUI thread.
+
+    Finished frames are handed over through a single-slot mailbox: the
+    worker overwrites the latest frame and only emits ``frame_ready`` when
+    the GUI has consumed the previous one, so a slow paint never builds a
+    backlog of queued signals. Commands touching objects the pipeline uses
+    (recorder, camera, trajectory) are queued with ``submit`` and run on
+    the worker between frames.
+    """
+    frame_ready = pyqtSignal()
+    stream_ended = pyqtSignal()
+
+    def __init__(self, pipeline, source, display_manager=None, governor=None, parent=None):
+        super().__init__(parent)
+        self.pipeline = pipeline
+        self.source = source
+        self.display_manager = display_manager
+        self.governor = governor
+        self._running = False
+        self._lock = threading.Lock()
+        self._latest = None
+        self._pending = False
+        self._requested_size = None
+        self._commands = queue.Queue()
+
+    def run(self):
+        self._running = True
+        self._run_commands()
+        packets = self.source if self.governor is None else self.governor.throttle(self.source)
+        frames = self.pipeline.run(packets)
+        try:
+            for ctx in frames:
+                if not self._running:
+                    break
+                if self.governor is None or self.governor.due('display', ctx.timestamp):
+                    self._publish(ctx['combined'])
+                self._apply_requested_size()
+                self._run_commands()
+        except Exception as e:
+            print(f"Pipeline error: {str(e)}")
+        finally:
+            frames.close()
+        if self._running:
+            self.stream_ended.emit()
+
+    def _publish(self, frame):
+        with self._lock:
+            self._latest = frame
+            notify = not self._pending
+            self._pending = True
+        if notify:
+            self.frame_ready.emit()  # Queued across threads to the GUI
+
+    def request_size(self, width, height):
+        """Ask for composites of this size from the next frame on (GUI thread)"""
+        self._requested_size = (width, height)
+
+    def _apply_requested_size(self):
+        # Applied between frames so a layout never sees a half-changed size
+        size = self._requested_size
+        if size is None or self.display_manager is None:
+            return
+        self._requested_size = None
+        if size != (self.display_manager.window_width, self.display_manager.window_height):
+            self.display_manager.set_size(*size)
+
+    def submit(self, command):
+        """Run ``command()`` on the worker between frames (GUI thread).
+        Before the worker starts or after it stops, nothing else is using
+        the pipeline, so the command runs at once."""
+        if self.isRunning():
+            self._commands.put(command)
+        else:
+            command()
+
+    def _run_commands(self):
+        while True:
+            try:
+                command = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            command()
+
+    def take_latest(self):
+        """Return the newest finished frame (GUI thread)"""
+        with self._lock:
+            frame = self._latest
+            self._pending = False
+        return frame
+
+    def stop(self):
+        self._running = False
+        self.wait(2000)
+
+class FrameView(QWidget):
+    """Paints BGR NumPy frames directly, without pixmap round-trips.
+
+    ``set_frame`` wraps the array as a ``QImage.Format_BGR888`` view (no
+    copy, no colour conversion) and keeps the array referenced until the
+    next frame replaces it. When the composite already matches the widget
+    size it is blitted 1:1; otherwise it is scaled while painting, with
+    ``smooth`` choosing bilinear over nearest-neighbour.
+    """
+    size_changed = pyqtSignal(int, int)
+
+    def __init__(self, smooth=False, parent=None):
+        super().__init__(parent)
+        self.smooth = smooth
+        self._frame = None
+        self._image = None
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+    def set_frame(self, frame):
+        if not frame.flags['C_CONTIGUOUS']:
+            frame = frame.copy()
+        h, w = frame.shape[:2]
+        self._frame = frame  # Keep the buffer alive while Qt refers to it
+        self._image = QImage(frame.data, w, h, frame.strides[0], QImage.Format_BGR888)
+        self.update()
+
+    def target_size(self):
+        """Composite size that fills the widget in device pixels"""
+        ratio = self.devicePixelRatioF()
+        return int(self.width() * ratio) & ~1, int(self.height() * ratio) & ~1
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.size_changed.emit(*self.target_size())
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(0, 0, 0))
+        if self._image is not None:
+            img_w, img_h = self._image.width(), self._image.height()
+            scale = min(self.width() / img_w, self.height() / img_h)
+            w, h = int(img_w * scale), int(img_h * scale)
+            target = QRect((self.width() - w) // 2, (self.height() - h) // 2, w, h)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, self.smooth)
+            painter.drawImage(target, self._image)
+        painter.end()
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, source=None, smooth_scaling=False, governor=None, extrapolate=False,
+                 model_complexity=0, model_controller=None, keyframe_interval=None,
+                 motion_gate=False, reference_library=None, heatmap=False, coach=None,
+                 swing_index=None, session_store=None, confidences=(0.7, 0.7)):
         super().__init__()
+        # Frame source (camera, file, images or synthetic); camera 0 by default
+        self.source = source
+        self.smooth_scaling = smooth_scaling
+        # Independent capture / inference / 3D / display rates
+        self.governor = governor or RateGovernor()
+        self.extrapolate = extrapolate
+        self.keyframe_interval = keyframe_interval
+        self.motion_gate = motion_gate
+        # Fixed complexity, or a controller adapting it to a latency budget
+        self.model_complexity = model_complexity
+        self.model_controller = model_controller
+        self.confidences = confidences    # (min detection, min tracking) confidence
+        # Expert swings each finished swing is compared with
+        self.reference_library = reference_library
+        self.heatmap = heatmap            # Overlay the hands/feet heatmap
+        # Asynchronous feedback for the Coach Chat panel
+        self.coach = coach
+        # Archive of recorded swings for similar-swing search
+        self.swing_index = swing_index
+        # Columnar landmark / feature log of every recording
+        self.session_store = session_store
         self.setWindowTitle("Sports Analysis System")
         self.setup_ui()
         self.setup_components()
@@ -36,10 +214,9 @@ class MainWindow(QMainWindow):
         display_layout = QHBoxLayout(display_widget)
 
         # Create frame display with 50% larger size
-        self.frame_label = QLabel()
-        self.frame_label.setMinimumSize(2160, 1215)  # 1440*1.5, 810*1.5
-        self.frame_label.setAlignment(Qt.AlignCenter)
-        display_layout.addWidget(self.frame_label)
+        self.frame_view = FrameView(smooth=self.smooth_scaling)
+        self.frame_view.setMinimumSize(2160, 1215)  # 1440*1.5, 810*1.5
+        display_layout.addWidget(self.frame_view)
 
         # Create control panel
         control_panel = QWidget()
@@ -61,6 +238,14 @@ class MainWindow(QMainWindow):
         control_layout.addWidget(self.reset_button)
         control_layout.addWidget(self.quit_button)
 
+        # Separate rates for the worker pipeline and for GUI painting
+        self.pipeline_fps_label = QLabel("Pipeline: -- FPS")
+        self.paint_fps_label = QLabel("Paint: -- FPS")
+        for label in [self.pipeline_fps_label, self.paint_fps_label]:
+            label.setFont(QFont('Arial', 28, QFont.Bold))
+            label.setStyleSheet("color: #00ff00; padding: 10px;")
+            control_layout.addWidget(label)
+
         # Add display and controls to left container
         left_layout.addWidget(display_widget)
         left_layout.addWidget(control_panel)
@@ -142,116 +327,97 @@ class MainWindow(QMainWindow):
 
     def setup_components(self):
         # Initialize your existing components
-        self.camera = cv2.VideoCapture(0)
-        self.visualizer = PoseVisualizer()
+        self.camera = self.source if self.source is not None else open_source()
+        self.visualizer = PoseVisualizer(model_complexity=self.model_complexity,
+                                         min_detection_confidence=self.confidences[0],
+                                         min_tracking_confidence=self.confidences[1],
+                                         model_controller=self.model_controller)
         self.recorder = VideoRecorder()
         self.display_manager = DisplayManager()
-        
-        # FPS calculation
-        self.fps_start_time = cv2.getTickCount()
-        self.fps_counter = 0
+        self.pipeline = build_pose_pipeline(
+            self.visualizer, self.display_manager, self.recorder,
+            PipelineSettings(governor=self.governor, extrapolate=self.extrapolate,
+                             keyframe_interval=self.keyframe_interval,
+                             motion_gate=self.motion_gate,
+                             reference_library=self.reference_library,
+                             heatmap=self.heatmap, coach=self.coach,
+                             swing_index=self.swing_index,
+                             session_store=self.session_store))
         self.fps = 0
+        self.recording = False
 
     def setup_timer(self):
-        # Create timer for frame updates
+        # Capture and inference run in the worker; the GUI thread only paints
+        self.paint_fps_meter = FpsMeter()
+        self.worker = PipelineWorker(self.pipeline, self.camera, self.display_manager, self.governor)
+        self.worker.frame_ready.connect(self.update_frame)
+        # Render composites at the size they are shown at
+        self.frame_view.size_changed.connect(self.worker.request_size)
+        self.worker.request_size(*self.frame_view.target_size())
+        self.worker.stream_ended.connect(self.on_stream_ended)
+        self.worker.start()
+
+        # Refresh the FPS counters twice a second
         self.timer = QTimer()
-        self.timer.timeout.connect(self.update_frame)
-        self.timer.start(30)  # 30ms = ~33fps
+        self.timer.timeout.connect(self.update_fps_labels)
+        self.timer.start(500)
 
+    @traced("paint")
     def update_frame(self):
-        # Process frame (similar to your main loop)
-        ret, frame = self.camera.read()
-        if not ret:
+        combined_frame = self.worker.take_latest()
+        if combined_frame is None:
             return
+        self.paint_fps_meter.tick()
+
+        with span("display"):
+            self.frame_view.set_frame(combined_frame)
+
+    def update_fps_labels(self):
+        self.fps = self.pipeline.fps
+        self.pipeline_fps_label.setText(f"Pipeline: {self.fps:.0f} FPS")
+        self.paint_fps_label.setText(f"Paint: {self.paint_fps_meter.fps:.0f} FPS")
 
-        # Process frame using your existing code
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.visualizer.process_frame(frame_rgb)
-
-        # Create visualizations
-        frame_2d = frame.copy()  # Keep BGR format for 2D view
-        if results.pose_landmarks:
-            frame_2d = self.visualizer.draw_2d_pose(frame_2d, results)
-        frame_3d = self.visualizer.visualize_3d_pose(results)
-
-        # Get recording time if recording
-        recording_time = self.recorder.get_recording_time() if self.recorder.is_recording else None
-
-        # Create layout using display manager
-        combined_frame = self.display_manager.create_quadrant_layout(
-            frame_2d, frame_3d, results, recording_time)
-
-        # Convert BGR to RGB for Qt display
-        combined_frame_rgb = cv2.cvtColor(combined_frame, cv2.COLOR_BGR2RGB)
-
-        # Calculate FPS
-        self.fps_counter += 1
-        if self.fps_counter % 30 == 0:
-            current_time = cv2.getTickCount()
-            self.fps = 30 / ((current_time - self.fps_start_time) / cv2.getTickFrequency())
-            self.fps_start_time = current_time
-
-        # Add overlays
-        lighting_info = self.get_lighting_info(frame)
-        view_info = self.visualizer.current_view if hasattr(self.visualizer, 'current_view') else None
-        self.display_manager.add_overlays(combined_frame, self.fps, lighting_info, view_info)
-
-        # Handle recording
-        if self.recorder.is_recording:
-            self.recorder.write_frame(combined_frame)
-
-        # Convert frame to Qt format and display
-        h, w, ch = combined_frame_rgb.shape
-        bytes_per_line = ch * w
-        qt_image = QImage(combined_frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        scaled_pixmap = QPixmap.fromImage(qt_image).scaled(
-            self.frame_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        self.frame_label.setPixmap(scaled_pixmap)
+    def on_stream_ended(self):
+        print("Frame source finished")
 
     def toggle_recording(self):
-        if not self.recorder.is_recording:
-            self.recorder.start_recording(
-                (self.display_manager.window_height, self.display_manager.window_width),
-                self.camera.get(cv2.CAP_PROP_FPS)
-            )
-            self.record_button.setText("Stop Recording")
-        else:
-            self.recorder.stop_recording()
-            self.record_button.setText("Record (V)")
+        # The record stage writes on the worker; start and stop between frames
+        self.recording = not self.recording
+        self.worker.submit(self._start_recording if self.recording
+                           else self.recorder.stop_recording)
+        self.record_button.setText("Stop Recording" if self.recording else "Record (V)")
+
+    def _start_recording(self):
+        # Worker thread
+        self.recorder.start_recording(
+            (self.display_manager.window_height, self.display_manager.window_width),
+            self.camera.get(cv2.CAP_PROP_FPS)
+        )
 
     def reset_camera(self):
-        self.camera.release()
-        self.camera = cv2.VideoCapture(0)
+        self.worker.submit(self.camera.reset)
+        if not self.worker.isRunning():
+            # File sources end; restart the worker after rewinding
+            self.worker.start()
 
-    def get_lighting_info(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        brightness = np.mean(gray)
-        contrast = np.std(gray)
-        
-        status = "Lighting: "
-        if brightness < 50:
-            status += "Too Dark"
-            color = (0, 0, 255)
-        elif brightness > 200:
-            status += "Too Bright"
-            color = (0, 0, 255)
-        else:
-            status += "Good"
-            color = (0, 255, 0)
-            
-        return {
-            'status': status,
-            'color': color,
-            'contrast_warning': contrast < 20
-        }
+    def clear_overlays(self):
+        def clear():
+            self.visualizer.trajectory.clear()
+            self.visualizer.heatmap.clear()
+        self.worker.submit(clear)
 
     def closeEvent(self, event):
         # Cleanup when closing
         self.timer.stop()
+        self.worker.stop()
         self.camera.release()
         self.visualizer.cleanup()
         self.recorder.cleanup()
         self.display_manager.cleanup()
+        if self.coach is not None:
+            self.coach.cleanup()
+        if self.session_store is not None:
+            self.session_store.cleanup()
         event.accept()
 
     def keyPressEvent(self, event):
@@ -273,12 +439,48 @@ class MainWindow(QMainWindow):
             self.toggle_recording()
         elif event.key() == Qt.Key_R:  # Reset camera
             self.reset_camera()
+        elif event.key() == Qt.Key_C:  # Clear trajectory and heatmap
+            self.clear_overlays()
         elif event.key() == Qt.Key_Q:  # Quit
             self.close()
 
+def parse_args():
+    """Parse our options, leaving Qt's own arguments untouched"""
+    parser = argparse.ArgumentParser(description="Sports Analysis System")
+    add_source_arguments(parser)
+    add_rate_arguments(parser)
+    add_model_arguments(parser)
+    add_reference_arguments(parser)
+    add_coach_arguments(parser)
+    add_index_arguments(parser)
+    add_store_arguments(parser)
+    parser.add_argument('--smooth-scaling', action='store_true',
+                        help="bilinear instead of nearest-neighbour scaling when the frame "
+                             "does not match the window size")
+    parser.add_argument('--heatmap', action='store_true',
+                        help="overlay a decaying heatmap of where the hands and feet spent time")
+    parser.add_argument('--trace', metavar='PATH',
+                        help="record per-stage spans and write a Chrome trace to PATH on exit")
+    return parser.parse_known_args()
+
 def main():
-    app = QApplication(sys.argv)
-    window = MainWindow()
+    args, qt_args = parse_args()
+    if args.trace:
+        enable_tracing(args.trace)
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = MainWindow(source_from_args(args), smooth_scaling=args.smooth_scaling,
+                        governor=governor_from_args(args), extrapolate=args.extrapolate,
+                        model_complexity=args.model_complexity,
+                        model_controller=controller_from_args(args),
+                        confidences=(args.min_detection_confidence,
+                                     args.min_tracking_confidence),
+                        keyframe_interval=args.keyframe_interval,
+                        motion_gate=args.motion_gate,
+                        reference_library=library_from_args(args),
+                        heatmap=args.heatmap, coach=coach_from_args(args),
+                        swing_index=index_from_args(args),
+                        session_store=store_from_args(args))
     window.show()
     sys.exit(app.exec_())
 
@@ -8,92 +8,106 @@ from utils.pose_visualizer import PoseVisualizer
 from utils.video_recorder import VideoRecorder
 from utils.display_manager import DisplayManager
 from mediapipe.python.solutions import pose as mp_pose
+from utils.model_controller import ModelController
+from utils.metrics import METRICS, start_metrics_server
+from utils.tracing import span
+from utils.pose_pipeline import build_pose_pipeline, encode_jpeg, PipelineSettings
 import time
 
+# Per-stage latency histograms (the pipeline stages record their own)
+DECODE_LATENCY = METRICS.stage('decode')
+SEND_LATENCY = METRICS.stage('send')
+FRAME_LATENCY = METRICS.stage('total')
+FRAMES_PROCESSED = METRICS.counter('frames_processed_total')
+FRAMES_WITH_POSE = METRICS.counter('frames_with_pose_total')
+FRAME_ERRORS = METRICS.counter('frame_errors_total')
+CONNECTIONS_TOTAL = METRICS.counter('connections_total')
+ACTIVE_CONNECTIONS = METRICS.gauge('active_connections')
+
+JPEG_QUALITY = 50
+LATENCY_BUDGET_MS = 25.0
+# Client frames are small, so never infer above 480px wide
+SERVER_LEVELS = ((0, 256), (0, 320), (1, 320), (1, 480))
+
+def decode_frame(frame_data):
+    """Decode a base64 JPEG message into a BGR frame (None on failure)"""
+    jpg_bytes = base64.b64decode(frame_data)
+    return cv2.imdecode(np.frombuffer(jpg_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def encode_frame(frame, quality=JPEG_QUALITY):
+    """Encode a BGR frame as JPEG bytes for the client"""
+    return encode_jpeg(frame, quality)
+
 class PoseAnalysisServer:
-    def __init__(self):
+    def __init__(self, latency_budget_ms=LATENCY_BUDGET_MS):
         self.mp_pose = mp_pose
-        self.visualizer = PoseVisualizer()
+        # Lighter detection thresholds; with a budget the controller picks
+        # complexity and inference size
+        controller = None
+        if latency_budget_ms:
+            controller = ModelController(latency_budget_ms, levels=SERVER_LEVELS,
+                                         min_detection_confidence=0.5,
+                                         min_tracking_confidence=0.5)
+        self.visualizer = PoseVisualizer(model_complexity=0,
+                                         min_detection_confidence=0.5,
+                                         min_tracking_confidence=0.5,
+                                         model_controller=controller)
         self.recorder = VideoRecorder()
         self.display_manager = DisplayManager(window_width=1280, window_height=720)  # Adjusted for web display
-        self.fps = 0
-        self.fps_counter = 0
-        self.fps_start_time = cv2.getTickCount()
-        self.last_3d_update = time.time()
-        self.cached_3d = None
         
-        # Configure visualizer's pose detector with lighter settings
-        self.visualizer.pose = self.mp_pose.Pose(
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5,
-            model_complexity=0
-        )
+        # Small display frames, no enhancement or 3D view, JPEG output for the client
+        self.pipeline = build_pose_pipeline(
+            self.visualizer, self.display_manager,
+            settings=PipelineSettings(size=(320, 240), inference_size=(320, 320),
+                                      enhance=False, render_3d=False, overlays=False,
+                                      record=False, jpeg_quality=JPEG_QUALITY))
         
     async def process_frame(self, frame_data):
         try:
-            # Decode frame
-            jpg_bytes = base64.b64decode(frame_data)
-            frame = cv2.imdecode(np.frombuffer(jpg_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+            frame_start = time.perf_counter_ns()
+
+            # Decode frame (server.py hands over already decoded frames)
+            if isinstance(frame_data, np.ndarray):
+                frame = frame_data
+            else:
+                with span("decode"), DECODE_LATENCY.time():
+                    frame = decode_frame(frame_data)
             if frame is None:
+                FRAME_ERRORS.inc()
                 return {'error': 'Failed to decode frame'}
             
-            frame = cv2.resize(frame, (320, 240))
-            
-            # Process frame
-            results = self.visualizer.process_frame(frame)
-            
-            # Create output
-            combined_frame = self.display_manager.create_quadrant_layout(
-                self.visualizer.draw_2d_pose(frame, results),
-                self.cached_3d if self.cached_3d is not None else np.zeros((240,320,3), np.uint8),
-                results
-            )
+            ctx = self.pipeline.process_frame(frame)
             
             # Ensure valid image output
-            if combined_frame.size == 0:
+            if ctx['combined'].size == 0:
+                FRAME_ERRORS.inc()
                 return {'error': 'Empty frame generated'}
-            
-            _, buffer = cv2.imencode('.jpg', combined_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 50])
+            FRAME_LATENCY.record_since(frame_start)
+
+            has_pose = ctx['results'].pose_landmarks is not None
+            FRAMES_PROCESSED.inc()
+            if has_pose:
+                FRAMES_WITH_POSE.inc()
             return {
-                'processed_frame': buffer.tobytes(),
-                'has_pose': results.pose_landmarks is not None
+                'processed_frame': ctx['jpeg'],
+                'has_pose': has_pose
             }
         except Exception as e:
-            print(f"Processing error: {str(e)}")
+            FRAME_ERRORS.inc()
             return {'error': str(e)}
 
-    def get_lighting_info(self, frame):
-        """Analyze lighting conditions"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        brightness = np.mean(gray)
-        contrast = np.std(gray)
-        
-        status = "Lighting: "
-        if brightness < 50:
-            status += "Too Dark"
-            color = (0, 0, 255)
-        elif brightness > 200:
-            status += "Too Bright"
-            color = (0, 0, 255)
-        else:
-            status += "Good"
-            color = (0, 255, 0)
-            
-        return {
-            'status': status,
-            'color': color,
-            'contrast_warning': contrast < 20
-        }
-
 async def handler(websocket, path):
     server = PoseAnalysisServer()
+    CONNECTIONS_TOTAL.inc()
+    ACTIVE_CONNECTIONS.inc()
     try:
         async for message in websocket:
             try:
                 data = json.loads(message)
                 if 'frame' in data:
                     result = await server.process_frame(data['frame'])
-                    await websocket.send(json.dumps(result))
+                    with span("send"), SEND_LATENCY.time():
+                        await websocket.send(json.dumps(result))
                 elif 'command' in data:
                     # Handle commands (like view adjustments)
                     if data['command'] == 'adjust_view':
@@ -106,9 +120,11 @@ async def handler(websocket, path):
     except websockets.exceptions.ConnectionClosed:
         print("Client disconnected")
     finally:
+        ACTIVE_CONNECTIONS.dec()
         server.visualizer.cleanup()
 
 async def main():
+    start_metrics_server()
     server = await websockets.serve(handler, "localhost", 8765)
     print("Running pose analysis server on ws://localhost:8765")
     await server.wait_closed()
@@ -0,0 +1,209 @@
+import os
+
+# Headless: the 3D view is never shown offline
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import argparse
+
+import cv2
+import numpy as np
+
+from utils.activity import ActivityScanner
+from utils.features import compute_features
+from utils.heatmap import render_heatmap, session_heatmap
+from utils.offline import analyze_video, analyze_video_cached, find_videos, summarize
+from utils.pose_visualizer import PoseVisualizer
+from utils.reference import ReferenceLibrary
+from utils.reps import count_reps, tempo
+from utils.result_cache import (add_cache_arguments, cache_from_args, code_version,
+                                events_from_arrays, events_to_arrays)
+from utils.session_store import SessionStore, feature_columns
+from utils.swing_index import SwingIndex
+from utils.swing_phases import segment_phases, split_swings
+
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Offline pose analysis of recorded sessions")
+    parser.add_argument('paths', nargs='+',
+                        help="video files or directories (searched recursively)")
+    parser.add_argument('--no-trim', action='store_true',
+                        help="run pose inference on every frame instead of active ranges only")
+    parser.add_argument('--padding', type=float, default=1.0,
+                        help="seconds kept before and after each active range (default 1.0)")
+    parser.add_argument('--sample-hz', type=float, default=10.0,
+                        help="motion-energy sampling rate of the scan (default 10)")
+    parser.add_argument('--no-person-check', action='store_true',
+                        help="trim on motion alone, without the MediaPipe person check")
+    parser.add_argument('--model-complexity', type=int, choices=(0, 1, 2), default=1,
+                        help="MediaPipe model complexity (default 1)")
+    parser.add_argument('--library', metavar='DIR',
+                        help="compare each swing with the expert swings in DIR")
+    parser.add_argument('--add-references', action='store_true',
+                        help="add the swings to the --library instead of comparing them")
+    parser.add_argument('--swing-index', metavar='DIR',
+                        help="show the most similar swings archived in DIR, then add each swing")
+    parser.add_argument('--build-ivf', action='store_true',
+                        help="(re)train the --swing-index IVF/PQ index for fast approximate "
+                             "search after adding the swings")
+    parser.add_argument('--session-store', metavar='DIR',
+                        help="store each video's landmarks, features and swing phases as a "
+                             "session in DIR, dated by the file's modification time")
+    add_cache_arguments(parser)
+    parser.add_argument('--rep-joint', default='knee',
+                        help="angle the rep counter follows: a joint pair such as 'knee' or "
+                             "'elbow', or one angle such as 'right_elbow' (default knee)")
+    parser.add_argument('--output', metavar='DIR',
+                        help="write <video>.npz with frame indices, landmarks, swing phases and "
+                             "the hands/feet heatmap, plus <video>_heatmap.png, to DIR")
+    return parser.parse_args()
+
+
+def swing_events(analysis, cache=None, key=None):
+    """Re-segment the recorded landmarks into swing phases; returns the
+    features and the events. With a ``cache``, both are reused from the
+    run that produced the landmarks cached under ``key``."""
+    if not analysis.processed_frames:
+        return None, []
+    if cache is None:
+        features = compute_features(analysis.world_landmarks, analysis.timestamps)
+        return features, segment_phases(features)
+    key = cache.key('features', key, code_version('utils.features'))
+    features = cache.fetch(key, lambda: compute_features(analysis.world_landmarks,
+                                                         analysis.timestamps))
+    key = cache.key('segments', key, code_version('utils.swing_phases'))
+    events = cache.fetch(key, lambda: events_to_arrays(segment_phases(features)))
+    return features, events_from_arrays(events)
+
+
+def use_library(library, analysis, features, events, add):
+    """Add the video's swings to the library, or compare them with it"""
+    name = os.path.splitext(os.path.basename(analysis.path))[0]
+    for number, swing in enumerate(split_swings(events)):
+        if add:
+            library.add(f"{name}#{number}", features['angles'], features['timestamp'], swing,
+                        video=analysis.path)
+            continue
+        comparison = library.compare(features['angles'], features['timestamp'], swing)
+        if comparison is None:
+            continue
+        worst = ", ".join(f"{joint} {value:+.0f} ({phase})"
+                          for phase, joint, value in comparison.worst())
+        print(f"  swing {number} at {swing[0].timestamp:.1f}s: closest "
+              f"{comparison.reference['name']} (distance {comparison.distance:.4f}); {worst}")
+
+
+def use_index(index, analysis, features, events, k=3):
+    """Print the swings most similar to each of the video's, then archive them"""
+    name = os.path.splitext(os.path.basename(analysis.path))[0]
+    for number, swing in enumerate(split_swings(events)):
+        similar = index.similar(features['angles'], features['timestamp'], swing, k)
+        if similar:
+            print(f"  swing {number} at {swing[0].timestamp:.1f}s: similar to " +
+                  ", ".join(f"{entry['name']} ({distance:.0f} deg)" for entry, distance in similar))
+        index.add(f"{name}#{number}", features['angles'], features['timestamp'], swing,
+                  video=analysis.path)
+
+
+def store_session(store, analysis, features, events):
+    """Write the video's landmarks, features and phases as one session"""
+    name = os.path.splitext(os.path.basename(analysis.path))[0]
+    writer = store.create(name, video=analysis.path, start=os.path.getmtime(analysis.path))
+    writer.extend(dict(feature_columns(features), timestamp=analysis.timestamps,
+                       landmarks=analysis.landmarks, world_landmarks=analysis.world_landmarks))
+    for event in events:
+        writer.add_event(event.phase, event.timestamp, hand=event.hand)
+    writer.close()
+    return writer.path
+
+
+def save_analysis(analysis, output_dir, events=(), reps=()):
+    os.makedirs(output_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(analysis.path))[0]
+    path = os.path.join(output_dir, f"{name}.npz")
+    ranges = np.asarray(analysis.scan.ranges if analysis.scan is not None else [], np.int64)
+    heatmap = session_heatmap(analysis.landmarks, analysis.timestamps)
+    np.savez_compressed(path, fps=analysis.fps, frame_indices=analysis.frame_indices,
+                        landmarks=analysis.landmarks, world_landmarks=analysis.world_landmarks,
+                        ranges=ranges.reshape(-1, 2),
+                        phase_names=np.asarray([e.phase for e in events], dtype=str),
+                        phase_times=np.asarray([e.timestamp for e in events], np.float64),
+                        heatmap=heatmap,
+                        rep_times=np.asarray([(r['start'], r['end']) for r in reps],
+                                             np.float64).reshape(-1, 2),
+                        rep_rom=np.asarray([r['rom'] for r in reps], np.float64))
+    image = render_heatmap(heatmap)
+    if image is not None:
+        colour = cv2.resize(image[0], (640, 640 * heatmap.shape[0] // heatmap.shape[1]))
+        cv2.imwrite(os.path.join(output_dir, f"{name}_heatmap.png"), colour)
+    return path
+
+
+def main():
+    args = parse_args()
+    videos = find_videos(args.paths)
+    if not videos:
+        print("No videos found")
+        return
+
+    scanner = ActivityScanner(sample_hz=args.sample_hz, padding=args.padding,
+                              detect_people=not args.no_person_check)
+    visualizer = PoseVisualizer(model_complexity=args.model_complexity)
+    library = ReferenceLibrary(args.library) if args.library else None
+    index = SwingIndex(args.swing_index) if args.swing_index else None
+    store = SessionStore(args.session_store) if args.session_store else None
+    cache = cache_from_args(args)
+    analyses = []
+    try:
+        for path in videos:
+            key = None
+            if cache is not None:
+                analysis, key = analyze_video_cached(cache, path, visualizer, scanner,
+                                                     trim=not args.no_trim)
+            else:
+                analysis = analyze_video(path, visualizer, scanner, trim=not args.no_trim)
+            analyses.append(analysis)
+            line = f"{path}: {analysis.processed_frames}/{analysis.frame_count} frames"
+            if analysis.scan is not None:
+                spans = ", ".join(f"{a:.1f}-{b:.1f}s" for a, b in analysis.scan.time_ranges())
+                line += (f", skipped {analysis.scan.skipped_fraction:.0%}"
+                         f", scan {analysis.scan.scan_seconds:.1f}s, active [{spans}]")
+            features, events = swing_events(analysis, cache, key)
+            impacts = [e.timestamp for e in events if e.phase == 'impact']
+            if impacts:
+                line += f", {len(impacts)} swings (impact at " + \
+                    ", ".join(f"{t:.1f}s" for t in impacts) + ")"
+            reps = count_reps(features, joint=args.rep_joint) if features is not None else []
+            if reps:
+                line += f", {len(reps)} reps (tempo " + ", ".join(tempo(r) for r in reps[:5]) + \
+                    (", ..." if len(reps) > 5 else "") + \
+                    f"; mean ROM {np.mean([r['rom'] for r in reps]):.0f} deg)"
+            print(line)
+            if library is not None and features is not None:
+                use_library(library, analysis, features, events, args.add_references)
+            if index is not None and features is not None:
+                use_index(index, analysis, features, events)
+            if store is not None and analysis.processed_frames:
+                print(f"  stored session {store_session(store, analysis, features, events)}")
+            if args.output:
+                print(f"  saved {save_analysis(analysis, args.output, events, reps)}")
+    finally:
+        scanner.close()
+        visualizer.cleanup()
+        if library is not None and args.add_references:
+            library.save()
+            print(f"Reference library {args.library}: {len(library)} swings")
+        if index is not None:
+            if args.build_ivf and len(index):
+                index.build_ivf()
+            print(f"Swing index {args.swing_index}: {len(index)} swings")
+
+    report = summarize(analyses)
+    print(f"\n{report['videos']} videos, {report['frames']} frames, "
+          f"{report['skipped_fraction']:.0%} skipped")
+    print(f"Scan {report['scan_seconds']:.1f}s, pose {report['process_seconds']:.1f}s, "
+          f"estimated time saved {report['time_saved_seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
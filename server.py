@@ -2,12 +2,19 @@ import asyncio
 import websockets
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 import threading
-from ming3 import PoseAnalysisServer  # Import the PoseAnalysisServer class
+from ming3 import (PoseAnalysisServer,  # Import the PoseAnalysisServer class
+                   CONNECTIONS_TOTAL, ACTIVE_CONNECTIONS, DECODE_LATENCY, SEND_LATENCY)
 import json
 import random
 import uvloop
 import cv2
 import numpy as np
+import time
+from utils.metrics import METRICS, start_metrics_server
+
+FRAMES_IN_FLIGHT = METRICS.gauge('queue_depth', queue='frames_in_flight')
+FRAMES_DROPPED = METRICS.counter('frames_dropped_total')
+MESSAGES_UNKNOWN = METRICS.counter('messages_unknown_total')
 
 # HTTP Server for static files
 def run_http_server():
@@ -27,18 +34,28 @@ def run_http_server():
 async def websocket_handler(websocket):
     server = PoseAnalysisServer()
     print("New client connected")
+    CONNECTIONS_TOTAL.inc()
+    ACTIVE_CONNECTIONS.inc()
     try:
         async for message in websocket:
             if isinstance(message, bytes):
                 # Directly process binary JPEG
-                frame = cv2.imdecode(np.frombuffer(message, np.uint8), cv2.IMREAD_COLOR)
-                result = await server.process_frame(frame)
-                print(f"Processed frame, has_pose: {result['has_pose']}")
+                FRAMES_IN_FLIGHT.inc()
+                try:
+                    decode_start = time.perf_counter_ns()
+                    frame = cv2.imdecode(np.frombuffer(message, np.uint8), cv2.IMREAD_COLOR)
+                    DECODE_LATENCY.record_since(decode_start)
+                    result = await server.process_frame(frame)
+                finally:
+                    FRAMES_IN_FLIGHT.dec()
+                send_start = time.perf_counter_ns()
                 await websocket.send(json.dumps(result))
+                SEND_LATENCY.record_since(send_start)
             elif message == "ping":
                 await websocket.send("pong")
                 continue
             elif random.random() < 0.3:  # Drop 30% of frames when busy
+                FRAMES_DROPPED.inc()
                 continue
             elif 'command' in message:
                 print(f"Received command: {message['command']}")
@@ -47,10 +64,11 @@ async def websocket_handler(websocket):
                 elif message['command'] == 'rotate_view':
                     server.visualizer.azim = (server.visualizer.azim + message.get('value', 0)) % 360
             else:
-                print(f"Unknown message format: {message}")
+                MESSAGES_UNKNOWN.inc()
     except websockets.exceptions.ConnectionClosed:
         print("Client disconnected")
     finally:
+        ACTIVE_CONNECTIONS.dec()
         server.visualizer.cleanup()
 
 # WebSocket Server
@@ -65,6 +83,9 @@ async def main():
     http_thread.daemon = True
     http_thread.start()
 
+    # Expose /metrics for Prometheus scrapes
+    start_metrics_server()
+
     # Run WebSocket server
     await websocket_server()
 
@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+
+from utils.activity import ActivityScanner
+
+
+def _write_clip(path, frames, fps=30.0):
+    height, width = frames[0].shape[:2]
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+
+def _noisy_frames(count, rng, moving=None):
+    """Static scene with strong sensor noise; ``moving`` frames get a
+    block sweeping across the image"""
+    background = np.full((120, 160, 3), 110, dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        frame = background.astype(np.int16) + rng.normal(scale=16, size=background.shape)
+        if moving is not None and moving[0] <= i < moving[1]:
+            x = 10 * (i - moving[0]) % 120
+            frame[30:90, x:x + 40] = 240
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
+
+
+def test_noisy_static_clip_has_no_active_ranges(tmp_path):
+    path = tmp_path / 'static.avi'
+    _write_clip(path, _noisy_frames(150, np.random.default_rng(0)))
+    scan = ActivityScanner(detect_people=False).scan(str(path))
+    assert np.percentile(scan.energy[1:], 5) > 0.01      # Noisier than the floor
+    assert scan.ranges == []
+
+
+def test_motion_on_a_noisy_clip_is_found(tmp_path):
+    path = tmp_path / 'motion.avi'
+    _write_clip(path, _noisy_frames(240, np.random.default_rng(1), moving=(90, 150)))
+    scan = ActivityScanner(detect_people=False).scan(str(path))
+    assert len(scan.ranges) == 1
+    start, end = scan.ranges[0]
+    assert start <= 90 and end >= 150
+    assert scan.active_frames < 150
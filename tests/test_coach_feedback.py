@@ -0,0 +1,98 @@
+import threading
+import time
+
+from utils.coach_feedback import CoachFeedback
+
+
+class _Backend:
+    """Records each call; blocks until ``release`` is set"""
+
+    def __init__(self, blocked=False):
+        self.calls = []
+        self.release = threading.Event()
+        if not blocked:
+            self.release.set()
+
+    def respond(self, prompt, issues, details):
+        self.calls.append(issues)
+        self.release.wait(5.0)
+        return f"answer {len(self.calls)}"
+
+
+def _wait(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_events_of_one_swing_are_coalesced_after_the_debounce():
+    backend = _Backend()
+    coach = CoachFeedback(backend, debounce=0.15)
+    try:
+        start = time.monotonic()
+        coach.submit('swing-1', [('backswing', 'left_elbow', 12.0)])
+        coach.submit('swing-1', [('backswing', 'left_elbow', -31.0),
+                                 ('impact', 'right_knee', 8.0)])
+        coach.submit('swing-1', details={'backswing': 0.8})
+        _wait(lambda: coach.snapshot()['messages'])
+        assert time.monotonic() - start >= 0.15
+        # One call, with the largest deviation per joint, largest first
+        assert backend.calls == [(('backswing', 'left_elbow', -30.0),
+                                  ('impact', 'right_knee', 10.0))]
+    finally:
+        coach.cleanup()
+
+
+def test_a_new_swing_sends_the_previous_one_at_once():
+    backend = _Backend()
+    coach = CoachFeedback(backend, debounce=10.0)
+    try:
+        coach.submit('swing-1', [('impact', 'left_hip', 20.0)])
+        coach.submit('swing-2', [('impact', 'left_hip', 40.0)])
+        _wait(lambda: backend.calls)
+        assert backend.calls == [(('impact', 'left_hip', 20.0),)]
+    finally:
+        coach.cleanup()
+
+
+def test_abandoned_calls_hold_their_slot_until_they_return():
+    backend = _Backend(blocked=True)
+    coach = CoachFeedback(backend, debounce=0.0, timeout=0.1, max_calls=1)
+    try:
+        coach.submit('swing-1', [('impact', 'left_hip', 20.0)])
+        _wait(lambda: backend.calls)
+        _wait(lambda: coach.snapshot()['status'] == "coach timed out")
+        # Past its deadline the call still occupies the only slot, and the
+        # newest waiting swing replaces the older one
+        coach.submit('swing-2', [('impact', 'left_hip', 40.0)])
+        coach.submit('swing-3', [('impact', 'left_hip', 60.0)])
+        time.sleep(0.2)
+        assert len(backend.calls) == 1
+        backend.release.set()
+        _wait(lambda: len(backend.calls) == 2)
+        assert backend.calls[1] == (('impact', 'left_hip', 60.0),)
+        _wait(lambda: coach.snapshot()['messages'])
+        # The abandoned call's answer is dropped
+        assert [m['key'] for m in coach.snapshot()['messages']] == ['swing-3']
+    finally:
+        backend.release.set()
+        coach.cleanup()
+
+
+def test_equal_quantized_signatures_hit_the_cache():
+    backend = _Backend()
+    coach = CoachFeedback(backend, debounce=0.0, step=5.0)
+    assert coach.signature({('impact', 'left_hip'): 21.0}, {'backswing': 0.74}) == \
+        coach.signature({('impact', 'left_hip'): 19.0}, {'backswing': 0.6})
+    try:
+        coach.submit('swing-1', [('impact', 'left_hip', 21.0)], {'backswing': 0.74})
+        _wait(lambda: coach.snapshot()['messages'])
+        coach.submit('swing-2', [('impact', 'left_hip', 19.0)], {'backswing': 0.6})
+        _wait(lambda: len(coach.snapshot()['messages']) == 2)
+        messages = coach.snapshot()['messages']
+        assert len(backend.calls) == 1
+        assert [m['cached'] for m in messages] == [False, True]
+        assert messages[0]['text'] == messages[1]['text']
+    finally:
+        coach.cleanup()
@@ -0,0 +1,43 @@
+import numpy as np
+
+from utils.features import FeatureEngine, compute_features
+
+
+def _turning_sequence(count=90, seed=0):
+    """World landmarks whose shoulders turn through 180 degrees against
+    the hips, sampled at irregular times with one repeated timestamp"""
+    rng = np.random.default_rng(seed)
+    world = rng.normal(scale=0.3, size=(count, 33, 3)).astype(np.float32)
+    theta = np.radians(np.linspace(150, 210, count))
+    world[:, 23], world[:, 24] = [-0.1, 0, 0], [0.1, 0, 0]
+    world[:, 11] = np.stack([-0.2 * np.cos(theta), np.zeros(count), -0.2 * np.sin(theta)], 1)
+    world[:, 12] = -world[:, 11]
+    timestamps = np.cumsum(rng.uniform(0.02, 0.05, count))
+    timestamps[40] = timestamps[39]
+    return world, timestamps
+
+
+def test_streaming_matches_bulk():
+    world, timestamps = _turning_sequence()
+    engine = FeatureEngine()
+    stream = [dict(engine.update(w, t)) for w, t in zip(world, timestamps)]
+    bulk = compute_features(world, timestamps)
+    for name in ('angles', 'angle_velocity', 'velocity', 'speed', 'acceleration',
+                 'acceleration_magnitude'):
+        np.testing.assert_allclose(np.stack([f[name] for f in stream]), bulk[name],
+                                   rtol=1e-4, atol=1e-3, err_msg=name)
+
+
+def test_trunk_rotation_rate_is_wrapped():
+    world, timestamps = _turning_sequence()
+    bulk = compute_features(world, timestamps)
+    assert (np.abs(bulk['angles'][:, -1]) > 170).any()
+    # 60 degrees over at most 4.5 s never needs more than a few dozen deg/s
+    assert np.abs(bulk['angle_velocity'][:, -1]).max() < 100
+
+
+def test_single_frame_has_no_motion():
+    world, _ = _turning_sequence()
+    features = compute_features(world[0])
+    assert features['angles'].shape == (9,)
+    assert not features['velocity'].any() and not features['acceleration'].any()
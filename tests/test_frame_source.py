@@ -0,0 +1,39 @@
+import time
+
+from utils.frame_source import FrameSource, SyntheticSource
+
+
+class _DeadCamera(FrameSource):
+    """A live source whose reads keep failing, counting them"""
+
+    read_timeout = 0.2
+
+    def __init__(self, good_frames=0):
+        super().__init__()
+        self.reads = 0
+        self.good_frames = good_frames
+
+    def _read_frame(self):
+        self.reads += 1
+        if self.reads <= self.good_frames:
+            return True, SyntheticSource(width=8, height=8)._read_frame()[1]
+        return False, None
+
+
+def test_failing_live_source_backs_off_and_stops():
+    camera = _DeadCamera(good_frames=3)
+    start = time.perf_counter()
+    packets = list(camera)
+    elapsed = time.perf_counter() - start
+    assert len(packets) == 3
+    assert camera.exhausted
+    assert 0.2 <= elapsed < 1.0
+    # Sleeping between attempts, not spinning
+    assert camera.reads < 3 + 0.2 / FrameSource.retry_interval + 5
+
+
+def test_finite_sources_end_without_waiting():
+    start = time.perf_counter()
+    packets = list(SyntheticSource(width=16, height=8, frames=5))
+    assert [p.index for p in packets] == list(range(5))
+    assert time.perf_counter() - start < 0.2
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from mediapipe.framework.formats import landmark_pb2
+
+from utils.heatmap import HEATMAP_LANDMARKS, MotionHeatmap, session_heatmap
+from utils.landmarks import NUM_LANDMARKS, PoseResults
+
+
+def _log(count, seed=0):
+    """(T, 33, 4) landmark log wandering over the image, some frames with
+    landmarks below the visibility threshold"""
+    rng = np.random.default_rng(seed)
+    log = np.empty((count, NUM_LANDMARKS, 4), dtype=np.float32)
+    log[..., :3] = rng.uniform(-0.05, 1.05, (count, NUM_LANDMARKS, 3))
+    log[..., 3] = rng.choice([0.2, 0.9], (count, NUM_LANDMARKS), p=[0.3, 0.7])
+    return log
+
+
+def _results(frame):
+    image = landmark_pb2.NormalizedLandmarkList()
+    for x, y, z, visibility in frame.tolist():
+        image.landmark.add(x=x, y=y, z=z, visibility=visibility)
+    return PoseResults(image)
+
+
+def test_accumulation_matches_the_session_heatmap():
+    log = _log(50)
+    timestamps = np.arange(len(log)) / 30.0
+    heatmap = MotionHeatmap(half_life=1e9)
+    for frame, timestamp in zip(log, timestamps):
+        heatmap.update(_results(frame), timestamp)
+    # Live updates credit each pose with the time since the previous frame,
+    # the session heatmap with the time until the next one
+    expected = session_heatmap(log[1:], timestamps[1:])
+    np.testing.assert_allclose(heatmap.grid, expected, rtol=1e-4, atol=1e-7)
+    assert heatmap.grid.sum() == pytest.approx(
+        (log[1:, list(HEATMAP_LANDMARKS), 3] >= 0.5).sum() / 30.0, rel=1e-4)
+
+
+def test_heat_decays_with_the_half_life():
+    heatmap = MotionHeatmap(half_life=2.0)
+    frame = _log(1)[0]
+    frame[list(HEATMAP_LANDMARKS), 3] = 1.0
+    heatmap.update(_results(frame), 0.0)
+    heatmap.update(_results(frame), 0.1)
+    total = heatmap.grid.sum()
+    assert total == pytest.approx(0.4, rel=1e-5)
+    # Lost poses only decay, in max_step slices: 2 s halves the heat
+    for i in range(1, 21):
+        heatmap.update(None, 0.1 + i * 0.1)
+    assert heatmap.grid.sum() == pytest.approx(total / 2, rel=1e-4)
+    # A long gap is credited as one max_step, not as decay or heat
+    heatmap.update(None, 100.0)
+    assert heatmap.grid.sum() == pytest.approx(total / 2 * 0.5 ** (0.1 / 2.0), rel=1e-4)
+
+
+def test_invisible_landmarks_leave_no_heat():
+    heatmap = MotionHeatmap()
+    frame = _log(1)[0]
+    frame[:, 3] = 0.1
+    heatmap.update(_results(frame), 0.0)
+    heatmap.update(_results(frame), 0.1)
+    assert not heatmap.grid.any()
+    assert heatmap.image() is None
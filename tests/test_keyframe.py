@@ -0,0 +1,42 @@
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+from utils.keyframe import KeyframePropagator
+from utils.landmarks import NUM_LANDMARKS, PoseResults, landmarks_to_array
+
+
+def _results(world_x):
+    image = landmark_pb2.NormalizedLandmarkList()
+    world = landmark_pb2.LandmarkList()
+    for i in range(NUM_LANDMARKS):
+        angle = 2 * np.pi * i / NUM_LANDMARKS
+        image.landmark.add(x=0.5 + 0.2 * np.cos(angle), y=0.5 + 0.3 * np.sin(angle),
+                           z=0.0, visibility=1.0)
+        world.landmark.add(x=world_x, y=0.01 * i, z=0.0, visibility=1.0)
+    return PoseResults(image, world)
+
+
+def _frame():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, (240, 320, 3), dtype=np.uint8)
+
+
+def test_world_landmarks_follow_the_smoothed_velocity():
+    propagator = KeyframePropagator(interval=2, velocity_smoothing=0.5)
+    frame = _frame()
+    # Keyframe steps of 1.0 and then 0.0 m/s smooth to 0.5 m/s
+    for timestamp, x in ((0.0, 0.0), (0.1, 0.1), (0.2, 0.1)):
+        propagator.keyframe(frame, _results(x), timestamp)
+    results = propagator.propagate(frame, 0.3)
+    world = landmarks_to_array(results.pose_world_landmarks)
+    np.testing.assert_allclose(world[:, 0], 0.1 + 0.5 * 0.1, atol=1e-5)
+
+
+def test_a_gap_resets_the_velocity():
+    propagator = KeyframePropagator()
+    frame = _frame()
+    propagator.keyframe(frame, _results(0.0), 0.0)
+    propagator.keyframe(frame, _results(0.5), 2.0)
+    results = propagator.propagate(frame, 2.1)
+    world = landmarks_to_array(results.pose_world_landmarks)
+    np.testing.assert_allclose(world[:, 0], 0.5, atol=1e-6)
@@ -0,0 +1,68 @@
+import random
+
+from utils.metrics import (BUCKET_COUNT, LatencyHistogram, MetricsRegistry,
+                           _bucket_lower_bound, _bucket_upper_bound)
+
+
+def _bucket_of(value):
+    histogram = LatencyHistogram('probe')
+    histogram.record(value)
+    return next(i for i, count in enumerate(histogram.counts) if count)
+
+
+def test_buckets_tile_the_range():
+    assert _bucket_lower_bound(0) == 0
+    for index in range(BUCKET_COUNT - 1):
+        assert _bucket_lower_bound(index + 1) == _bucket_upper_bound(index) + 1
+
+
+def test_values_land_in_their_bucket():
+    rng = random.Random(0)
+    values = list(range(200)) + [rng.randrange(1 << exponent) for exponent in range(8, 37)
+                                 for _ in range(20)]
+    for value in values:
+        index = _bucket_of(value)
+        assert _bucket_lower_bound(index) <= value <= _bucket_upper_bound(index)
+
+
+def test_relative_precision():
+    for value in (1000, 33333, 10 ** 6, 123456789):
+        index = _bucket_of(value)
+        width = _bucket_upper_bound(index) - _bucket_lower_bound(index) + 1
+        assert width / value <= 1 / 16
+
+
+def test_huge_values_are_clamped():
+    histogram = LatencyHistogram('huge')
+    histogram.record(1 << 60)
+    assert histogram.counts[-1] == 1
+    assert histogram.max_ns == 1 << 60
+
+
+def test_quantiles_and_snapshot():
+    histogram = LatencyHistogram('latency')
+    for ms in range(1, 101):
+        histogram.record(ms * 1000000)
+    assert abs(histogram.quantile(0.5) / 1e6 - 50) <= 50 * 0.04
+    assert histogram.quantile(1.0) == 100 * 1000000
+    snap = histogram.snapshot()
+    assert snap['count'] == 100
+    assert abs(snap['mean'] - 0.0505) < 1e-9
+    # Exported cumulative counts only include buckets wholly below the bound
+    for bound, cumulative in snap['buckets']:
+        below = sum(ms / 1000 <= bound for ms in range(1, 101))
+        clearly_below = sum(ms / 1000 <= bound * (1 - 1 / 16) for ms in range(1, 101))
+        assert clearly_below <= cumulative <= below
+
+
+def test_registry_reuses_metrics_by_labels():
+    registry = MetricsRegistry()
+    assert registry.counter('drops', reason='full') is registry.counter('drops', reason='full')
+    assert registry.counter('drops', reason='full') is not registry.counter('drops', reason='late')
+    registry.counter('drops', reason='full').inc(3)
+    registry.stage('decode').record(1500000)
+    text = registry.to_prometheus()
+    assert '# TYPE yoach_drops counter' in text
+    assert 'yoach_drops{reason="full"} 3' in text
+    assert 'yoach_stage_latency_seconds_bucket{stage="decode",le="0.002"} 1' in text
+    assert 'yoach_stage_latency_seconds_count{stage="decode"} 1' in text
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from utils.frame_source import FramePacket
+from utils.pipeline import Pipeline, PipelineError, Stage
+
+
+def _packets(count):
+    return [FramePacket(np.full((4, 4), i, dtype=np.uint8), i / 30, i) for i in range(count)]
+
+
+def _stages():
+    return [
+        Stage('mean', lambda frame: float(frame.mean()),
+              inputs={'frame': np.ndarray}, outputs={'mean': float}),
+        Stage('split', lambda mean, index: (mean * 2, index % 2 == 0),
+              inputs={'mean': float, 'index': int}, outputs={'double': float, 'even': bool}),
+    ]
+
+
+@pytest.mark.parametrize('mode', ['inline', 'threaded'])
+def test_run_modes_keep_order_and_outputs(mode):
+    results = list(Pipeline(_stages()).run(_packets(20), mode=mode))
+    assert [ctx.index for ctx in results] == list(range(20))
+    assert [ctx['double'] for ctx in results] == [2.0 * i for i in range(20)]
+    assert [ctx['even'] for ctx in results] == [i % 2 == 0 for i in range(20)]
+    assert set(results[0].timings) == {'mean', 'split'}
+
+
+def test_missing_input_is_rejected():
+    with pytest.raises(PipelineError, match="needs 'mean'"):
+        Pipeline([Stage('late', lambda mean: mean, inputs={'mean': float})])
+
+
+def test_mismatched_types_are_rejected():
+    stages = [Stage('text', str, inputs={'index': int}, outputs={'label': str}),
+              Stage('use', lambda label: label, inputs={'label': float})]
+    with pytest.raises(PipelineError, match='produced as str'):
+        Pipeline(stages)
+
+
+def test_wrong_output_count_fails():
+    stages = [Stage('pair', lambda index: index, inputs={'index': int},
+                    outputs={'a': int, 'b': int})]
+    with pytest.raises(PipelineError, match='must return 2 values'):
+        list(Pipeline(stages).run(_packets(1)))
+
+
+def test_stage_errors_reach_the_consumer_when_threaded():
+    def fail(index):
+        if index == 3:
+            raise ValueError("bad frame")
+        return index
+
+    stages = [Stage('fail', fail, inputs={'index': int}, outputs={'value': int})]
+    seen = []
+    with pytest.raises(ValueError, match='bad frame'):
+        for ctx in Pipeline(stages).run(_packets(10), mode='threaded'):
+            seen.append(ctx.index)
+    assert seen == [0, 1, 2]
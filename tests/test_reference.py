@@ -0,0 +1,105 @@
+import numpy as np
+
+from utils.features import ANGLE_NAMES
+from utils.reference import ReferenceLibrary, banded_dtw, normalize_swing, warping_path
+from utils.swing_phases import PhaseEvent
+
+
+def _dtw(query, candidate, radius):
+    """Textbook O(L^2) DTW of squared errors inside a Sakoe-Chiba band"""
+    length = len(query)
+    table = np.full((length + 1, length + 1), np.inf)
+    table[0, 0] = 0.0
+    for i in range(1, length + 1):
+        for j in range(max(1, i - radius), min(length, i + radius) + 1):
+            cost = ((query[i - 1] - candidate[j - 1]) ** 2).sum()
+            table[i, j] = cost + min(table[i - 1, j - 1], table[i - 1, j], table[i, j - 1])
+    return table[length, length]
+
+
+def test_matches_plain_dtw():
+    rng = np.random.default_rng(0)
+    query = rng.normal(size=(24, 3))
+    candidates = rng.normal(size=(6, 24, 3))
+    for radius in (0, 1, 3, 8):
+        expected = [_dtw(query, candidate, radius) for candidate in candidates]
+        np.testing.assert_allclose(banded_dtw(query, candidates, radius), expected, rtol=1e-10)
+
+
+def test_radius_zero_is_euclidean():
+    rng = np.random.default_rng(1)
+    query = rng.normal(size=(10, 2))
+    candidates = rng.normal(size=(3, 10, 2))
+    np.testing.assert_allclose(banded_dtw(query, candidates, 0),
+                               ((candidates - query) ** 2).sum(axis=(1, 2)))
+
+
+def test_abandon_only_drops_worse_candidates():
+    rng = np.random.default_rng(2)
+    query = rng.normal(size=(20, 2))
+    candidates = rng.normal(size=(8, 20, 2))
+    exact = banded_dtw(query, candidates, 3)
+    limit = np.median(exact)
+    pruned = banded_dtw(query, candidates, 3, abandon=limit)
+    keep = exact <= limit
+    np.testing.assert_allclose(pruned[keep], exact[keep])
+    # Worse candidates are dropped once their partial cost exceeds the limit
+    worse = pruned[~keep]
+    assert np.isinf(worse).any()
+    assert (np.isinf(worse) | np.isclose(worse, exact[~keep])).all()
+
+
+def test_warping_path_accumulates_the_distance():
+    rng = np.random.default_rng(3)
+    query = rng.normal(size=(15, 2))
+    candidates = rng.normal(size=(1, 15, 2))
+    distances, rows = banded_dtw(query, candidates, 2, return_cost=True)
+    path = warping_path(rows[0], 2)
+    assert path[0] == (0, 0) and path[-1] == (14, 14)
+    assert all(abs(i - j) <= 2 for i, j in path)
+    steps = [(i2 - i1, j2 - j1) for (i1, j1), (i2, j2) in zip(path, path[1:])]
+    assert set(steps) <= {(0, 1), (1, 0), (1, 1)}
+    cost = sum(((query[i] - candidates[0, j]) ** 2).sum() for i, j in path)
+    assert np.isclose(cost, distances[0])
+
+
+def _swing(trunk, length=60):
+    """(T, 9) angles, timestamps and events of a swing with the given trunk
+    rotation track"""
+    timestamps = np.linspace(0.0, 2.0, length)
+    angles = np.tile(np.linspace(90.0, 170.0, length)[:, None], (1, len(ANGLE_NAMES)))
+    angles[:, ANGLE_NAMES.index('trunk_rotation')] = trunk
+    events = [PhaseEvent('backswing', 0.0), PhaseEvent('forward_swing', 1.0),
+              PhaseEvent('follow_through', 1.5), PhaseEvent('idle', 2.0)]
+    return angles, timestamps, events
+
+
+def test_trunk_rotation_is_continuous_through_the_wrap():
+    trunk = (np.linspace(170.0, 190.0, 60) + 180.0) % 360.0 - 180.0
+    angles, timestamps, _ = _swing(trunk)
+    sequence = normalize_swing(angles, timestamps, 0.0, 2.0) * 180.0
+    steps = np.diff(sequence[:, ANGLE_NAMES.index('trunk_rotation')])
+    assert (np.abs(steps) < 1.0).all()
+
+
+def test_trunk_deviation_across_the_wrap_is_small(tmp_path):
+    library = ReferenceLibrary(str(tmp_path))
+    library.add('expert', *_swing(np.full(60, 179.0)))
+    library.save()
+    comparison = ReferenceLibrary(str(tmp_path)).compare(*_swing(np.full(60, -179.0)))
+    assert abs(comparison.deviations['trunk_rotation'] - 2.0) < 1e-3
+    for joints in comparison.phase_deviations.values():
+        assert abs(joints['trunk_rotation'] - 2.0) < 1e-3
+
+
+def test_save_appends_while_mapped(tmp_path):
+    library = ReferenceLibrary(str(tmp_path))
+    library.add('first', *_swing(np.zeros(60)))
+    library.save()
+    first = np.array(library._arrays['sequences'][0])
+    library.add('second', *_swing(np.full(60, 30.0)))
+    library.save()
+    reloaded = ReferenceLibrary(str(tmp_path))
+    assert [entry['name'] for entry in reloaded.entries] == ['first', 'second']
+    np.testing.assert_array_equal(reloaded._arrays['sequences'][0], first)
+    assert not [name for name in tmp_path.iterdir() if name.suffix == '.tmp']
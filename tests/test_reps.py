@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from utils.features import ANGLE_NAMES
+from utils.reps import RepCounter
+
+FPS = 30.0
+
+
+def _squats(knee, seed=0):
+    """(T, 9) angles with noisy left and right knees following ``knee``"""
+    rng = np.random.default_rng(seed)
+    angles = np.full((len(knee), len(ANGLE_NAMES)), 150.0, dtype=np.float32)
+    for side in ('left_knee', 'right_knee'):
+        angles[:, ANGLE_NAMES.index(side)] = knee + rng.normal(0.0, 2.0, len(knee))
+    return angles
+
+
+def _streamed(angles, timestamps):
+    counter = RepCounter()
+    reps = []
+    for frame, timestamp in zip(angles, timestamps):
+        rep = counter.update({'angles': frame, 'timestamp': timestamp})
+        if rep is not None:
+            reps.append(rep)
+    return reps, counter
+
+
+def _assert_same_reps(streamed, bulk):
+    assert len(streamed) == len(bulk)
+    for a, b in zip(streamed, bulk):
+        assert a.keys() == b.keys()
+        for name in a:
+            assert a[name] == pytest.approx(b[name], abs=1e-6), name
+
+
+def test_streaming_and_bulk_counts_agree():
+    timestamps = np.arange(0.0, 60.0, 1.0 / FPS)
+    angles = _squats(130.0 + 45.0 * np.cos(2 * np.pi * timestamps / 3.0))
+    streamed, counter = _streamed(angles, timestamps)
+    bulk = RepCounter().count({'angles': angles, 'timestamp': timestamps})
+    assert counter.reps == len(bulk) == 20
+    _assert_same_reps(streamed, bulk)
+
+
+def test_shallow_reps_and_dropouts_agree():
+    timestamps = np.arange(0.0, 40.0, 1.0 / FPS)
+    # Deep, then shallow (below min_rom), then slow deep reps
+    depth = np.where(timestamps < 15.0, 45.0, np.where(timestamps < 25.0, 10.0, 40.0))
+    period = np.where(timestamps < 25.0, 3.0, 5.0)
+    angles = _squats(130.0 + depth * np.cos(2 * np.pi * timestamps / period), seed=1)
+    # Lost knees on some frames, and one side only on others
+    angles[200:206, ANGLE_NAMES.index('left_knee')] = np.nan
+    angles[200:203, ANGLE_NAMES.index('right_knee')] = np.nan
+    streamed, _ = _streamed(angles, timestamps)
+    bulk = RepCounter().count({'angles': angles, 'timestamp': timestamps})
+    assert len(bulk) >= 5
+    _assert_same_reps(streamed, bulk)
@@ -0,0 +1,83 @@
+import os
+import time
+
+import numpy as np
+
+from utils.result_cache import ResultCache, events_from_arrays, events_to_arrays
+from utils.swing_phases import PhaseEvent
+
+
+def test_keys_hash_stage_and_settings():
+    key = ResultCache.key('landmarks', 'abc', {'size': [384, 384], 'trim': True})
+    assert key.startswith('landmarks-')
+    assert key == ResultCache.key('landmarks', 'abc', {'trim': True, 'size': [384, 384]})
+    assert key != ResultCache.key('landmarks', 'abd', {'size': [384, 384], 'trim': True})
+    assert key != ResultCache.key('features', 'abc', {'size': [384, 384], 'trim': True})
+
+
+def test_fetch_computes_once(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'values': np.arange(5)}
+
+    first = cache.fetch('stage-1', compute)
+    second = cache.fetch('stage-1', compute)
+    assert len(calls) == 1
+    np.testing.assert_array_equal(first['values'], second['values'])
+    assert ResultCache(str(tmp_path)).load('stage-1') is not None
+    assert cache.load('stage-2') is None
+
+
+def test_damaged_artifact_is_a_miss_and_removed(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.store('stage-1', {'values': np.arange(1000)})
+    path = cache._path('stage-1')
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    assert cache.load('stage-1') is None
+    assert not os.path.exists(path)
+    arrays = cache.fetch('stage-1', lambda: {'values': np.arange(3)})
+    np.testing.assert_array_equal(cache.load('stage-1')['values'], arrays['values'])
+
+
+def test_digest_follows_file_content(tmp_path):
+    video = tmp_path / 'video.mp4'
+    video.write_bytes(b'frame data')
+    cache = ResultCache(str(tmp_path / 'cache'))
+    digest = cache.digest(str(video))
+    assert ResultCache(str(tmp_path / 'cache')).digest(str(video)) == digest
+    video.write_bytes(b'other frame data')
+    assert cache.digest(str(video)) != digest
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 40)
+    payload = {'data': np.zeros(10000, dtype=np.uint8)}
+    for name in ('a', 'b', 'c'):
+        cache.store(name, payload)
+    size = os.path.getsize(tmp_path / 'a.npz')
+    now = time.time()
+    for age, name in enumerate(('b', 'a', 'c')):
+        os.utime(tmp_path / f'{name}.npz', (now - 100 + age, now - 100 + age))
+    cache.load('b')                        # A hit makes b the most recent
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert sorted(p for p in os.listdir(tmp_path) if p.endswith('.npz')) == ['b.npz', 'c.npz']
+
+
+def test_oversized_newest_artifact_is_kept(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1)
+    cache.store('big', {'data': np.zeros(1000)})
+    assert cache.load('big') is not None
+
+
+def test_events_round_trip():
+    events = [PhaseEvent('preparation', 0.5), PhaseEvent('impact', 1.25, 'right')]
+    restored = events_from_arrays(events_to_arrays(events))
+    assert [(e.phase, e.timestamp, e.hand) for e in restored] == \
+        [('preparation', 0.5, None), ('impact', 1.25, 'right')]
@@ -0,0 +1,80 @@
+import numpy as np
+
+from utils.session_store import Session, SessionStore, _decode, _encode
+
+
+def _write_session(store, frames=100, fps=30.0):
+    writer = store.create('practice', video='videos/practice.mp4', start=1000.0)
+    rng = np.random.default_rng(0)
+    timestamps = np.arange(frames) / fps
+    elbow = rng.uniform(20, 170, frames)
+    speed = rng.uniform(0, 5, (frames, 8))
+    speed[10] = np.nan                     # A frame without a pose
+    for i in range(frames):
+        writer.append({'timestamp': timestamps[i], 'angle.right_elbow': elbow[i],
+                       'speed': speed[i]})
+    writer.add_event('impact', 1.5, hand='right')
+    writer.add_event('idle', 2.5)
+    writer.close()
+    return Session(writer.path), timestamps, elbow, speed
+
+
+def test_quantized_encoding_round_trip():
+    values = np.array([[0.0, -1.0], [0.5, np.nan], [1.0, 3.0]])
+    codes, scales = _encode(values, 'q16')
+    decoded = _decode(codes, 'q16', scales[None], [3])
+    np.testing.assert_allclose(decoded[~np.isnan(values)], values[~np.isnan(values)], atol=1e-4)
+    assert np.isnan(decoded[1, 1])
+
+
+def test_read_round_trip(tmp_path):
+    store = SessionStore(str(tmp_path), chunk_frames=16)
+    session, timestamps, elbow, speed = _write_session(store)
+    assert session.frames == 100
+    assert len(session.chunks) == 7
+    data = session.read(['angle.right_elbow', 'speed'])
+    np.testing.assert_array_equal(data['timestamp'], timestamps)
+    np.testing.assert_allclose(data['angle.right_elbow'], elbow, atol=150 / 65534)
+    assert np.isnan(data['speed'][10]).all()
+    keep = ~np.isnan(speed)
+    np.testing.assert_allclose(data['speed'][keep], speed[keep], atol=5 / 65534)
+    # Columns never written read back as NaN
+    assert np.isnan(session.read(['landmarks'])['landmarks']).all()
+
+
+def test_read_time_range(tmp_path):
+    store = SessionStore(str(tmp_path), chunk_frames=16)
+    session, timestamps, elbow, _ = _write_session(store)
+    first, last = session.chunk_range(1.0, 1.5)
+    assert (first, last) == (1, 3)
+    data = session.read(['angle.right_elbow'], start=1.0, end=1.5)
+    inside = (timestamps >= 1.0) & (timestamps <= 1.5)
+    np.testing.assert_array_equal(data['timestamp'], timestamps[inside])
+    np.testing.assert_allclose(data['angle.right_elbow'], elbow[inside], atol=150 / 65534)
+    assert len(session.read(['angle.right_elbow'], start=10.0)['timestamp']) == 0
+
+
+def test_events_and_queries(tmp_path):
+    store = SessionStore(str(tmp_path), chunk_frames=16)
+    _write_session(store)
+    later = store.create('practice', start=2000.0)
+    later.extend({'timestamp': np.arange(5) / 30.0, 'angle.right_elbow': np.full(5, 90.0)})
+    later.close()
+
+    sessions = store.sessions()
+    assert [s.name for s in sessions] == ['practice', 'practice_2']
+    assert [e['phase'] for e in sessions[0].events(start=2.0)] == ['idle']
+    assert sessions[0].events(end=2.0) == [{'hand': 'right', 'phase': 'impact', 'timestamp': 1.5}]
+    results = list(store.query(['angle.right_elbow'], since=1500.0))
+    assert [session.name for session, _ in results] == ['practice_2']
+    np.testing.assert_allclose(results[0][1]['angle.right_elbow'], 90.0)
+
+
+def test_unclosed_session_exposes_whole_chunks(tmp_path):
+    store = SessionStore(str(tmp_path), chunk_frames=16)
+    writer = store.create('live')
+    for i in range(40):
+        writer.append({'timestamp': i / 30.0})
+    assert Session(writer.path).frames == 32
+    store.cleanup()
+    assert Session(writer.path).frames == 40
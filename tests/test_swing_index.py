@@ -0,0 +1,78 @@
+import numpy as np
+
+from utils.swing_index import SwingIndex
+
+
+def _filled(path, count, seed=0, block=64):
+    index = SwingIndex(str(path), block=block)
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(count, index.dim)).astype(np.float32)
+    index.add_embeddings(embeddings, [{'name': f'swing{i}'} for i in range(count)])
+    return index, embeddings
+
+
+def _brute_force(queries, embeddings, k):
+    distances = ((queries[:, None, :] - embeddings[None]) ** 2).sum(axis=2)
+    order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(distances, order, axis=1), order
+
+
+def test_exact_search_matches_brute_force(tmp_path):
+    # Several blocks, so the per-block pruning is exercised
+    index, embeddings = _filled(tmp_path, 300)
+    queries = np.random.default_rng(1).normal(size=(7, index.dim)).astype(np.float32)
+    distances, indices = index.search(queries, k=5)
+    expected_distances, expected_indices = _brute_force(queries, embeddings, 5)
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4)
+
+
+def test_query_of_an_archived_swing_finds_it(tmp_path):
+    index, embeddings = _filled(tmp_path, 100)
+    distances, indices = index.search(embeddings[42], k=1)
+    assert indices[0, 0] == 42
+    assert distances[0, 0] < 1e-2
+
+
+def test_fewer_swings_than_k_are_padded(tmp_path):
+    index, _ = _filled(tmp_path, 3)
+    distances, indices = index.search(np.zeros(index.dim), k=5)
+    assert sorted(indices[0, :3]) == [0, 1, 2]
+    assert (indices[0, 3:] == -1).all() and np.isinf(distances[0, 3:]).all()
+    empty = SwingIndex(str(tmp_path / 'empty'))
+    assert (empty.search(np.zeros(empty.dim), k=2)[1] == -1).all()
+
+
+def test_appends_survive_reopening(tmp_path):
+    index, embeddings = _filled(tmp_path, 50)
+    extra = np.random.default_rng(5).normal(size=(10, index.dim)).astype(np.float32)
+    index.add_embeddings(extra, [{'name': f'extra{i}'} for i in range(10)])
+    reopened = SwingIndex(str(tmp_path))
+    assert len(reopened) == 60
+    assert reopened.entries[55]['name'] == 'extra5'
+    assert reopened.search(extra[5], k=1)[1][0, 0] == 55
+
+
+def test_interrupted_insert_is_cut_back(tmp_path):
+    index, _ = _filled(tmp_path, 20)
+    with open(tmp_path / 'embeddings.f32', 'ab') as f:
+        f.write(np.zeros(index.dim, dtype=np.float32).tobytes())
+    reopened = SwingIndex(str(tmp_path))
+    assert len(reopened) == 20
+    assert (tmp_path / 'embeddings.f32').stat().st_size == 20 * index.dim * 4
+
+
+def test_ivf_search_finds_clustered_neighbours(tmp_path):
+    index = SwingIndex(str(tmp_path))
+    rng = np.random.default_rng(2)
+    centres = rng.normal(scale=10.0, size=(20, index.dim))
+    labels = np.repeat(np.arange(20), 50)
+    embeddings = (centres[labels] + rng.normal(size=(1000, index.dim))).astype(np.float32)
+    index.add_embeddings(embeddings, [{'cluster': int(c)} for c in labels])
+    index.build_ivf(lists=20, iterations=5)
+    queries = embeddings[::97]
+    _, indices = index.search(queries, k=5, nprobe=4)
+    _, expected = _brute_force(queries, embeddings, 5)
+    recall = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(indices, expected)])
+    assert recall >= 0.8
+    assert SwingIndex(str(tmp_path)).ivf == {'lists': 20, 'subspaces': 16}
@@ -0,0 +1,75 @@
+import numpy as np
+
+from utils.features import POINT_NAMES
+from utils.swing_phases import SwingPhaseSegmenter, split_swings
+
+_WRIST = POINT_NAMES.index('right_wrist')
+
+
+def _swing(rng, fps=30):
+    """Tracked-point velocities of one synthetic swing that starts mid-motion"""
+    direction = rng.normal(size=3)
+    direction /= np.linalg.norm(direction)
+    peak = rng.uniform(2.5, 5.0)
+    parts = [
+        (0.1, lambda t: np.ones_like(t)[:, None] * rng.uniform(-1, 1, 3)),
+        (rng.uniform(0.2, 0.5), lambda t: (0.6 * t)[:, None] * direction),
+        (rng.uniform(0.4, 0.8),
+         lambda t: (0.6 + rng.uniform(0.8, 1.5) * np.sin(np.pi * t))[:, None] * direction),
+        (rng.uniform(0.2, 0.4), lambda t: -(peak * np.sin(np.pi * t) + 0.3)[:, None] * direction),
+        (rng.uniform(0.3, 0.6), lambda t: -(0.3 * (1 - t))[:, None] * direction),
+        (rng.uniform(0.5, 1.0), lambda t: np.zeros((len(t), 3))),
+    ]
+    velocity = np.concatenate([shape(np.linspace(0, 1, int(seconds * fps), endpoint=False))
+                               for seconds, shape in parts])
+    velocity += rng.normal(scale=0.05, size=velocity.shape)
+    tracked = np.zeros((len(velocity), len(POINT_NAMES), 3))
+    tracked[:, _WRIST] = velocity
+    return tracked, np.arange(len(velocity)) / fps
+
+
+def _events(events):
+    return [(e.phase, round(e.timestamp, 6), e.hand) for e in events]
+
+
+def test_offline_segmentation_matches_streaming():
+    rng = np.random.default_rng(0)
+    impacts = 0
+    for _ in range(50):
+        velocity, timestamps = _swing(rng)
+        segmenter = SwingPhaseSegmenter()
+        live = []
+        for v, t in zip(velocity, timestamps):
+            live += segmenter.update({'velocity': v, 'timestamp': t})
+        offline = SwingPhaseSegmenter().segment({'velocity': velocity, 'timestamp': timestamps})
+        assert _events(live) == _events(offline)
+        impacts += sum(e.phase == 'impact' for e in offline)
+    assert impacts > 25
+
+
+def test_new_peak_holds_off_settling():
+    # A slow reversal whose speed keeps creeping up below the rest speed
+    speed = np.concatenate([np.zeros(5), np.full(10, 1.5), -np.linspace(0.001, 0.2, 30),
+                            np.zeros(20)])
+    velocity = np.zeros((len(speed), len(POINT_NAMES), 3))
+    velocity[:, _WRIST, 0] = speed
+    timestamps = np.arange(len(speed)) / 30
+    segmenter = SwingPhaseSegmenter(smoothing=1.0)
+    live = []
+    for v, t in zip(velocity, timestamps):
+        live += segmenter.update({'velocity': v, 'timestamp': t})
+    offline = SwingPhaseSegmenter(smoothing=1.0).segment({'velocity': velocity,
+                                                          'timestamp': timestamps})
+    assert _events(live) == _events(offline)
+    assert [e.phase for e in offline] == ['preparation', 'backswing', 'forward_swing', 'idle']
+
+
+def test_split_swings_keeps_complete_swings():
+    rng = np.random.default_rng(1)
+    velocity, timestamps = _swing(rng)
+    events = SwingPhaseSegmenter().segment({'velocity': velocity, 'timestamp': timestamps})
+    swings = split_swings(events)
+    assert swings
+    for swing in swings:
+        assert swing[0].phase == 'preparation' and swing[-1].phase == 'idle'
+        assert any(e.phase == 'impact' for e in swing)
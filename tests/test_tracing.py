@@ -0,0 +1,41 @@
+import threading
+
+from utils.tracing import Tracer
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    with tracer.span('work'):
+        pass
+    assert tracer.to_chrome_trace()['traceEvents'] == []
+
+
+def test_spans_per_thread():
+    tracer = Tracer().enable()
+
+    @tracer.traced('job')
+    def job():
+        with tracer.span('inner', step=1):
+            pass
+
+    job()
+    worker = threading.Thread(target=job, name='worker')
+    worker.start()
+    worker.join()
+
+    events = tracer.to_chrome_trace()['traceEvents']
+    threads = [e['args']['name'] for e in events if e['ph'] == 'M']
+    assert sorted(threads) == sorted([threading.current_thread().name, 'worker'])
+    spans = [e for e in events if e['ph'] == 'X']
+    assert sorted(e['name'] for e in spans) == ['inner', 'inner', 'job', 'job']
+    assert all(e['dur'] >= 0 for e in spans)
+    assert [e.get('args') for e in spans if e['name'] == 'inner'] == [{'step': 1}] * 2
+
+
+def test_ring_buffer_keeps_the_newest_events():
+    tracer = Tracer(capacity=4).enable()
+    for i in range(10):
+        with tracer.span(f'span{i}'):
+            pass
+    names = [e['name'] for e in tracer.to_chrome_trace()['traceEvents'] if e['ph'] == 'X']
+    assert names == ['span6', 'span7', 'span8', 'span9']
@@ -0,0 +1,62 @@
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+from utils.landmarks import NUM_LANDMARKS, PoseResults
+from utils.trajectory import RIGHT_WRIST, Trajectory, draw_trajectory
+
+
+def _results(x, visibility=1.0):
+    image = landmark_pb2.NormalizedLandmarkList()
+    world = landmark_pb2.LandmarkList()
+    for _ in range(NUM_LANDMARKS):
+        image.landmark.add(x=0.0, y=0.5, z=0.0, visibility=0.0)
+        world.landmark.add(x=0.0, y=0.0, z=0.0, visibility=0.0)
+    image.landmark[RIGHT_WRIST].x = x
+    image.landmark[RIGHT_WRIST].visibility = visibility
+    world.landmark[RIGHT_WRIST].x = 2 * x
+    return PoseResults(image, world)
+
+
+def test_ring_buffer_keeps_the_newest_positions_in_order():
+    trajectory = Trajectory(capacity=8)
+    for i in range(19):
+        trajectory.push(_results(i / 100), i / 10)
+    assert len(trajectory) == 8
+    path = trajectory.path()
+    np.testing.assert_allclose(path.image[:, 0], np.arange(11, 19) / 100, rtol=1e-6)
+    np.testing.assert_allclose(path.world[:, 0], np.arange(11, 19) / 50, rtol=1e-6)
+    # World speed: 0.02 m per 0.1 s
+    np.testing.assert_allclose(path.speed, 0.2, rtol=1e-4)
+    assert path.fade[-1] == 1.0 and (np.diff(path.fade) >= 0).all()
+
+
+def test_lost_poses_break_the_line_across_the_wrap():
+    trajectory = Trajectory(capacity=4)
+    for i in range(6):
+        trajectory.push(_results(0.5, visibility=0.1 if i == 4 else 1.0), i / 10)
+    trajectory.push(None, 0.6)
+    path = trajectory.path()
+    assert len(path) == 4
+    assert np.isfinite(path.image).all(axis=1).tolist() == [True, False, True, False]
+    assert np.isnan(path.speed[[0, 1, 2]]).all()
+
+
+def test_clear_and_short_paths():
+    trajectory = Trajectory(capacity=4)
+    trajectory.push(_results(0.5), 0.0)
+    assert trajectory.path() is None
+    trajectory.push(_results(0.6), 0.1)
+    trajectory.clear()
+    assert len(trajectory) == 0 and trajectory.path() is None
+
+
+def test_snapshots_draw_without_the_buffer():
+    trajectory = Trajectory(capacity=8)
+    for i in range(8):
+        trajectory.push(_results(0.2 + i / 20), i / 10)
+    path = trajectory.path()
+    assert path.colors.shape == (7, 3) and path.alphas.shape == (7,)
+    trajectory.clear()
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    draw_trajectory(frame, path)
+    assert frame.any()
@@ -0,0 +1,174 @@
+import time
+
+import cv2
+import numpy as np
+
+from utils.letterbox import Letterbox
+from utils.lighting import small_gray
+
+
+class PersonDetector:
+    """Person-presence check: MediaPipe Pose in static-image mode on a small
+    letterboxed frame. The scanner only calls it about once a second, and
+    only on frames with motion, so it stays cheap."""
+
+    def __init__(self, size=(256, 256), min_detection_confidence=0.5):
+        import mediapipe as mp
+        self.size = size
+        self.pose = mp.solutions.pose.Pose(
+            static_image_mode=True,
+            model_complexity=0,
+            min_detection_confidence=min_detection_confidence,
+            enable_segmentation=False
+        )
+
+    def __call__(self, frame):
+        image = Letterbox(frame.shape, self.size).apply(frame)
+        return self.pose.process(image).pose_landmarks is not None
+
+    def close(self):
+        self.pose.close()
+
+
+class ActivityScan:
+    """Result of a scan: active frame ranges plus what it cost"""
+
+    def __init__(self, path, fps, frame_count, ranges, energy, sample_step, scan_seconds):
+        self.path = path
+        self.fps = fps
+        self.frame_count = frame_count
+        self.ranges = ranges              # [(start, end)] frame indices, end exclusive
+        self.energy = energy              # Motion energy per sampled frame
+        self.sample_step = sample_step    # Source frames per energy sample
+        self.scan_seconds = scan_seconds
+
+    @property
+    def active_frames(self):
+        return sum(end - start for start, end in self.ranges)
+
+    @property
+    def skipped_fraction(self):
+        if not self.frame_count:
+            return 0.0
+        return 1.0 - self.active_frames / self.frame_count
+
+    def time_ranges(self):
+        """Active ranges in seconds"""
+        return [(start / self.fps, end / self.fps) for start, end in self.ranges]
+
+
+class ActivityScanner:
+    """Streaming pre-pass that finds the parts of a video worth running
+    pose inference on.
+
+    Frames are sampled at ``sample_hz``; each sample's motion energy is the
+    fraction of pixels of a tiny grayscale copy that changed by more than
+    ``pixel_threshold`` since the previous sample. A sample is active when
+    the smoothed energy clears ``energy_floor`` (raised to ``noise_factor``
+    times the video's 5th-percentile energy for noisy sources) and a person
+    was seen within two ``presence_interval`` checks of it.
+    Active samples are padded by ``padding`` seconds, gaps shorter than
+    ``min_gap`` are bridged and ranges shorter than ``min_duration`` dropped.
+    """
+
+    def __init__(self, sample_hz=10.0, gray_width=80, pixel_threshold=12, energy_floor=0.01,
+                 noise_factor=3.0, smoothing=0.5, padding=1.0, min_gap=1.0, min_duration=0.5,
+                 presence_interval=1.0, person_detector=None, detect_people=True):
+        self.sample_hz = sample_hz
+        self.gray_width = gray_width
+        self.pixel_threshold = pixel_threshold
+        self.energy_floor = energy_floor
+        self.noise_factor = noise_factor
+        self.smoothing = smoothing
+        self.padding = padding
+        self.min_gap = min_gap
+        self.min_duration = min_duration
+        self.presence_interval = presence_interval
+        if detect_people and person_detector is None:
+            person_detector = PersonDetector()
+        self.person_detector = person_detector
+
+    def scan(self, path):
+        start_time = time.perf_counter()
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise Exception(f"Could not open video: {path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, int(round(fps / self.sample_hz)))
+        presence_step = max(1, int(round(self.presence_interval * fps / step)))
+
+        energy = []
+        presence = []   # (sample index, person seen)
+        previous = None
+        index = 0
+        while True:
+            # grab() skips the colour conversion for frames we do not sample
+            if not cap.grab():
+                break
+            if index % step == 0:
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
+                gray = small_gray(frame, self.gray_width)
+                sample = len(energy)
+                if previous is None:
+                    energy.append(0.0)
+                else:
+                    changed = cv2.absdiff(gray, previous) > self.pixel_threshold
+                    energy.append(np.count_nonzero(changed) / changed.size)
+                previous = gray
+                # Static frames cannot be active, so never pay for a check there
+                if self.person_detector is not None and sample % presence_step == 0 \
+                        and energy[-1] >= self.energy_floor / 2:
+                    presence.append((sample, self.person_detector(frame)))
+            index += 1
+        cap.release()
+
+        frame_count = index
+        energy = np.asarray(energy, dtype=np.float32)
+        ranges = self._ranges(energy, presence, fps / step, step, frame_count, presence_step)
+        return ActivityScan(path, fps, frame_count, ranges, energy, step,
+                            time.perf_counter() - start_time)
+
+    def _ranges(self, energy, presence, sample_rate, step, frame_count, presence_step):
+        if energy.size == 0:
+            return []
+        width = max(1, int(round(self.smoothing * sample_rate)))
+        smoothed = np.convolve(energy, np.ones(width, np.float32) / width, mode='same')
+        noise = float(np.percentile(smoothed, 5))
+        threshold = max(self.energy_floor, self.noise_factor * noise)
+        active = smoothed > threshold
+
+        if self.person_detector is not None:
+            # A presence sample vouches for the samples around it
+            seen = np.zeros_like(active)
+            reach = 2 * presence_step
+            for sample, present in presence:
+                if present:
+                    seen[max(0, sample - reach):sample + reach + 1] = True
+            active &= seen
+
+        # Pad, then bridge short gaps
+        pad = int(round(self.padding * sample_rate))
+        if pad:
+            active = np.convolve(active.astype(np.int32), np.ones(2 * pad + 1, np.int32),
+                                 mode='same') > 0
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], active.astype(np.int8), [0]))))
+        runs = list(zip(edges[::2], edges[1::2]))
+
+        merged = []
+        min_gap = self.min_gap * sample_rate
+        for start, end in runs:
+            if merged and start - merged[-1][1] < min_gap:
+                merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+
+        min_length = self.min_duration * sample_rate
+        return [(int(start * step), int(min(end * step, frame_count)))
+                for start, end in merged if end - start >= min_length]
+
+    def close(self):
+        close = getattr(self.person_detector, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,281 @@
+import collections
+import os
+import threading
+import time
+
+from utils.metrics import METRICS
+
+COACH_LATENCY = METRICS.histogram('coach_request_seconds')
+COACH_CACHED = METRICS.counter('coach_requests_total', result='cached')
+COACH_ANSWERED = METRICS.counter('coach_requests_total', result='answered')
+COACH_TIMEOUTS = METRICS.counter('coach_requests_total', result='timeout')
+COACH_ERRORS = METRICS.counter('coach_requests_total', result='error')
+COACH_DROPPED = METRICS.counter('coach_requests_total', result='superseded')
+
+BACKENDS = ('off', 'local', 'gemini')
+
+
+def _label(name):
+    return name.replace('_', ' ')
+
+
+def build_prompt(issues, details):
+    """Coaching prompt from (phase, joint, degrees) deviations and
+    (name, seconds) timings such as phase durations"""
+    lines = ["You are a concise racket-sports coach. In two short sentences, give the player "
+             "one concrete correction for their last swing, based on these measurements."]
+    if issues:
+        lines.append("Joint angle deviations from the expert swing (player minus expert, degrees):")
+        lines += [f"- {_label(phase)}: {_label(joint)} {value:+.0f}" for phase, joint, value in issues]
+    if details:
+        lines.append("Timings (seconds):")
+        lines += [f"- {_label(name)}: {value:.1f}" for name, value in details]
+    return "\n".join(lines)
+
+
+class LocalBackend:
+    """Rule-based feedback without a network call; stands in for the LLM in
+    tests and offline use. ``delay`` simulates a slow model."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def respond(self, prompt, issues, details):
+        if self.delay:
+            time.sleep(self.delay)
+        if not issues:
+            timing = ", ".join(f"{_label(name)} {value:.1f}s" for name, value in details)
+            return f"Swing recorded ({timing})." if timing else "Swing recorded."
+        phase, joint, value = issues[0]
+        direction = "wider" if value > 0 else "tighter"
+        return (f"In the {_label(phase)}, your {_label(joint)} angle is {abs(value):.0f} degrees "
+                f"{direction} than the expert's. Focus on matching it on the next swing.")
+
+
+class GeminiBackend:
+    """Feedback from a Gemini model through ``google-genai``. The API key
+    comes from ``api_key`` or the GOOGLE_API_KEY / GEMINI_API_KEY variables."""
+
+    def __init__(self, model='gemini-2.0-flash', api_key=None, timeout=None):
+        from google import genai
+        self.model = model
+        api_key = api_key or os.environ.get('GOOGLE_API_KEY') or os.environ.get('GEMINI_API_KEY')
+        # The HTTP timeout (milliseconds) ends calls the coach has given up on
+        http_options = {'timeout': int(timeout * 1000)} if timeout else None
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+
+    def respond(self, prompt, issues, details):
+        response = self.client.models.generate_content(model=self.model, contents=prompt)
+        return (response.text or "").strip()
+
+
+class CoachFeedback:
+    """Asynchronous coaching feedback for the Coach Chat panel.
+
+    ``submit`` only records analysis events and returns at once. Events with
+    the same key (one swing) are coalesced; a request goes out ``debounce``
+    seconds after the key's last event, or as soon as a newer key arrives.
+    At most one finished swing waits for the backend and a newer one
+    replaces it, so a slow backend skips swings instead of building a
+    backlog.
+
+    Each backend call runs on its own daemon thread, so the dispatcher never
+    waits for one. A call still running after ``timeout`` seconds is
+    abandoned: its answer is dropped, but it counts against ``max_calls``
+    until it returns, so hung calls cannot pile up. While all slots are
+    taken, new swings wait (and replace each other) for a free one.
+
+    Responses are cached by the error signature: deviations quantized to
+    ``step`` degrees and timings to ``timing_step`` seconds, so a repeated
+    mistake is answered without calling the backend. The render thread
+    reads ``snapshot``, whose ``version`` changes with every update.
+    """
+
+    def __init__(self, backend, debounce=0.5, timeout=15.0, step=5.0, timing_step=0.5,
+                 min_deviation=5.0, max_issues=3, max_calls=2, cache_size=256, history=4):
+        self.backend = backend
+        self.debounce = debounce
+        self.timeout = timeout
+        self.step = step
+        self.timing_step = timing_step
+        self.min_deviation = min_deviation
+        self.max_issues = max_issues
+        self.max_calls = max_calls
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._messages = collections.deque(maxlen=history)
+        self._status = "idle"
+        self._version = 0
+        self._pending = None       # [key, issues, details, due time] still collecting
+        self._ready = None         # Finished swing waiting for the worker
+        self._calls = []           # [deadline] of backend calls running; None once abandoned
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='coach-feedback', daemon=True)
+        self._thread.start()
+
+    def submit(self, key, issues=(), details=None):
+        """Add analysis events for one swing: (phase, joint, degrees)
+        deviations and/or a {name: seconds} dict of timings"""
+        with self._condition:
+            pending = self._pending
+            if pending is not None and pending[0] != key:
+                # A newer swing closes the previous one
+                if self._ready is not None:
+                    COACH_DROPPED.inc()
+                self._ready, pending = pending, None
+            if pending is None:
+                pending = self._pending = [key, {}, {}, 0.0]
+            for phase, joint, value in issues:
+                current = pending[1].get((phase, joint))
+                if current is None or abs(value) > abs(current):
+                    pending[1][(phase, joint)] = value
+            pending[2].update(details or {})
+            pending[3] = time.monotonic() + self.debounce
+            self._condition.notify()
+
+    def signature(self, issues, details):
+        """Quantized error signature used as the cache key"""
+        quantized = []
+        for (phase, joint), value in issues.items():
+            level = round(value / self.step) * self.step
+            if abs(level) >= self.min_deviation:
+                quantized.append((phase, joint, level))
+        quantized.sort(key=lambda item: (-abs(item[2]), item[0], item[1]))
+        step = self.timing_step
+        bucketed = tuple(sorted((name, round(float(value) / step) * step)
+                                for name, value in details.items()))
+        return tuple(quantized[:self.max_issues]), bucketed
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        return
+                    now = time.monotonic()
+                    self._expire(now)
+                    waits = [call[0] - now for call in self._calls if call[0] is not None]
+                    pending = self._pending
+                    if pending is not None:
+                        if pending[3] <= now:
+                            # A finished swing replaces one still waiting for a slot
+                            if self._ready is not None:
+                                COACH_DROPPED.inc()
+                            self._ready, self._pending = pending, None
+                        else:
+                            waits.append(pending[3] - now)
+                    request = self._ready
+                    # Cached answers need no backend call, so they never wait for a slot
+                    if request is not None and (len(self._calls) < self.max_calls or
+                                                self._signature(request) in self._cache):
+                        self._ready = None
+                        break
+                    self._condition.wait(min(waits) if waits else None)
+            key = request[0]
+            self._answer(key, *self._signature(request))
+
+    def _signature(self, request):
+        return self.signature(request[1], request[2])
+
+    def _expire(self, now):
+        """Abandon calls past their deadline (condition held)"""
+        for call in self._calls:
+            if call[0] is not None and call[0] <= now:
+                call[0] = None
+                COACH_TIMEOUTS.inc()
+                self._status = "coach timed out"
+                self._version += 1
+
+    def _answer(self, key, issues, details):
+        with self._condition:
+            cached = self._cache.get((issues, details))
+            if cached is not None:
+                self._cache.move_to_end((issues, details))
+        if cached is not None:
+            COACH_CACHED.inc()
+            self._post(key, cached, cached=True)
+            return
+        call = [time.monotonic() + self.timeout]
+        with self._condition:
+            self._calls.append(call)
+        self._set_status("thinking")
+        threading.Thread(target=self._call, args=(call, key, issues, details),
+                         name='coach-call', daemon=True).start()
+
+    def _call(self, call, key, issues, details):
+        start = time.perf_counter_ns()
+        text, error = None, None
+        try:
+            text = self.backend.respond(build_prompt(issues, details), issues, details)
+        except Exception as e:
+            error = e
+        with self._condition:
+            self._calls.remove(call)
+            abandoned = call[0] is None
+            self._condition.notify()
+        if abandoned:
+            return
+        if error is not None:
+            COACH_ERRORS.inc()
+            print(f"Coach feedback failed: {error}")
+            self._set_status("coach unavailable")
+            return
+        COACH_LATENCY.record_since(start)
+        COACH_ANSWERED.inc()
+        if text:
+            with self._condition:
+                self._cache[(issues, details)] = text
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        self._post(key, text, cached=False)
+
+    def _post(self, key, text, cached):
+        with self._condition:
+            if text:
+                self._messages.append({'key': key, 'text': text, 'cached': cached,
+                                       'time': time.time()})
+            self._status = "idle"
+            self._version += 1
+
+    def _set_status(self, status):
+        with self._condition:
+            self._status = status
+            self._version += 1
+
+    def snapshot(self):
+        """{'version', 'status', 'messages'} for the Coach Chat panel"""
+        with self._condition:
+            return {'version': self._version, 'status': self._status,
+                    'messages': list(self._messages)}
+
+    def cleanup(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout=1.0)
+
+
+def add_coach_arguments(parser):
+    parser.add_argument('--coach', choices=BACKENDS, default='off',
+                        help="coaching feedback in the Coach Chat panel: rule-based (local), "
+                             "a Gemini model or off (default off)")
+    parser.add_argument('--coach-model', default='gemini-2.0-flash',
+                        help="model used with --coach gemini")
+    parser.add_argument('--coach-timeout', type=float, default=15.0,
+                        help="seconds before a feedback request is abandoned (default 15)")
+
+
+def coach_from_args(args):
+    backend = getattr(args, 'coach', 'off')
+    if backend == 'off':
+        return None
+    if backend == 'gemini':
+        try:
+            backend = GeminiBackend(model=args.coach_model, timeout=args.coach_timeout)
+        except Exception as e:
+            print(f"Gemini coach unavailable ({e}); using local feedback")
+            backend = LocalBackend()
+    else:
+        backend = LocalBackend()
+    return CoachFeedback(backend, timeout=args.coach_timeout)
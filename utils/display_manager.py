@@ -2,8 +2,18 @@ import cv2
 import numpy as np
 import platform
 
+from utils.features import ANGLE_NAMES, POINT_NAMES
+from utils.heatmap import blend_heatmap
+from utils.reps import tempo
+
 class DisplayManager:
     def __init__(self, window_width=1280, window_height=720):
+        self.set_size(window_width, window_height)
+        self._heatmap_cache = {}
+        self._chat_cache = None     # ((version, width, height), rendered quadrant)
+
+    def set_size(self, window_width, window_height):
+        """Change the composite size (e.g. to match the widget it is shown in)"""
         self.window_width = window_width
         self.window_height = window_height
         # Adjust base font scale based on platform
@@ -13,8 +23,11 @@ class DisplayManager:
             self.base_font_scale = window_height / 500.0 * 0.75
         self.base_thickness = max(1, int(self.base_font_scale * 2))
 
-    def create_quadrant_layout(self, frame_2d, frame_3d, pose_results=None, recording_time=None):
-        """Create four-quadrant layout matching main.py"""
+    def create_quadrant_layout(self, frame_2d, frame_3d, pose_results=None, recording_time=None,
+                               analysis=None, heatmap=None, chat=None):
+        """Create four-quadrant layout matching main.py; ``heatmap`` is a
+        (colour, alpha) image blended over the camera view and ``chat`` a
+        CoachFeedback snapshot"""
         # Create base layout
         layout = np.zeros((self.window_height, self.window_width, 3), dtype=np.uint8)
         
@@ -24,18 +37,21 @@ class DisplayManager:
         # Resize frames to fit quadrants
         frame_2d = self._resize_with_aspect(frame_2d, w, h)
         frame_3d = self._resize_with_aspect(frame_3d, w, h)
+        if heatmap is not None:
+            # The resized layers are reused until the next heatmap render
+            blend_heatmap(frame_2d, heatmap, self._heatmap_cache)
         
         # Quadrant 1 (Top-Left): 2D Camera Input
         layout[0:h, 0:w] = self._pad_to_size(frame_2d, w, h)
         
         # Quadrant 2 (Top-Right): Sports Analysis
-        layout[0:h, w:w*2] = self._create_analysis_quadrant(w, h, pose_results)
+        layout[0:h, w:w*2] = self._create_analysis_quadrant(w, h, pose_results, analysis)
         
         # Quadrant 3 (Bottom-Left): 3D Pose Visualization
         layout[h:h*2, 0:w] = self._pad_to_size(frame_3d, w, h)
         
         # Quadrant 4 (Bottom-Right): Coach Chat
-        layout[h:h*2, w:w*2] = self._create_coach_chat_quadrant(w, h)
+        layout[h:h*2, w:w*2] = self._create_coach_chat_quadrant(w, h, chat)
         
         return layout
 
@@ -205,32 +221,145 @@ class DisplayManager:
     def cleanup(self):
         pass  # Just pass as we don't need to clean up windows anymore
 
-    def _create_analysis_quadrant(self, width, height, pose_results):
-        """Create analysis quadrant with basic placeholder"""
+    def _create_analysis_quadrant(self, width, height, pose_results, analysis=None):
+        """Create analysis quadrant with joint angles and wrist speeds"""
         frame = np.zeros((height, width, 3), dtype=np.uint8)
         
         # Add title
         self._add_centered_text(frame, "Sports Analysis", is_title=True, scale_factor=1.2)
         
-        # Add placeholder content
-        if pose_results and pose_results.pose_landmarks:
-            text = "Pose Detected!\nAnalysis coming soon..."
+        features = analysis.get('features') if analysis else None
+        if features is not None:
+            self._draw_feature_table(frame, features, analysis.get('swing'),
+                                     analysis.get('comparison'), analysis.get('reps'))
+        elif pose_results and pose_results.pose_landmarks:
+            self._add_centered_text(frame, "Pose Detected!", scale_factor=0.8, color=(200, 200, 200))
         else:
-            text = "Waiting for pose..."
-            
-        self._add_centered_text(frame, text, scale_factor=0.8, color=(200, 200, 200))
+            self._add_centered_text(frame, "Waiting for pose...", scale_factor=0.8, color=(200, 200, 200))
         
         return frame
 
-    def _create_coach_chat_quadrant(self, width, height):
-        """Create coach chat quadrant with basic placeholder"""
+    def _draw_feature_table(self, frame, features, swing=None, comparison=None, reps=None):
+        """Left/right joint angles, trunk rotation, wrist speeds, swing phase,
+        the largest deviation from the matched expert swing and, once a
+        workout rep is under way, the rep count and tempo"""
+        angles = dict(zip(ANGLE_NAMES, features['angles']))
+        speeds = dict(zip(POINT_NAMES, features['speed']))
+        font_scale = self.base_font_scale * 0.6
+        thickness = max(1, self.base_thickness // 2)
+        (_, text_height), _ = cv2.getTextSize("Ag", cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        height, width = frame.shape[:2]
+        columns = (width // 10, width // 2, width * 3 // 4)
+        y = max(int(height * 0.35), text_height + 100)
+        # Squeeze the rows together when the swing, comparison and rep rows are shown
+        show_reps = reps is not None and reps['active']
+        rows = 7 + (2 if swing is not None else 0) + (1 if comparison is not None else 0) + \
+            (2 if show_reps else 0)
+        line_height = min(int(text_height * 1.8), (height - text_height - y) // (rows - 1))
+
+        def row(cells, color=(220, 220, 220)):
+            nonlocal y
+            for x, text in zip(columns, cells):
+                cv2.putText(frame, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX,
+                            font_scale, color, thickness)
+            y += line_height
+
+        def number(value, spec):
+            # Hershey fonts are ASCII only, so missing values show as "--"
+            return "--" if not np.isfinite(value) else format(value, spec)
+
+        def degrees(value):
+            return number(value, '.0f')
+
+        row(("", "Left", "Right"), color=(0, 255, 255))
+        for joint in ('elbow', 'shoulder', 'hip', 'knee'):
+            row((joint.capitalize(), degrees(angles['left_' + joint]),
+                 degrees(angles['right_' + joint])))
+        row(("Wrist m/s", number(speeds['left_wrist'], '.1f'), number(speeds['right_wrist'], '.1f')))
+        row(("Trunk rot.", degrees(angles['trunk_rotation']), ""))
+
+        if swing is not None:
+            phase = swing['phase'].replace('_', ' ').capitalize()
+            color = (200, 200, 200) if swing['phase'] == 'idle' else (0, 165, 255)
+            row(("Phase", phase, ""), color=color)
+            last = swing['last_swing'] or {}
+            row((f"Swings: {swing['swings']}",
+                 f"Back {last['backswing']:.2f}s" if 'backswing' in last else "",
+                 f"Fwd {last['forward_swing']:.2f}s" if 'forward_swing' in last else ""))
+
+        if comparison is not None:
+            worst = comparison.worst(1)
+            deviation, phase = "--", ""
+            if worst:
+                phase, joint, value = worst[0]
+                side, _, name = joint.partition('_')
+                joint = f"{side[0].upper()} {name}" if side in ('left', 'right') else "Trunk rot."
+                deviation = f"{joint} {number(value, '+.0f')}"
+            row((f"vs {comparison.reference['name'][:10]}", deviation,
+                 phase.replace('_', ' ')), color=(255, 200, 0))
+
+        if show_reps:
+            last = reps['last_rep']
+            row((f"Reps: {reps['reps']}", reps['phase'].capitalize(),
+                 f"ROM {last['rom']:.0f}" if last else ""), color=(0, 255, 128))
+            row(("Tempo", tempo(last) + "s" if last else "--",
+                 f"TUT {reps['time_under_tension']:.0f}s"), color=(0, 255, 128))
+
+    def _create_coach_chat_quadrant(self, width, height, chat=None):
+        """Create coach chat quadrant: the latest feedback, newest first, or
+        a placeholder without a coach. Re-rendered only when the feed changes."""
+        key = (chat['version'], width, height) if chat is not None else None
+        if key is not None and self._chat_cache is not None and self._chat_cache[0] == key:
+            return self._chat_cache[1]
+
         frame = np.zeros((height, width, 3), dtype=np.uint8)
         
         # Add title
         self._add_centered_text(frame, "Coach Chat", is_title=True, scale_factor=1.2)
         
-        # Add placeholder content
-        self._add_centered_text(frame, "Chat features coming soon...", 
-                              scale_factor=0.8, color=(200, 200, 200))
-        
-        return frame
\ No newline at end of file
+        if chat is None:
+            # Add placeholder content
+            self._add_centered_text(frame, "Chat features coming soon...", 
+                                  scale_factor=0.8, color=(200, 200, 200))
+            return frame
+
+        if not chat['messages']:
+            self._add_centered_text(frame, "Finish a swing for feedback",
+                                    scale_factor=0.8, color=(200, 200, 200))
+        else:
+            self._draw_chat_messages(frame, chat['messages'])
+        if chat['status'] != 'idle':
+            cv2.putText(frame, chat['status'].capitalize() + "...", (width // 10, height - 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, self.base_font_scale * 0.5, (160, 160, 160),
+                        max(1, self.base_thickness // 2))
+        self._chat_cache = (key, frame)
+        return frame
+
+    def _draw_chat_messages(self, frame, messages):
+        """Word-wrapped messages below the title, newest first"""
+        font_scale = self.base_font_scale * 0.6
+        thickness = max(1, self.base_thickness // 2)
+        (_, text_height), _ = cv2.getTextSize("Ag", cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        height, width = frame.shape[:2]
+        x, max_width = width // 10, width * 8 // 10
+        y = max(int(height * 0.35), text_height + 100)
+        line_height = int(text_height * 1.8)
+        for index, message in enumerate(reversed(messages)):
+            color = (255, 255, 255) if index == 0 else (150, 150, 150)
+            words, line = message['text'].split(), ""
+            lines = []
+            for word in words:
+                candidate = f"{line} {word}".strip()
+                if line and cv2.getTextSize(candidate, cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                                            thickness)[0][0] > max_width:
+                    lines.append(line)
+                    candidate = word
+                line = candidate
+            lines.append(line)
+            for text in lines:
+                if y > height - 2 * line_height:
+                    return
+                cv2.putText(frame, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, color,
+                            thickness)
+                y += line_height
+            y += line_height // 2
\ No newline at end of file
@@ -0,0 +1,185 @@
+import numpy as np
+
+from utils.landmarks import landmarks_to_array
+
+# Angle at the middle landmark of each triple (MediaPipe Pose indices)
+ANGLE_JOINTS = {
+    'left_elbow': (11, 13, 15),
+    'right_elbow': (12, 14, 16),
+    'left_shoulder': (23, 11, 13),
+    'right_shoulder': (24, 12, 14),
+    'left_hip': (11, 23, 25),
+    'right_hip': (12, 24, 26),
+    'left_knee': (23, 25, 27),
+    'right_knee': (24, 26, 28),
+}
+ANGLE_NAMES = tuple(ANGLE_JOINTS) + ('trunk_rotation',)
+
+# Landmarks whose velocity and acceleration are tracked
+TRACKED_POINTS = {
+    'left_wrist': 15,
+    'right_wrist': 16,
+    'left_elbow': 13,
+    'right_elbow': 14,
+    'left_shoulder': 11,
+    'right_shoulder': 12,
+    'left_hip': 23,
+    'right_hip': 24,
+}
+POINT_NAMES = tuple(TRACKED_POINTS)
+
+_A, _B, _C = (np.array(idx) for idx in zip(*ANGLE_JOINTS.values()))
+_TRACKED = np.array(list(TRACKED_POINTS.values()))
+
+
+def _as_points(world):
+    """(…, 33, 3) float array from a landmark list or an array with >= 3 columns"""
+    if hasattr(world, 'landmark'):
+        world = landmarks_to_array(world)
+    return np.asarray(world, dtype=np.float32)[..., :3]
+
+
+def joint_angles(points):
+    """Joint angles in degrees for (..., 33, 3) world points -> (..., 9).
+
+    The last column is trunk rotation: the signed angle between the
+    shoulder line and the hip line seen from above (x-z plane)."""
+    u = points[..., _A, :] - points[..., _B, :]
+    v = points[..., _C, :] - points[..., _B, :]
+    dot = np.einsum('...ij,...ij->...i', u, v)
+    norms = np.linalg.norm(u, axis=-1) * np.linalg.norm(v, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cosine = np.clip(dot / norms, -1.0, 1.0)
+    angles = np.degrees(np.arccos(cosine))
+
+    shoulders = points[..., 12, :] - points[..., 11, :]
+    hips = points[..., 24, :] - points[..., 23, :]
+    rotation = np.degrees(np.arctan2(shoulders[..., 2], shoulders[..., 0]) -
+                          np.arctan2(hips[..., 2], hips[..., 0]))
+    rotation = (rotation + 180.0) % 360.0 - 180.0
+    return np.concatenate([angles, rotation[..., None]], axis=-1).astype(np.float32)
+
+
+def _angle_difference(difference):
+    """Wrap trunk rotation differences (last column) into [-180, 180)"""
+    difference = difference.copy()
+    difference[..., -1] = (difference[..., -1] + 180.0) % 360.0 - 180.0
+    return difference
+
+
+def _backward_difference(values, timestamps, wrap=False):
+    """Derivative of (T, ...) ``values`` from each frame to the previous
+    one; zero on the first frame and wherever time does not advance.
+    ``wrap`` wraps trunk rotation differences as ``_angle_difference``."""
+    difference = np.diff(values, axis=0)
+    if wrap:
+        difference = _angle_difference(difference)
+    dt = np.diff(timestamps).reshape((-1,) + (1,) * (values.ndim - 1))
+    derivative = np.zeros(values.shape, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        derivative[1:] = np.where(dt > 0, difference / dt, 0.0)
+    return derivative
+
+
+def compute_features(world, timestamps=None, fps=30.0):
+    """Features for one frame (33, >=3) or a whole sequence (T, 33, >=3).
+
+    Derivatives are backward differences over ``timestamps`` (or a uniform
+    ``fps`` grid), exactly as ``FeatureEngine`` computes them while
+    streaming; frames without a pose should be NaN and stay NaN.
+    Returns a dict of arrays with a leading T axis (dropped for one frame):
+    angles / angle_velocity (T, 9) in degrees and degrees per second,
+    velocity / acceleration (T, 8, 3) and speed / acceleration_magnitude
+    (T, 8) in metres and seconds.
+    """
+    points = _as_points(world)
+    single = points.ndim == 2
+    if single:
+        points = points[None]
+    count = points.shape[0]
+    if timestamps is None:
+        timestamps = np.arange(count, dtype=np.float64) / fps
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+
+    angles = joint_angles(points)
+    tracked = points[:, _TRACKED, :]
+    angle_velocity = _backward_difference(angles, timestamps, wrap=True)
+    velocity = _backward_difference(tracked, timestamps)
+    # Change between consecutive velocities over the mean of their time
+    # steps, from the third frame on
+    acceleration = np.zeros(tracked.shape, dtype=np.float64)
+    if count >= 3:
+        dt = np.diff(timestamps)[:, None, None]
+        steps = (dt[1:] + dt[:-1]) / 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            acceleration[2:] = np.where((dt[1:] > 0) & (dt[:-1] > 0),
+                                        np.diff(velocity[1:], axis=0) / steps, 0.0)
+
+    features = {
+        'timestamp': timestamps,
+        'angles': angles,
+        'angle_velocity': angle_velocity.astype(np.float32),
+        'velocity': velocity.astype(np.float32),
+        'speed': np.linalg.norm(velocity, axis=-1).astype(np.float32),
+        'acceleration': acceleration.astype(np.float32),
+        'acceleration_magnitude': np.linalg.norm(acceleration, axis=-1).astype(np.float32),
+    }
+    if single:
+        features = {name: value[0] for name, value in features.items()}
+    return features
+
+
+class FeatureEngine:
+    """Streaming counterpart of ``compute_features``: constant work per
+    frame, with the same backward differences over a three-frame ring
+    buffer."""
+
+    def __init__(self):
+        self._points = np.zeros((3, len(_TRACKED), 3), dtype=np.float32)
+        self._angles = np.zeros((3, len(ANGLE_NAMES)), dtype=np.float32)
+        self._times = np.zeros(3, dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+        self._count = 0
+        self._head = -1
+        self.features = None
+
+    def update(self, world, timestamp):
+        """Add one frame of world landmarks (a landmark list or a (33, >=3)
+        array); returns that frame's features"""
+        points = _as_points(world)
+        self._head = (self._head + 1) % 3
+        head = self._head
+        self._points[head] = points[_TRACKED]
+        self._angles[head] = joint_angles(points)
+        self._times[head] = timestamp
+        self._count += 1
+
+        velocity = np.zeros((len(_TRACKED), 3), dtype=np.float32)
+        acceleration = np.zeros_like(velocity)
+        angle_velocity = np.zeros(len(ANGLE_NAMES), dtype=np.float32)
+        if self._count >= 2:
+            prev = (head - 1) % 3
+            dt = self._times[head] - self._times[prev]
+            if dt > 0:
+                velocity = (self._points[head] - self._points[prev]) / dt
+                angle_velocity = _angle_difference(
+                    self._angles[head] - self._angles[prev]) / dt
+                if self._count >= 3:
+                    before = (head - 2) % 3
+                    dt_prev = self._times[prev] - self._times[before]
+                    if dt_prev > 0:
+                        prev_velocity = (self._points[prev] - self._points[before]) / dt_prev
+                        acceleration = (velocity - prev_velocity) / ((dt + dt_prev) / 2)
+
+        self.features = {
+            'timestamp': timestamp,
+            'angles': self._angles[head].copy(),
+            'angle_velocity': angle_velocity,
+            'velocity': velocity,
+            'speed': np.linalg.norm(velocity, axis=-1),
+            'acceleration': acceleration,
+            'acceleration_magnitude': np.linalg.norm(acceleration, axis=-1),
+        }
+        return self.features
@@ -0,0 +1,471 @@
+import glob
+import os
+import platform
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+
+class FramePacket:
+    """A captured frame with its capture timestamp and sequence index"""
+    __slots__ = ('frame', 'timestamp', 'index')
+
+    def __init__(self, frame, timestamp, index):
+        self.frame = frame
+        self.timestamp = timestamp  # time.perf_counter() seconds at capture
+        self.index = index
+
+
+class FrameSource:
+    """Base class for everything the pipelines can read frames from.
+
+    Subclasses implement ``_read_frame`` returning ``(ok, frame)``. The base
+    class adds capture timestamps, optional background prefetch and a
+    ``cv2.VideoCapture``-compatible surface (``read``, ``get``,
+    ``isOpened``, ``release``) so existing loops keep working.
+
+    With ``prefetch > 0`` a reader thread keeps up to that many frames
+    queued. Live sources set ``drop_stale`` so the queue always holds the
+    newest frames rather than building latency.
+    """
+
+    drop_stale = False
+    retry_interval = 0.01   # Seconds between reads while a live source has no frame
+    read_timeout = 5.0      # Seconds without a frame before iteration gives up
+
+    def __init__(self, prefetch=0):
+        self.prefetch = prefetch
+        self.fps = 30.0
+        self.width = 0
+        self.height = 0
+        self.frame_index = 0
+        self.last_timestamp = None
+        self.exhausted = False
+        self._queue = None
+        self._reader = None
+        self._stop = threading.Event()
+
+    # --- subclass hooks -------------------------------------------------
+
+    def _read_frame(self):
+        raise NotImplementedError
+
+    def _rewind(self):
+        """Restart the source from the beginning (or reopen a device)"""
+
+    def _close(self):
+        pass
+
+    # --- public API -----------------------------------------------------
+
+    def read_packet(self):
+        """Return the next FramePacket, or None when no frame is available"""
+        if self.prefetch > 0:
+            packet = self._next_prefetched()
+            if packet is None:
+                self.exhausted = True
+                return None
+        else:
+            packet = self._capture()
+            if packet is None:
+                return None
+        self.last_timestamp = packet.timestamp
+        return packet
+
+    def read(self):
+        """cv2.VideoCapture-style read returning (ret, frame)"""
+        packet = self.read_packet()
+        if packet is None:
+            return False, None
+        return True, packet.frame
+
+    def __iter__(self):
+        failing_since = None
+        while True:
+            packet = self.read_packet()
+            if packet is not None:
+                failing_since = None
+                yield packet
+                continue
+            if self.exhausted:
+                return
+            # A live source without a frame (e.g. a camera being reopened):
+            # back off instead of spinning, and stop if it never recovers
+            now = time.perf_counter()
+            if failing_since is None:
+                failing_since = now
+            elif now - failing_since > self.read_timeout:
+                print(f"No frames from {type(self).__name__} for {self.read_timeout:.0f}s, stopping")
+                self.exhausted = True
+                return
+            time.sleep(self.retry_interval)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.frame_index
+        return 0
+
+    def isOpened(self):
+        return not self.exhausted
+
+    def reset(self):
+        """Restart from the first frame (reopens cameras)"""
+        self._stop_reader()
+        self._rewind()
+        self.frame_index = 0
+        self.exhausted = False
+
+    def release(self):
+        self._stop_reader()
+        self._close()
+
+    # --- internals ------------------------------------------------------
+
+    def _capture(self):
+        ok, frame = self._read_frame()
+        if not ok or frame is None:
+            return None
+        packet = FramePacket(frame, time.perf_counter(), self.frame_index)
+        self.frame_index += 1
+        return packet
+
+    def _next_prefetched(self):
+        # Poll so a reset() from another thread (which swaps the queue) or a
+        # finished reader never leaves the consumer blocked forever
+        while True:
+            self._ensure_reader()
+            q, reader = self._queue, self._reader
+            if q is None:
+                continue
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if reader is not None and not reader.is_alive() and q is self._queue:
+                    return None
+
+    def _ensure_reader(self):
+        if self._reader is not None:
+            return
+        self._stop.clear()
+        self._queue = queue.Queue(maxsize=self.prefetch)
+        self._reader = threading.Thread(target=self._reader_loop, daemon=True,
+                                        name=f"{type(self).__name__}-prefetch")
+        self._reader.start()
+
+    def _reader_loop(self):
+        while not self._stop.is_set():
+            packet = self._capture()
+            if packet is None and not self.drop_stale:
+                self._queue.put(None)  # End of stream marker
+                return
+            if packet is None:
+                time.sleep(0.001)
+                continue
+            if self.drop_stale:
+                # Keep only the newest frames for live sources
+                while True:
+                    try:
+                        self._queue.put_nowait(packet)
+                        break
+                    except queue.Full:
+                        try:
+                            self._queue.get_nowait()
+                        except queue.Empty:
+                            pass
+            else:
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(packet, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+
+    def _stop_reader(self):
+        if self._reader is None:
+            return
+        self._stop.set()
+        # Unblock a reader waiting on a full queue
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self._reader.join(timeout=1.0)
+        self._reader = None
+        self._queue = None
+
+
+class _Pacer:
+    """Sleeps so frames are delivered no faster than the source FPS"""
+
+    def __init__(self, fps, enabled):
+        self.interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self.enabled = enabled and self.interval > 0
+        self.next_time = None
+
+    def wait(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.next_time is None or now - self.next_time > 1.0:
+            # First frame, or we fell far behind: re-anchor instead of bursting
+            self.next_time = now
+        elif self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time += self.interval
+
+    def reset(self):
+        self.next_time = None
+
+
+class CameraSource(FrameSource):
+    """Live camera with the platform-specific settings main.py used"""
+
+    drop_stale = True
+
+    def __init__(self, camera_id=0, width=1280, height=720, fps=30, prefetch=0):
+        super().__init__(prefetch)
+        self.camera_id = camera_id
+        self.requested = (width, height, fps)
+        self.cap = None
+        self._open()
+
+    def _open(self):
+        system = platform.system()
+        camera_id = self.camera_id
+        if system == "Darwin":  # macOS
+            # Try to use AVFOUNDATION backend specifically
+            cap = cv2.VideoCapture(camera_id, cv2.CAP_AVFOUNDATION)
+            if cap.isOpened():
+                # Set Mac-specific camera properties
+                width, height, fps = self.requested
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+                cap.set(cv2.CAP_PROP_FPS, fps)
+        else:
+            cap = cv2.VideoCapture(camera_id)
+            if not cap.isOpened() and system == "Windows":
+                camera_id = 1
+                cap = cv2.VideoCapture(camera_id)
+
+        if not cap.isOpened():
+            raise Exception("Could not open camera")
+
+        self.cap = cap
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or float(self.requested[2])
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def _read_frame(self):
+        cap = self.cap
+        if cap is None:  # Being reopened by reset()
+            return False, None
+        return cap.read()
+
+    def _rewind(self):
+        self._close()
+        self._open()
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def _close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class VideoFileSource(FrameSource):
+    """Video file, either paced to its native FPS or as fast as possible"""
+
+    def __init__(self, path, realtime=True, loop=False, prefetch=0):
+        super().__init__(prefetch)
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise Exception(f"Could not open video: {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.pacer = _Pacer(self.fps, realtime)
+
+    def _read_frame(self):
+        self.pacer.wait()
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if not ret:
+            self.exhausted = True
+        return ret, frame
+
+    def seek(self, frame_index):
+        """Jump to a frame index (only valid without prefetch)"""
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        self.frame_index = frame_index
+        self.exhausted = False
+        self.pacer.reset()
+
+    def _rewind(self):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.pacer.reset()
+
+    def _close(self):
+        self.cap.release()
+
+
+class ImageDirectorySource(FrameSource):
+    """Sorted image files in a directory played back as a video"""
+
+    def __init__(self, path, fps=30.0, realtime=False, loop=False, prefetch=0):
+        super().__init__(prefetch)
+        self.path = path
+        self.loop = loop
+        self.files = sorted(
+            f for f in glob.glob(os.path.join(path, '*'))
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.files:
+            raise Exception(f"No images found in {path}")
+        self.fps = fps
+        first = cv2.imread(self.files[0])
+        if first is None:
+            raise Exception(f"Could not read image: {self.files[0]}")
+        self.height, self.width = first.shape[:2]
+        self.position = 0
+        self.pacer = _Pacer(fps, realtime)
+
+    def _read_frame(self):
+        if self.position >= len(self.files):
+            if not self.loop:
+                self.exhausted = True
+                return False, None
+            self.position = 0
+        self.pacer.wait()
+        frame = cv2.imread(self.files[self.position])
+        self.position += 1
+        return frame is not None, frame
+
+    def _rewind(self):
+        self.position = 0
+        self.pacer.reset()
+
+
+class SyntheticSource(FrameSource):
+    """Deterministic generated frames for benchmarks and tests.
+
+    Patterns: ``moving_bar`` (a bright bar sweeping over a gradient),
+    ``checker`` (scrolling checkerboard) and ``noise`` (seeded noise).
+    """
+
+    PATTERNS = ('moving_bar', 'checker', 'noise')
+
+    def __init__(self, width=1280, height=720, fps=30.0, pattern='moving_bar',
+                 frames=None, realtime=False, seed=0, prefetch=0):
+        super().__init__(prefetch)
+        if pattern not in self.PATTERNS:
+            raise ValueError(f"Unknown synthetic pattern: {pattern}")
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.pattern = pattern
+        self.max_frames = frames
+        self.seed = seed
+        self.position = 0
+        self.pacer = _Pacer(fps, realtime)
+        self.rng = np.random.default_rng(seed)
+        # Static background built once; frames are derived from it
+        ramp = np.linspace(40, 200, width, dtype=np.float32)
+        self.background = np.repeat(ramp[None, :], height, axis=0).astype(np.uint8)
+
+    def _read_frame(self):
+        if self.max_frames is not None and self.position >= self.max_frames:
+            self.exhausted = True
+            return False, None
+        self.pacer.wait()
+        t = self.position
+        self.position += 1
+
+        if self.pattern == 'noise':
+            frame = self.rng.integers(0, 256, (self.height, self.width, 3), dtype=np.uint8)
+        elif self.pattern == 'checker':
+            cell = max(8, self.height // 12)
+            ys, xs = np.indices((self.height, self.width))
+            mask = (((xs + t * 4) // cell + ys // cell) % 2).astype(np.uint8)
+            gray = mask * 180 + 40
+            frame = cv2.cvtColor(gray.astype(np.uint8), cv2.COLOR_GRAY2BGR)
+        else:
+            frame = cv2.cvtColor(self.background, cv2.COLOR_GRAY2BGR)
+            bar_width = max(4, self.width // 20)
+            x = (t * max(1, self.width // int(self.fps * 2))) % self.width
+            frame[:, x:x + bar_width] = (255, 255, 255)
+            cv2.putText(frame, f"{t}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX,
+                        1.0, (0, 0, 255), 2)
+        return True, frame
+
+    def _rewind(self):
+        self.position = 0
+        self.rng = np.random.default_rng(self.seed)
+        self.pacer.reset()
+
+
+def open_source(spec=None, realtime=True, loop=False, prefetch=0):
+    """Create a frame source from a command line spec.
+
+    ``spec`` may be a camera index (``0``), ``camera:<index>``, a video
+    file, a directory of images, or ``synthetic[:WIDTHxHEIGHT[:PATTERN]]``.
+    ``realtime`` paces files to their native FPS; pass False to read them
+    as fast as possible.
+    """
+    if spec is None or spec == '':
+        return CameraSource(0, prefetch=prefetch)
+    spec = str(spec)
+    if spec.isdigit():
+        return CameraSource(int(spec), prefetch=prefetch)
+    if spec.startswith('camera:'):
+        return CameraSource(int(spec.split(':', 1)[1]), prefetch=prefetch)
+    if spec.startswith('synthetic'):
+        parts = spec.split(':')
+        width, height, pattern = 1280, 720, 'moving_bar'
+        if len(parts) > 1 and parts[1]:
+            width, height = (int(v) for v in parts[1].lower().split('x'))
+        if len(parts) > 2 and parts[2]:
+            pattern = parts[2]
+        return SyntheticSource(width, height, pattern=pattern, realtime=realtime,
+                               prefetch=prefetch)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, realtime=realtime, loop=loop, prefetch=prefetch)
+    if os.path.exists(spec):
+        return VideoFileSource(spec, realtime=realtime, loop=loop, prefetch=prefetch)
+    raise Exception(f"Unknown frame source: {spec}")
+
+
+def add_source_arguments(parser):
+    """Add the shared --source/--fast/--loop/--prefetch options to a parser"""
+    parser.add_argument('--source', default=None,
+                        help="camera index, video file, image directory or "
+                             "synthetic[:WxH[:pattern]] (default: camera 0)")
+    parser.add_argument('--fast', action='store_true',
+                        help="read files as fast as possible instead of at their native FPS")
+    parser.add_argument('--loop', action='store_true', help="loop file and image sources")
+    parser.add_argument('--prefetch', type=int, default=0, metavar='N',
+                        help="read up to N frames ahead on a background thread")
+    return parser
+
+
+def source_from_args(args):
+    return open_source(args.source, realtime=not args.fast, loop=args.loop,
+                       prefetch=args.prefetch)
@@ -0,0 +1,187 @@
+import cv2
+import numpy as np
+
+# Wrists and ankles: where the hands and feet spent time
+HEATMAP_LANDMARKS = (15, 16, 27, 28)
+
+
+class MotionHeatmap:
+    """Decaying heatmap of selected landmarks on a low-resolution float32
+    grid covering the image.
+
+    Every update decays the grid in place (half-life ``half_life`` seconds)
+    and splats each visible landmark bilinearly into its four neighbouring
+    cells, weighted by the time since the previous update, so held poses
+    keep accumulating. The splat works in buffers sized for ``landmarks``
+    at construction, so updates allocate no arrays. Blurring and colouring happen in ``image`` at most
+    every ``render_interval`` seconds; between renders the previous image is
+    returned unchanged.
+    """
+
+    def __init__(self, grid_size=(96, 54), landmarks=HEATMAP_LANDMARKS, half_life=10.0,
+                 sigma=1.5, min_visibility=0.5, render_interval=0.25, max_alpha=0.6,
+                 max_step=0.1):
+        self.width, self.height = grid_size
+        self.landmarks = np.asarray(landmarks)
+        self.half_life = half_life
+        self.sigma = sigma
+        self.min_visibility = min_visibility
+        self.render_interval = render_interval
+        self.max_alpha = max_alpha
+        self.max_step = max_step    # Longest gap credited to one update (s)
+        self.grid = np.zeros((self.height, self.width), dtype=np.float32)
+        self._flat = self.grid.reshape(-1)
+        # Per-update splat buffers (invisible landmarks get zero weight)
+        count = len(self.landmarks)
+        self._points = np.empty((count, 3), dtype=np.float32)     # x, y, visibility
+        self._visible = np.empty(count, dtype=bool)
+        self._coords = np.empty((2, count), dtype=np.float32)     # Grid x, y
+        self._corner = np.empty((2, count), dtype=np.int64)       # Top-left cell x, y
+        self._fraction = np.empty((2, count), dtype=np.float32)
+        self._cells = np.empty((4, count), dtype=np.int64)
+        self._weights = np.empty((4, count), dtype=np.float32)
+        self.clear()
+
+    def clear(self):
+        self.grid.fill(0.0)
+        self._last_time = None
+        self._rendered = None
+        self._render_time = None
+
+    def update(self, results, timestamp):
+        """Decay, then splat the landmarks of a pose result (or None)"""
+        dt = 0.0 if self._last_time is None else min(max(timestamp - self._last_time, 0.0),
+                                                     self.max_step)
+        self._last_time = timestamp
+        if dt > 0:
+            self.grid *= np.float32(0.5 ** (dt / self.half_life))
+        landmarks = getattr(results, 'pose_landmarks', None)
+        if not landmarks or dt <= 0:
+            return
+        for row, i in zip(self._points, self.landmarks):
+            lm = landmarks.landmark[i]
+            row[0], row[1], row[2] = lm.x, lm.y, lm.visibility
+        np.greater_equal(self._points[:, 2], self.min_visibility, out=self._visible)
+        if self._visible.any():
+            self._splat(dt)
+
+    def _splat(self, weight):
+        """Bilinear splat of the visible ``_points`` into the grid, in place
+        (the same weights as ``_bilinear``)"""
+        x, y = self._coords
+        x0, y0 = self._corner
+        fx, fy = self._fraction
+        for coord, corner, fraction, column, size in ((x, x0, fx, 0, self.width),
+                                                      (y, y0, fy, 1, self.height)):
+            np.multiply(self._points[:, column], size, out=coord)
+            coord -= 0.5
+            np.clip(coord, 0, size - 1, out=coord)
+            np.copyto(corner, coord, casting='unsafe')
+            np.minimum(corner, size - 2, out=corner)
+            np.subtract(coord, corner, out=fraction)
+
+        cells = self._cells
+        np.multiply(y0, self.width, out=cells[0])
+        cells[0] += x0
+        np.add(cells[0], 1, out=cells[1])
+        np.add(cells[0], self.width, out=cells[2])
+        np.add(cells[2], 1, out=cells[3])
+
+        weights = self._weights
+        np.subtract(1, fy, out=weights[0])
+        np.multiply(fx, weights[0], out=weights[1])       # fx (1 - fy)
+        weights[0] -= weights[1]                          # (1 - fx)(1 - fy)
+        np.multiply(fx, fy, out=weights[3])               # fx fy
+        np.subtract(fy, weights[3], out=weights[2])       # (1 - fx) fy
+        weights *= self._visible
+        weights *= np.float32(weight)
+        np.add.at(self._flat, cells.reshape(-1), weights.reshape(-1))
+
+    def image(self, timestamp=None):
+        """(colour BGR uint8, alpha uint8) at grid resolution, re-rendered at
+        most every ``render_interval`` seconds; None before any heat"""
+        if self._rendered is not None and timestamp is not None and \
+                timestamp - self._render_time < self.render_interval:
+            return self._rendered
+        self._render_time = timestamp if timestamp is not None else 0.0
+        self._rendered = render_heatmap(self.grid, self.sigma, self.max_alpha)
+        return self._rendered
+
+
+def _bilinear(points, width, height, weight):
+    """Flat cell indices and weights of a bilinear splat: (4N,), (4N,)"""
+    x = np.clip(points[:, 0] * width - 0.5, 0, width - 1)
+    y = np.clip(points[:, 1] * height - 0.5, 0, height - 1)
+    x0 = np.minimum(x.astype(np.int64), width - 2)
+    y0 = np.minimum(y.astype(np.int64), height - 2)
+    fx, fy = x - x0, y - y0
+    cells = np.concatenate([y0 * width + x0, y0 * width + x0 + 1,
+                            (y0 + 1) * width + x0, (y0 + 1) * width + x0 + 1])
+    weight = np.broadcast_to(np.asarray(weight, dtype=np.float32), fx.shape)
+    weights = np.concatenate([(1 - fx) * (1 - fy), fx * (1 - fy),
+                              (1 - fx) * fy, fx * fy]) * np.tile(weight, 4)
+    return cells, weights.astype(np.float32)
+
+
+def render_heatmap(grid, sigma=1.5, max_alpha=0.6):
+    """Blur and colour a heat grid: (colour BGR uint8, alpha uint8), or None
+    while the grid is empty. Heat is scaled to its 99th percentile."""
+    heat = cv2.GaussianBlur(grid, (0, 0), sigma) if sigma else grid
+    peak = float(np.percentile(heat, 99)) or float(heat.max())
+    if peak <= 0:
+        return None
+    level = np.clip(heat * (255.0 / peak), 0, 255).astype(np.uint8)
+    colour = cv2.applyColorMap(level, cv2.COLORMAP_INFERNO)
+    alpha = (level.astype(np.float32) * max_alpha).astype(np.uint8)
+    return colour, alpha
+
+
+def blend_heatmap(frame, heatmap, cache=None):
+    """Blend a (colour, alpha) heatmap over a BGR frame in place.
+
+    The resized, premultiplied layers are kept in ``cache`` (a dict) while
+    the same heatmap and frame size come in, so a reused heatmap costs one
+    multiply and one add per frame."""
+    if heatmap is None:
+        return frame
+    h, w = frame.shape[:2]
+    cached = cache.get('layers') if cache is not None else None
+    if cached is not None and cached[0] is heatmap and cached[1] == (w, h):
+        _, _, premultiplied, keep = cached
+    else:
+        colour, alpha = heatmap
+        colour = cv2.resize(colour, (w, h), interpolation=cv2.INTER_LINEAR)
+        alpha = cv2.resize(alpha, (w, h), interpolation=cv2.INTER_LINEAR)
+        alpha = cv2.cvtColor(alpha, cv2.COLOR_GRAY2BGR)
+        premultiplied = cv2.multiply(colour, alpha, scale=1.0 / 255)
+        keep = cv2.bitwise_not(alpha)
+        if cache is not None:
+            cache['layers'] = (heatmap, (w, h), premultiplied, keep)
+    cv2.add(cv2.multiply(frame, keep, scale=1.0 / 255), premultiplied, dst=frame)
+    return frame
+
+
+def session_heatmap(landmarks, timestamps, grid_size=(96, 54), landmark_ids=HEATMAP_LANDMARKS,
+                    min_visibility=0.5, half_life=None, max_step=0.1):
+    """Whole-session heat grid from a (T, 33, 4) landmark log in one
+    vectorized pass. Each frame is weighted by the time until the next one
+    (capped at ``max_step``); with ``half_life`` older frames count less, as
+    they would in the live heatmap at the end of the session. Frames with
+    NaN landmarks are skipped. Blur it with ``render_heatmap``."""
+    width, height = grid_size
+    grid = np.zeros(height * width, dtype=np.float64)
+    landmarks = np.asarray(landmarks, dtype=np.float32)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) < 2:
+        return grid.reshape(height, width).astype(np.float32)
+    weight = np.minimum(np.diff(timestamps), max_step)
+    weight = np.append(weight, np.median(weight))
+    if half_life:
+        weight = weight * 0.5 ** ((timestamps[-1] - timestamps) / half_life)
+
+    points = landmarks[:, list(landmark_ids)]                  # (T, K, 4)
+    weights = np.broadcast_to(weight[:, None], points.shape[:2])
+    visible = np.isfinite(points).all(axis=2) & (points[..., 3] >= min_visibility)
+    cells, splat = _bilinear(points[visible][:, :2], width, height, weights[visible])
+    grid += np.bincount(cells, weights=splat, minlength=grid.size)
+    return grid.reshape(height, width).astype(np.float32)
@@ -0,0 +1,177 @@
+import cv2
+import numpy as np
+
+from utils.landmarks import (PoseResults, copy_landmarks, landmarks_to_array,
+                             write_landmarks)
+from utils.letterbox import shrink
+from utils.metrics import METRICS
+
+LK_PARAMS = dict(
+    winSize=(15, 15),
+    maxLevel=2,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+)
+
+
+def flow_gray(frame, width=320):
+    """Small grayscale copy of a BGR frame for optical flow"""
+    h, w = frame.shape[:2]
+    if w > width:
+        frame = shrink(frame, width, max(1, int(round(h * width / w))))
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+class KeyframePropagator:
+    """Runs MediaPipe only on keyframes and moves the landmarks in between
+    with pyramidal Lucas-Kanade optical flow on a small grayscale image.
+
+    A keyframe is due every ``interval`` frames, and is forced early when
+    the flow drifts: too few points pass the forward-backward check, or the
+    pose's extent changes by more than ``max_scale_change`` since the
+    keyframe. Poses with mean visibility below ``min_confidence`` are not
+    propagated at all. World landmarks are extrapolated with a velocity
+    estimate smoothed over the keyframes (``velocity_smoothing`` is the
+    weight of the newest keyframe step), so one noisy keyframe does not
+    throw the skeleton off.
+    """
+
+    def __init__(self, interval=4, flow_width=320, max_fb_error=1.5, min_tracked=0.7,
+                 max_scale_change=0.25, min_confidence=0.5, min_visibility=0.5,
+                 max_extrapolation=0.25, velocity_smoothing=0.5):
+        self.interval = interval
+        self.flow_width = flow_width
+        self.max_fb_error = max_fb_error
+        self.min_tracked = min_tracked
+        self.max_scale_change = max_scale_change
+        self.min_confidence = min_confidence
+        self.min_visibility = min_visibility
+        self.max_extrapolation = max_extrapolation
+        self.velocity_smoothing = velocity_smoothing
+
+        self.counts = {'keyframe': 0, 'propagated': 0, 'forced': 0}
+        self._counters = {name: METRICS.counter('keyframe_frames_total', kind=name)
+                          for name in self.counts}
+        self.reset()
+
+    def reset(self):
+        self.results = None       # Last keyframe results (None = nothing to propagate)
+        self._gray = None
+        self._points = None       # (N, 1, 2) float32 pixel positions in the flow image
+        self._key_array = None    # (N, 4) keyframe image landmarks
+        self._key_extent = None
+        self._key_time = None
+        self._world = None
+        self._world_velocity = None   # Smoothed (N, 3) world velocity per second
+        self._since_key = 0
+        self._force = False
+
+    def _count(self, name):
+        self.counts[name] += 1
+        self._counters[name].inc()
+
+    def request_keyframe(self):
+        self._force = True
+
+    def keyframe_due(self):
+        return self.results is None or self._force or self._since_key >= self.interval - 1
+
+    def keyframe(self, frame, results, timestamp):
+        """Store a fresh MediaPipe result as the new reference"""
+        self._count('forced' if self._force and self.results is not None else 'keyframe')
+        self._since_key = 0
+        self._force = False
+        if not results.pose_landmarks:
+            self.reset()
+            return
+
+        array = landmarks_to_array(results.pose_landmarks)
+        if float(array[:, 3].mean()) < self.min_confidence:
+            # Too uncertain to trust the flow; keep running MediaPipe
+            self.reset()
+            return
+
+        world = None
+        if results.pose_world_landmarks:
+            world = landmarks_to_array(results.pose_world_landmarks)
+            self._update_velocity(world, timestamp)
+        else:
+            self._world_velocity = None
+
+        self._gray = flow_gray(frame, self.flow_width)
+        h, w = self._gray.shape
+        self._points = (array[:, :2] * (w, h)).astype(np.float32).reshape(-1, 1, 2)
+        self._key_array = array
+        self._key_extent = self._extent(self._points[:, 0])
+        self._key_time = timestamp
+        self._world = world
+        self.results = results
+
+    def _update_velocity(self, world, timestamp):
+        """Blend the step since the last keyframe into the velocity filter"""
+        dt = timestamp - self._key_time if self._key_time is not None else 0.0
+        if self._world is None or not 0 < dt < 1.0:
+            self._world_velocity = None
+            return
+        step = (world[:, :3] - self._world[:, :3]) / dt
+        if self._world_velocity is None:
+            self._world_velocity = step
+        else:
+            self._world_velocity = self._world_velocity + \
+                self.velocity_smoothing * (step - self._world_velocity)
+
+    def _extent(self, points):
+        visible = self._key_array[:, 3] >= self.min_visibility
+        if visible.sum() < 2:
+            visible = slice(None)
+        span = points[visible].max(axis=0) - points[visible].min(axis=0)
+        return float(np.hypot(span[0], span[1]))
+
+    def propagate(self, frame, timestamp):
+        """Pose for a non-keyframe, or None when there is no reference"""
+        if self.results is None:
+            return None
+        gray = flow_gray(frame, self.flow_width)
+        prev = self._points
+        nxt, status, _ = cv2.calcOpticalFlowPyrLK(self._gray, gray, prev, None, **LK_PARAMS)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self._gray, nxt, None, **LK_PARAMS)
+        fb_error = np.linalg.norm(back[:, 0] - prev[:, 0], axis=1)
+        good = (status[:, 0] == 1) & (back_status[:, 0] == 1) & (fb_error < self.max_fb_error)
+
+        points = nxt[:, 0]
+        if good.any():
+            # Unreliable points follow the median motion of the reliable ones
+            shift = np.median(points[good] - prev[good, 0], axis=0)
+            points = np.where(good[:, None], points, prev[:, 0] + shift)
+        else:
+            points = prev[:, 0]
+
+        # Drift checks: force the next frame to be a keyframe
+        visible = self._key_array[:, 3] >= self.min_visibility
+        tracked = float(good[visible].mean()) if visible.any() else 0.0
+        scale_change = abs(self._extent(points) / self._key_extent - 1.0) if self._key_extent else 0.0
+        if tracked < self.min_tracked or scale_change > self.max_scale_change:
+            self._force = True
+
+        self._gray = gray
+        self._points = points.astype(np.float32).reshape(-1, 1, 2)
+        self._since_key += 1
+        self._count('propagated')
+
+        h, w = gray.shape
+        array = self._key_array.copy()
+        array[:, 0] = points[:, 0] / w
+        array[:, 1] = points[:, 1] / h
+        image_landmarks = write_landmarks(copy_landmarks(self.results.pose_landmarks), array)
+
+        world_landmarks = self.results.pose_world_landmarks
+        if world_landmarks is not None and self._world_velocity is not None:
+            dt = min(max(timestamp - self._key_time, 0.0), self.max_extrapolation)
+            moved = self._world[:, :3] + self._world_velocity * dt
+            world_landmarks = write_landmarks(copy_landmarks(world_landmarks), moved)
+        return PoseResults(image_landmarks, world_landmarks)
+
+    def stats(self):
+        total = sum(self.counts.values())
+        stats = dict(self.counts)
+        stats['keyframe_rate'] = (self.counts['keyframe'] + self.counts['forced']) / total if total else 0.0
+        return stats
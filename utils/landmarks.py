@@ -0,0 +1,42 @@
+import numpy as np
+
+NUM_LANDMARKS = 33  # MediaPipe Pose
+
+
+def landmarks_to_array(landmark_list, out=None):
+    """Copy a MediaPipe landmark list into an (N, 4) float32 array of
+    x, y, z, visibility"""
+    landmarks = landmark_list.landmark
+    if out is None:
+        out = np.empty((len(landmarks), 4), dtype=np.float32)
+    for i, lm in enumerate(landmarks):
+        out[i, 0] = lm.x
+        out[i, 1] = lm.y
+        out[i, 2] = lm.z
+        out[i, 3] = lm.visibility
+    return out
+
+
+def write_landmarks(landmark_list, array):
+    """Write x, y, z columns of an (N, >=3) array back into a landmark list"""
+    for lm, (x, y, z) in zip(landmark_list.landmark, array[:, :3].tolist()):
+        lm.x, lm.y, lm.z = x, y, z
+    return landmark_list
+
+
+def copy_landmarks(landmark_list):
+    """Independent copy of a landmark protobuf"""
+    if landmark_list is None:
+        return None
+    clone = type(landmark_list)()
+    clone.CopyFrom(landmark_list)
+    return clone
+
+
+class PoseResults:
+    """Minimal stand-in for MediaPipe's results object for poses that were
+    not produced by running the graph (held, extrapolated, propagated)"""
+
+    def __init__(self, pose_landmarks=None, pose_world_landmarks=None):
+        self.pose_landmarks = pose_landmarks
+        self.pose_world_landmarks = pose_world_landmarks
@@ -0,0 +1,140 @@
+import cv2
+import numpy as np
+
+from utils.letterbox import shrink
+
+
+def small_gray(frame, width=80):
+    """Tiny grayscale copy of a BGR frame, shared by the lighting analysis
+    and the motion gate"""
+    h, w = frame.shape[:2]
+    if w > width:
+        frame = shrink(frame, width, max(1, int(round(h * width / w))))
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def get_lighting_info(frame, gray=None):
+    """Analyze lighting conditions (pass ``gray`` to reuse a grayscale copy)"""
+    if gray is None:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    brightness = np.mean(gray)
+    contrast = np.std(gray)
+    
+    status = "Lighting: "
+    if brightness < 50:
+        status += "Too Dark"
+        color = (0, 0, 255)
+    elif brightness > 200:
+        status += "Too Bright"
+        color = (0, 0, 255)
+    else:
+        status += "Good"
+        color = (0, 255, 0)
+        
+    return {
+        'status': status,
+        'color': color,
+        'contrast_warning': contrast < 20
+    }
+
+
+def strided_gray(frame, width=80):
+    """Grayscale of every n-th pixel, about ``width`` wide (no filtering)"""
+    step = max(1, frame.shape[1] // width)
+    return cv2.cvtColor(np.ascontiguousarray(frame[::step, ::step]), cv2.COLOR_BGR2GRAY)
+
+
+class LightingMonitor:
+    """Incremental lighting analysis for a stream.
+
+    Every ``interval`` frames a strided grayscale sample (or the caller's
+    tiny grayscale copy) updates running brightness/contrast averages. The
+    status only changes once the averages clear the thresholds by a
+    margin, so it does not flicker. ``enhancement()`` tells preprocessing
+    whether, and how, to correct the inference image.
+    """
+
+    def __init__(self, interval=15, smoothing=0.3, dark=50, bright=200, low_contrast=20,
+                 hysteresis=8):
+        self.interval = interval
+        self.smoothing = smoothing
+        self.dark = dark
+        self.bright = bright
+        self.low_contrast = low_contrast
+        self.hysteresis = hysteresis
+        self.brightness = None
+        self.contrast = None
+        self.state = 'good'
+        self.contrast_warning = False
+        self.info = None
+        self._frames = 0
+
+    def update(self, frame, gray=None):
+        """Feed a frame; returns the (possibly unchanged) lighting info"""
+        self._frames += 1
+        if self.info is not None and (self._frames - 1) % self.interval:
+            return self.info
+        if gray is None:
+            gray = strided_gray(frame)
+        brightness = float(np.mean(gray))
+        contrast = float(np.std(gray))
+        if self.brightness is None:
+            self.brightness, self.contrast = brightness, contrast
+        else:
+            self.brightness += self.smoothing * (brightness - self.brightness)
+            self.contrast += self.smoothing * (contrast - self.contrast)
+
+        h = self.hysteresis
+        if self.state == 'dark':
+            if self.brightness > self.dark + h:
+                self.state = 'good'
+        elif self.state == 'bright':
+            if self.brightness < self.bright - h:
+                self.state = 'good'
+        if self.state == 'good':
+            if self.brightness < self.dark:
+                self.state = 'dark'
+            elif self.brightness > self.bright:
+                self.state = 'bright'
+        if self.contrast_warning:
+            self.contrast_warning = self.contrast < self.low_contrast + h / 2
+        else:
+            self.contrast_warning = self.contrast < self.low_contrast
+
+        self.info = self._make_info()
+        return self.info
+
+    def _make_info(self):
+        status = "Lighting: "
+        if self.state == 'dark':
+            status += "Too Dark"
+            color = (0, 0, 255)
+        elif self.state == 'bright':
+            status += "Too Bright"
+            color = (0, 0, 255)
+        else:
+            status += "Good"
+            color = (0, 255, 0)
+        return {
+            'status': status,
+            'color': color,
+            'contrast_warning': self.contrast_warning,
+            'brightness': self.brightness,
+            'contrast': self.contrast,
+        }
+
+    @property
+    def poor(self):
+        return self.state != 'good' or self.contrast_warning
+
+    def enhancement(self):
+        """(alpha, beta) for convertScaleAbs, or None when lighting is fine"""
+        if self.state == 'dark':
+            return 1.2, 10        # The old unconditional correction
+        if self.state == 'bright':
+            return 1.0, -30
+        if self.contrast_warning:
+            # Stretch contrast around the current mean brightness
+            alpha = 1.4
+            return alpha, (1.0 - alpha) * self.brightness
+        return None
@@ -0,0 +1,349 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Log-linear (HDR-style) bucketing: values below 2**SUB_BUCKET_BITS nanoseconds
+# get one bucket each, above that every power of two is split into
+# HALF_BUCKET_COUNT linear sub-buckets (~3% relative precision).
+SUB_BUCKET_BITS = 5
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+HALF_BUCKET_COUNT = SUB_BUCKET_COUNT >> 1
+MAX_EXPONENT = 32  # 2**(32 + 5) ns ~= 137 s, anything longer is clamped
+BUCKET_COUNT = SUB_BUCKET_COUNT + MAX_EXPONENT * HALF_BUCKET_COUNT
+
+# Bucket boundaries reported on the Prometheus endpoint (seconds)
+EXPORT_BOUNDS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.033, 0.05,
+                 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+EXPORT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+PREFIX = "yoach"
+
+
+def _bucket_lower_bound(index):
+    """Smallest nanosecond value that falls into the given bucket"""
+    if index < SUB_BUCKET_COUNT:
+        return index
+    k = index - SUB_BUCKET_COUNT
+    exponent = k // HALF_BUCKET_COUNT + 1
+    mantissa = k % HALF_BUCKET_COUNT + HALF_BUCKET_COUNT
+    return mantissa << exponent
+
+
+def _bucket_upper_bound(index):
+    """Largest nanosecond value that falls into the given bucket"""
+    return _bucket_lower_bound(index + 1) - 1
+
+
+class LatencyHistogram:
+    """Fixed-size HDR-style histogram of nanosecond latencies.
+
+    ``record`` is a handful of integer operations on a preallocated list and
+    takes no lock, so it is cheap enough to leave on in the hot loop.
+    Concurrent writers from several threads may very rarely lose a sample;
+    readers only ever see a slightly stale copy.
+    """
+
+    def __init__(self, name, labels=None):
+        self.name = name
+        self.labels = labels or {}
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, value_ns):
+        """Record one sample given in nanoseconds"""
+        if value_ns < SUB_BUCKET_COUNT:
+            index = value_ns if value_ns > 0 else 0
+        else:
+            exponent = value_ns.bit_length() - SUB_BUCKET_BITS
+            index = (SUB_BUCKET_COUNT + (exponent - 1) * HALF_BUCKET_COUNT
+                     + (value_ns >> exponent) - HALF_BUCKET_COUNT)
+            if index >= BUCKET_COUNT:
+                index = BUCKET_COUNT - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ns += value_ns
+        if value_ns > self.max_ns:
+            self.max_ns = value_ns
+
+    def record_since(self, start_ns):
+        """Record the time elapsed since a ``time.perf_counter_ns()`` stamp"""
+        self.record(time.perf_counter_ns() - start_ns)
+
+    def time(self):
+        """Context manager timing the enclosed block"""
+        return _HistogramTimer(self)
+
+    def reset(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def quantile(self, q, counts=None, count=None):
+        """Return the q-quantile in nanoseconds (upper bucket bound)"""
+        counts = self.counts if counts is None else counts
+        count = self.count if count is None else count
+        if count == 0:
+            return 0
+        target = max(1, int(q * count + 0.5))
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(_bucket_upper_bound(index), self.max_ns)
+        return self.max_ns
+
+    def snapshot(self):
+        """Return summary statistics of the histogram in seconds"""
+        counts = list(self.counts)
+        count = sum(counts)
+        total_ns = self.total_ns
+        snap = {
+            'count': count,
+            'sum': total_ns / 1e9,
+            'mean': (total_ns / count / 1e9) if count else 0.0,
+            'max': self.max_ns / 1e9,
+            'quantiles': {
+                str(q): self.quantile(q, counts, count) / 1e9 for q in EXPORT_QUANTILES
+            },
+        }
+        # Cumulative counts at the exported boundaries
+        cumulative = []
+        seen = 0
+        index = 0
+        for bound in EXPORT_BOUNDS:
+            bound_ns = int(bound * 1e9)
+            while index < BUCKET_COUNT and _bucket_upper_bound(index) <= bound_ns:
+                seen += counts[index]
+                index += 1
+            cumulative.append((bound, seen))
+        snap['buckets'] = cumulative
+        return snap
+
+
+class _HistogramTimer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter_ns() - self.start)
+        return False
+
+
+class Counter:
+    """Monotonic counter"""
+
+    def __init__(self, name, labels=None):
+        self.name = name
+        self.labels = labels or {}
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    """Value that can go up and down, optionally computed at scrape time"""
+
+    def __init__(self, name, labels=None, func=None):
+        self.name = name
+        self.labels = labels or {}
+        self.value = 0
+        self.func = func
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def get(self):
+        if self.func is not None:
+            return self.func()
+        return self.value
+
+
+def get_process_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return rss if sys.platform == "darwin" else rss * 1024
+    except ImportError:
+        return 0
+
+
+class MetricsRegistry:
+    """Holds the latency histograms, counters and gauges of one process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self.gauge('process_resident_memory_bytes', func=get_process_rss)
+        self.start_time = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def _get_or_create(self, store, cls, name, labels, **kwargs):
+        key = self._key(name, labels)
+        metric = store.get(key)
+        if metric is None:
+            with self._lock:
+                metric = store.get(key)
+                if metric is None:
+                    metric = cls(name, labels, **kwargs)
+                    store[key] = metric
+        return metric
+
+    def histogram(self, name, **labels):
+        return self._get_or_create(self._histograms, LatencyHistogram, name, labels)
+
+    def stage(self, stage_name):
+        """Latency histogram of one pipeline stage"""
+        return self.histogram('stage_latency_seconds', stage=stage_name)
+
+    def counter(self, name, **labels):
+        return self._get_or_create(self._counters, Counter, name, labels)
+
+    def gauge(self, name, func=None, **labels):
+        return self._get_or_create(self._gauges, Gauge, name, labels, func=func)
+
+    def snapshot(self):
+        """JSON-serialisable view of every metric"""
+        with self._lock:
+            histograms = list(self._histograms.values())
+            counters = list(self._counters.values())
+            gauges = list(self._gauges.values())
+        return {
+            'timestamp': time.time(),
+            'uptime_seconds': time.time() - self.start_time,
+            'histograms': [dict(name=h.name, labels=h.labels, **h.snapshot()) for h in histograms],
+            'counters': [{'name': c.name, 'labels': c.labels, 'value': c.value} for c in counters],
+            'gauges': [{'name': g.name, 'labels': g.labels, 'value': g.get()} for g in gauges],
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self):
+        """Render every metric in the Prometheus text exposition format"""
+        snap = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                lines.append(f"# TYPE {name} {kind}")
+                declared.add(name)
+
+        for h in snap['histograms']:
+            name = f"{PREFIX}_{h['name']}"
+            declare(name, 'histogram')
+            for bound, cumulative in h['buckets']:
+                lines.append(f"{name}_bucket{_format_labels(h['labels'], le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(h['labels'], le='+Inf')} {h['count']}")
+            lines.append(f"{name}_sum{_format_labels(h['labels'])} {h['sum']:.9f}")
+            lines.append(f"{name}_count{_format_labels(h['labels'])} {h['count']}")
+        for h in snap['histograms']:
+            name = f"{PREFIX}_{h['name']}_quantile"
+            declare(name, 'gauge')
+            for q, value in h['quantiles'].items():
+                lines.append(f"{name}{_format_labels(h['labels'], quantile=q)} {value:.9f}")
+        for c in snap['counters']:
+            name = f"{PREFIX}_{c['name']}"
+            declare(name, 'counter')
+            lines.append(f"{name}{_format_labels(c['labels'])} {c['value']}")
+        for g in snap['gauges']:
+            name = f"{PREFIX}_{g['name']}"
+            declare(name, 'gauge')
+            lines.append(f"{name}{_format_labels(g['labels'])} {g['value']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{v}"' for k, v in items)
+    return "{" + body + "}"
+
+
+class MetricsServer:
+    """Serves ``/metrics`` (Prometheus text) and ``/metrics.json`` over HTTP"""
+
+    def __init__(self, registry, host='127.0.0.1', port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = registry.to_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path in ('/metrics.json', '/metrics/json'):
+                    body = registry.to_json().encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes out of the console
+
+        self.httpd = HTTPServer((self.host, self.port), MetricsHandler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+# Process-wide default registry
+METRICS = MetricsRegistry()
+
+
+def start_metrics_server(host='127.0.0.1', port=9108, registry=None):
+    """Start the metrics endpoint for the given (or default) registry"""
+    return MetricsServer(registry or METRICS, host, port).start()
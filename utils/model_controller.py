@@ -0,0 +1,245 @@
+import threading
+
+import numpy as np
+
+# (model_complexity, side of the square inference letterbox), cheapest first
+DEFAULT_LEVELS = (
+    (0, 256),
+    (0, 384),
+    (1, 384),
+    (1, 512),
+    (2, 512),
+    (2, 768),
+)
+
+
+def default_pose_factory(model_complexity, min_detection_confidence, min_tracking_confidence):
+    import mediapipe as mp
+    return mp.solutions.pose.Pose(
+        min_detection_confidence=min_detection_confidence,
+        min_tracking_confidence=min_tracking_confidence,
+        model_complexity=model_complexity,
+        smooth_landmarks=True,
+        enable_segmentation=False
+    )
+
+
+class ModelController:
+    """Picks MediaPipe model complexity and inference resolution to fit a
+    per-frame latency budget.
+
+    Levels run from cheapest to most accurate. The controller steps down
+    after ``downgrade_frames`` consecutive frames over budget, and steps up
+    once the next level's expected latency (measured earlier, or estimated)
+    fits within ``upgrade_margin`` of the budget for ``upgrade_frames``
+    frames - sooner when detection confidence is poor. The gap between
+    the two thresholds is the hysteresis that stops it flapping. A level's
+    measurement expires ``stale_frames`` frames after it was last run, so
+    one transient spike does not keep the controller down for good: the
+    level is probed again and measured afresh.
+
+    Graphs for the neighbouring complexities are created and warmed on a
+    background thread, so a switch is just a pointer swap.
+    """
+
+    def __init__(self, latency_budget_ms=33.0, levels=DEFAULT_LEVELS, start_level=0,
+                 min_detection_confidence=0.7, min_tracking_confidence=0.7,
+                 downgrade_frames=5, upgrade_frames=60, upgrade_margin=0.6,
+                 low_confidence=0.5, smoothing=0.1, stale_frames=300, pose_factory=None):
+        self.budget = latency_budget_ms / 1000.0
+        self.levels = tuple(levels)
+        self.level = max(0, min(start_level, len(self.levels) - 1))
+        self.confidences = (min_detection_confidence, min_tracking_confidence)
+        self.downgrade_frames = downgrade_frames
+        self.upgrade_frames = upgrade_frames
+        self.upgrade_margin = upgrade_margin
+        self.low_confidence = low_confidence
+        self.smoothing = smoothing
+        self.stale_frames = stale_frames
+        self.pose_factory = pose_factory or default_pose_factory
+
+        self.latency = {}        # level -> EMA latency (seconds)
+        self._measured = {}      # level -> frame it was last measured on
+        self._frames = 0
+        self.confidence = None   # EMA mean landmark visibility
+        self._over_budget = 0
+        self._under_budget = 0
+        self.switches = 0
+        self.visualizer = None
+
+        self._graphs = {}
+        self._lock = threading.Lock()
+        self._warming = set()
+        self._graphs[self.complexity] = self._create_graph(self.complexity)
+        self._warm_neighbours()
+
+    # --- current level ----------------------------------------------------
+
+    @property
+    def complexity(self):
+        return self.levels[self.level][0]
+
+    @property
+    def inference_width(self):
+        return self.levels[self.level][1]
+
+    @property
+    def pose(self):
+        with self._lock:
+            graph = self._graphs.get(self.complexity)
+        if graph is None:
+            # Spare was not ready yet; build it synchronously
+            graph = self._create_graph(self.complexity)
+            with self._lock:
+                graph = self._graphs.setdefault(self.complexity, graph)
+        return graph
+
+    def attach(self, visualizer):
+        """Make ``visualizer`` run on the controller's current graph"""
+        self.visualizer = visualizer
+        visualizer.pose = self.pose
+        return self
+
+    @property
+    def inference_size(self):
+        """Letterbox size for the current level"""
+        side = self.inference_width
+        return side, side
+
+    # --- feedback ---------------------------------------------------------
+
+    def observe(self, latency, results=None):
+        """Feed one inference latency (seconds) and its results"""
+        self._frames += 1
+        previous = self.latency.get(self.level)
+        if previous is not None and self._frames - self._measured[self.level] > self.stale_frames:
+            previous = None     # Restart the EMA after a long absence
+        self.latency[self.level] = latency if previous is None else \
+            previous + self.smoothing * (latency - previous)
+        self._measured[self.level] = self._frames
+
+        if results is not None and results.pose_landmarks:
+            visibility = float(np.mean([lm.visibility for lm in results.pose_landmarks.landmark]))
+            self.confidence = visibility if self.confidence is None else \
+                self.confidence + self.smoothing * (visibility - self.confidence)
+
+        if latency > self.budget:
+            self._over_budget += 1
+            self._under_budget = 0
+        else:
+            self._over_budget = 0
+            if self._next_level_fits():
+                self._under_budget += 1
+            else:
+                self._under_budget = 0
+
+        if self._over_budget >= self.downgrade_frames and self.level > 0:
+            self._switch(self.level - 1)
+        elif self._under_budget >= self._required_upgrade_frames() and self.level < len(self.levels) - 1:
+            self._switch(self.level + 1)
+
+    def _next_level_fits(self):
+        if self.level >= len(self.levels) - 1:
+            return False
+        expected = self.latency.get(self.level + 1)
+        if expected is not None and \
+                self._frames - self._measured[self.level + 1] > self.stale_frames:
+            return True         # Stale: probe the level again
+        if expected is None:
+            # Unmeasured: assume cost grows with pixels and complexity
+            current = self.latency[self.level]
+            c0, w0 = self.levels[self.level]
+            c1, w1 = self.levels[self.level + 1]
+            expected = current * (w1 / w0) ** 2 * (1.8 ** (c1 - c0))
+        return expected < self.budget * self.upgrade_margin
+
+    def _required_upgrade_frames(self):
+        if self.confidence is not None and self.confidence < self.low_confidence:
+            return max(1, self.upgrade_frames // 2)
+        return self.upgrade_frames
+
+    def _switch(self, level):
+        direction = "down" if level < self.level else "up"
+        self.level = level
+        self._over_budget = 0
+        self._under_budget = 0
+        self.switches += 1
+        if self.visualizer is not None:
+            self.visualizer.pose = self.pose
+        print(f"Model controller: {direction} to complexity {self.complexity} "
+              f"@ {self.inference_width}px")
+        self._warm_neighbours()
+
+    # --- graphs -----------------------------------------------------------
+
+    def _create_graph(self, complexity):
+        return self.pose_factory(complexity, *self.confidences)
+
+    def _warm_neighbours(self):
+        wanted = set()
+        for level in (self.level - 1, self.level + 1):
+            if 0 <= level < len(self.levels):
+                wanted.add(self.levels[level][0])
+        with self._lock:
+            missing = [c for c in wanted if c not in self._graphs and c not in self._warming]
+            self._warming.update(missing)
+        for complexity in missing:
+            threading.Thread(target=self._warm, args=(complexity,), daemon=True,
+                             name=f"pose-warm-{complexity}").start()
+
+    def _warm(self, complexity):
+        try:
+            graph = self._create_graph(complexity)
+            # First inference initialises the TFLite interpreters
+            graph.process(np.zeros((256, 256, 3), dtype=np.uint8))
+            with self._lock:
+                kept = self._graphs.setdefault(complexity, graph)
+            if kept is not graph:
+                graph.close()
+        except Exception as e:
+            print(f"Could not warm pose graph (complexity {complexity}): {str(e)}")
+        finally:
+            with self._lock:
+                self._warming.discard(complexity)
+
+    def stats(self):
+        return {
+            'level': self.level,
+            'model_complexity': self.complexity,
+            'inference_width': self.inference_width,
+            'latency_ms': {level: t * 1000.0 for level, t in self.latency.items()},
+            'confidence': self.confidence,
+            'switches': self.switches,
+        }
+
+    def close(self):
+        with self._lock:
+            graphs = list(self._graphs.values())
+            self._graphs = {}
+        for graph in graphs:
+            graph.close()
+
+
+def add_model_arguments(parser):
+    """Add the shared model-selection options to a parser"""
+    parser.add_argument('--model-complexity', type=int, choices=(0, 1, 2), default=0,
+                        help="fixed MediaPipe model complexity (default 0)")
+    parser.add_argument('--min-detection-confidence', type=float, default=0.7,
+                        help="MediaPipe pose detection threshold (default 0.7)")
+    parser.add_argument('--min-tracking-confidence', type=float, default=0.7,
+                        help="MediaPipe landmark tracking threshold (default 0.7)")
+    parser.add_argument('--latency-budget-ms', type=float, default=None,
+                        help="adapt model complexity and inference resolution to this "
+                             "per-frame inference budget (overrides --model-complexity)")
+    return parser
+
+
+def controller_from_args(args):
+    """ModelController for ``--latency-budget-ms`` (None when not given)"""
+    if args.latency_budget_ms is None:
+        return None
+    start_level = next((i for i, (complexity, _) in enumerate(DEFAULT_LEVELS)
+                        if complexity == args.model_complexity), 0)
+    return ModelController(args.latency_budget_ms, start_level=start_level,
+                           min_detection_confidence=args.min_detection_confidence,
+                           min_tracking_confidence=args.min_tracking_confidence)
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+
+from utils.metrics import METRICS
+
+
+class MotionGate:
+    """Decides whether a frame is worth running pose inference on.
+
+    Each tiny grayscale frame is compared with a reference frame; the
+    reference only moves on when motion is seen, so slow drifts still add up
+    to a wake-up. After ``idle_after`` seconds without motion the scene is
+    idle and inference drops to ``idle_inference_hz``; the first moving
+    frame wakes it again immediately.
+    """
+
+    def __init__(self, threshold=12, min_changed=0.003, idle_after=1.0, idle_inference_hz=1.0):
+        self.threshold = threshold          # Per-pixel grey-level change that counts
+        self.min_changed = min_changed      # Fraction of changed pixels that is motion
+        self.idle_after = idle_after
+        self.idle_inference_hz = idle_inference_hz
+        self.reference = None
+        self.last_motion = None
+        self.idle = False
+        self.changed = 0.0
+        self._next_idle_inference = 0.0
+        self._idle_gauge = METRICS.gauge('motion_gate_idle')
+        self._skipped = METRICS.counter('motion_gate_skipped_total')
+
+    def update(self, gray, timestamp):
+        """Feed one tiny grayscale frame; returns True if the scene moved"""
+        if self.reference is None or self.reference.shape != gray.shape:
+            self.reference = gray
+            self.last_motion = timestamp
+            self.idle = False
+            return True
+
+        diff = cv2.absdiff(gray, self.reference)
+        self.changed = np.count_nonzero(diff > self.threshold) / diff.size
+        moving = self.changed >= self.min_changed
+        if moving:
+            self.reference = gray
+            self.last_motion = timestamp
+        was_idle = self.idle
+        self.idle = timestamp - self.last_motion > self.idle_after
+        if was_idle and not self.idle:
+            self._next_idle_inference = 0.0
+        self._idle_gauge.set(float(self.idle))
+        return moving
+
+    def should_infer(self, timestamp):
+        """False while idle, apart from a slow keep-alive rate"""
+        if not self.idle:
+            return True
+        if self.idle_inference_hz and timestamp >= self._next_idle_inference:
+            self._next_idle_inference = timestamp + 1.0 / self.idle_inference_hz
+            return True
+        self._skipped.inc()
+        return False
+
+    def reset(self):
+        self.reference = None
+        self.last_motion = None
+        self.idle = False
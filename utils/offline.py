@@ -0,0 +1,214 @@
+import glob
+import inspect
+import os
+import time
+
+import mediapipe as mp
+import numpy as np
+
+from utils.activity import ActivityScan, ActivityScanner
+from utils.frame_source import VideoFileSource
+from utils.landmarks import NUM_LANDMARKS, landmarks_to_array
+from utils.result_cache import code_version
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.m4v', '.webm')
+
+# Code the cached landmarks depend on: decoding, the activity scan and
+# every module on the visualizer's inference path
+LANDMARK_MODULES = ('utils.offline', 'utils.frame_source', 'utils.activity', 'utils.lighting',
+                    'utils.pose_visualizer', 'utils.letterbox', 'utils.roi_tracker',
+                    'utils.landmarks')
+
+
+class VideoAnalysis:
+    """Pose landmarks for the processed frames of one video.
+
+    ``landmarks`` and ``world_landmarks`` are (K, 33, 4) float32 arrays of
+    x, y, z, visibility for the K processed frames in ``frame_indices``;
+    frames without a pose are NaN.
+    """
+
+    def __init__(self, path, fps, frame_count, frame_indices, landmarks, world_landmarks,
+                 scan=None, process_seconds=0.0):
+        self.path = path
+        self.fps = fps
+        self.frame_count = frame_count
+        self.frame_indices = frame_indices
+        self.landmarks = landmarks
+        self.world_landmarks = world_landmarks
+        self.scan = scan
+        self.process_seconds = process_seconds
+
+    @property
+    def timestamps(self):
+        return self.frame_indices / self.fps
+
+    @property
+    def processed_frames(self):
+        return len(self.frame_indices)
+
+    @property
+    def skipped_frames(self):
+        return max(0, self.frame_count - self.processed_frames)
+
+    def time_saved(self):
+        """Estimated seconds saved by trimming: the skipped frames at the
+        measured per-frame cost, minus the cost of the scan itself"""
+        if not self.processed_frames:
+            return 0.0
+        per_frame = self.process_seconds / self.processed_frames
+        scan_seconds = self.scan.scan_seconds if self.scan is not None else 0.0
+        return self.skipped_frames * per_frame - scan_seconds
+
+
+def find_videos(paths):
+    """Expand files and directories (recursively) into a sorted video list"""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in glob.glob(os.path.join(path, '**', '*'), recursive=True):
+                if name.lower().endswith(VIDEO_EXTENSIONS):
+                    videos.append(name)
+        else:
+            videos.append(path)
+    return sorted(videos)
+
+
+def analyze_video(path, visualizer, scanner=None, trim=True):
+    """Run pose inference over a video, only on its active ranges when
+    ``trim`` is set"""
+    scan = None
+    if trim:
+        if scanner is not None:
+            scan = scanner.scan(path)
+        else:
+            scanner = ActivityScanner()
+            try:
+                scan = scanner.scan(path)
+            finally:
+                scanner.close()
+
+    source = VideoFileSource(path, realtime=False)
+    try:
+        frame_count = scan.frame_count if scan is not None else source.frame_count
+        ranges = scan.ranges if scan is not None else [(0, None)]
+
+        indices, image, world = [], [], []
+        start_time = time.perf_counter()
+        for start, end in ranges:
+            source.seek(start)
+            visualizer.reset_tracking()
+            index = start
+            while end is None or index < end:
+                packet = source.read_packet()
+                if packet is None:
+                    break
+                results = visualizer.process_frame(packet.frame, bgr=True)
+                indices.append(index)
+                image.append(_landmark_array(results.pose_landmarks))
+                world.append(_landmark_array(results.pose_world_landmarks))
+                index += 1
+        process_seconds = time.perf_counter() - start_time
+        if scan is None:
+            frame_count = max(frame_count, len(indices))
+    finally:
+        source.release()
+
+    shape = (0, NUM_LANDMARKS, 4)
+    return VideoAnalysis(
+        path, source.fps, frame_count,
+        np.asarray(indices, dtype=np.int64),
+        np.stack(image) if image else np.empty(shape, np.float32),
+        np.stack(world) if world else np.empty(shape, np.float32),
+        scan, process_seconds)
+
+
+def analysis_settings(visualizer, scanner=None, trim=True):
+    """Everything ``analyze_video`` results depend on besides the video"""
+    settings = {
+        'model_complexity': visualizer.model_complexity,
+        'min_detection_confidence': visualizer.min_detection_confidence,
+        'min_tracking_confidence': visualizer.min_tracking_confidence,
+        'smoothing_factor': visualizer.smoothing_factor,
+        'inference_size': visualizer.inference_size,
+        'trim': trim,
+    }
+    if trim:
+        settings['scanner'] = _scanner_settings(scanner)
+    return settings
+
+
+def _scanner_settings(scanner=None):
+    """Settings of ``scanner``, or the ``ActivityScanner`` defaults without
+    building one (and its person detector)"""
+    if scanner is None:
+        parameters = inspect.signature(ActivityScanner).parameters
+        return {name: parameter.default for name, parameter in parameters.items()
+                if name != 'person_detector'}
+    settings = {name: value for name, value in vars(scanner).items()
+                if name != 'person_detector'}
+    settings['detect_people'] = scanner.person_detector is not None
+    return settings
+
+
+def analysis_to_arrays(analysis):
+    arrays = {
+        'fps': np.float64(analysis.fps),
+        'frame_count': np.int64(analysis.frame_count),
+        'frame_indices': analysis.frame_indices,
+        'landmarks': analysis.landmarks,
+        'world_landmarks': analysis.world_landmarks,
+        'process_seconds': np.float64(analysis.process_seconds),
+    }
+    scan = analysis.scan
+    if scan is not None:
+        arrays.update(scan_ranges=np.asarray(scan.ranges, dtype=np.int64).reshape(-1, 2),
+                      scan_energy=np.asarray(scan.energy, dtype=np.float32),
+                      scan_step=np.int64(scan.sample_step),
+                      scan_seconds=np.float64(scan.scan_seconds))
+    return arrays
+
+
+def analysis_from_arrays(path, arrays):
+    fps, frame_count = float(arrays['fps']), int(arrays['frame_count'])
+    scan = None
+    if 'scan_ranges' in arrays:
+        scan = ActivityScan(path, fps, frame_count,
+                            [(int(a), int(b)) for a, b in arrays['scan_ranges']],
+                            arrays['scan_energy'], int(arrays['scan_step']),
+                            float(arrays['scan_seconds']))
+    return VideoAnalysis(path, fps, frame_count, arrays['frame_indices'], arrays['landmarks'],
+                         arrays['world_landmarks'], scan, float(arrays['process_seconds']))
+
+
+def analyze_video_cached(cache, path, visualizer, scanner=None, trim=True):
+    """``analyze_video`` through a ``ResultCache``: (analysis, cache key).
+    A hit skips decoding, the activity scan and pose inference."""
+    key = cache.key('landmarks', cache.digest(path), analysis_settings(visualizer, scanner, trim),
+                    mp.__version__,
+                    code_version(*dict.fromkeys(LANDMARK_MODULES +
+                                                (type(visualizer).__module__,))))
+    arrays = cache.fetch(key, lambda: analysis_to_arrays(
+        analyze_video(path, visualizer, scanner, trim)))
+    return analysis_from_arrays(path, arrays), key
+
+
+def _landmark_array(landmark_list):
+    if landmark_list is None:
+        return np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    return landmarks_to_array(landmark_list)
+
+
+def summarize(analyses):
+    """Totals over a session archive"""
+    total = sum(a.frame_count for a in analyses)
+    processed = sum(a.processed_frames for a in analyses)
+    return {
+        'videos': len(analyses),
+        'frames': total,
+        'processed_frames': processed,
+        'skipped_fraction': 1.0 - processed / total if total else 0.0,
+        'scan_seconds': sum(a.scan.scan_seconds for a in analyses if a.scan is not None),
+        'process_seconds': sum(a.process_seconds for a in analyses),
+        'time_saved_seconds': sum(a.time_saved() for a in analyses),
+    }
@@ -0,0 +1,343 @@
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.metrics import METRICS
+from utils.tracing import TRACER
+
+RUN_MODES = ('inline', 'threaded', 'process')
+
+# Types the frame source puts into every context
+SOURCE_OUTPUTS = {'frame': np.ndarray, 'timestamp': float, 'index': int}
+
+
+class PipelineError(Exception):
+    pass
+
+
+class Stage:
+    """One declared unit of a pipeline.
+
+    ``inputs`` and ``outputs`` map value names to their expected types.
+    ``func`` is called with the input values positionally (in declaration
+    order) and returns the single output value, or a tuple when several
+    outputs are declared. Stages without outputs are run for their side
+    effects.
+
+    ``cpu_bound`` stages may be sent to a process pool in ``process`` mode;
+    their ``func`` must then be picklable and free of in-process state.
+    """
+
+    def __init__(self, name, func, inputs=None, outputs=None, cpu_bound=False):
+        self.name = name
+        self.func = func
+        self.inputs = dict(inputs or {})
+        self.outputs = dict(outputs or {})
+        self.cpu_bound = cpu_bound
+        self.histogram = METRICS.stage(name)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={list(self.inputs)}, outputs={list(self.outputs)})"
+
+    def arguments(self, ctx):
+        return [ctx.values[name] for name in self.inputs]
+
+    def assign(self, ctx, result):
+        """Store the function result under the declared output names"""
+        if not self.outputs:
+            return
+        if len(self.outputs) == 1:
+            result = (result,)
+        elif not isinstance(result, tuple) or len(result) != len(self.outputs):
+            raise PipelineError(f"Stage {self.name} must return {len(self.outputs)} values")
+        for name, value in zip(self.outputs, result):
+            ctx.values[name] = value
+
+    def check_types(self, ctx):
+        for name, expected in self.inputs.items():
+            value = ctx.values[name]
+            if value is not None and not isinstance(value, expected):
+                raise PipelineError(
+                    f"Stage {self.name} expected {name} as {expected}, got {type(value).__name__}")
+
+
+class FrameContext:
+    """Values produced for one frame as it moves through the stages"""
+    __slots__ = ('values', 'timings', 'index', 'timestamp')
+
+    def __init__(self, frame, timestamp, index):
+        self.values = {'frame': frame, 'timestamp': timestamp, 'index': index}
+        self.timings = {}
+        self.index = index
+        self.timestamp = timestamp
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def __setitem__(self, name, value):
+        self.values[name] = value
+
+    def __contains__(self, name):
+        return name in self.values
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    @property
+    def latency(self):
+        """Seconds from capture to now"""
+        return time.perf_counter() - self.timestamp
+
+
+class FpsMeter:
+    """Frame rate over a sliding update interval"""
+
+    def __init__(self, update_interval=0.5):
+        self.update_interval = update_interval
+        self.fps = 0.0
+        self._count = 0
+        self._start = time.perf_counter()
+
+    def tick(self):
+        self._count += 1
+        now = time.perf_counter()
+        elapsed = now - self._start
+        if elapsed > self.update_interval:
+            self.fps = self._count / elapsed
+            self._count = 0
+            self._start = now
+        return self.fps
+
+
+class _End:
+    """End-of-stream marker passed between stage threads"""
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+_END = _End()
+
+
+def _timed_call(func, args):
+    """Run a stage function in a worker process and time it there"""
+    start = time.perf_counter_ns()
+    result = func(*args)
+    return result, time.perf_counter_ns() - start
+
+
+class Pipeline:
+    """Runs a sequence of stages over frames from a source.
+
+    Run modes:
+      * ``inline``   - a generator running every stage on the caller's thread
+      * ``threaded`` - one thread per stage connected by bounded queues, so
+                       consecutive frames are in different stages at once
+      * ``process``  - like ``threaded`` but ``cpu_bound`` stages are farmed
+                       out to a process pool, several frames in flight
+
+    Every stage is timed into ``METRICS.stage(name)``, a tracing span and
+    ``ctx.timings``.
+    """
+
+    def __init__(self, stages, name="pipeline", check_types=False):
+        self.stages = list(stages)
+        self.name = name
+        self.check_types = check_types
+        self.fps_meter = FpsMeter()
+        self._validate()
+
+    def _validate(self):
+        available = dict(SOURCE_OUTPUTS)
+        seen = set()
+        for stage in self.stages:
+            if stage.name in seen:
+                raise PipelineError(f"Duplicate stage name: {stage.name}")
+            seen.add(stage.name)
+            for name, expected in stage.inputs.items():
+                if name not in available:
+                    raise PipelineError(f"Stage {stage.name} needs '{name}' which no earlier stage produces")
+                produced = available[name]
+                if not (expected is object or produced is object or issubclass(produced, expected)):
+                    raise PipelineError(
+                        f"Stage {stage.name} needs '{name}' as {expected.__name__}, "
+                        f"but it is produced as {produced.__name__}")
+            available.update(stage.outputs)
+        self.outputs = available
+
+    @property
+    def fps(self):
+        return self.fps_meter.fps
+
+    def stage(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+    # --- single frame ---------------------------------------------------
+
+    def new_context(self, packet):
+        return FrameContext(packet.frame, packet.timestamp, packet.index)
+
+    def process(self, packet):
+        """Run all stages inline for one FramePacket (or FrameContext)"""
+        ctx = packet if isinstance(packet, FrameContext) else self.new_context(packet)
+        for stage in self.stages:
+            self._run_stage(stage, ctx)
+        self.fps_meter.tick()
+        return ctx
+
+    def process_frame(self, frame, timestamp=None, index=0):
+        """Run all stages for a bare frame (e.g. decoded from a websocket)"""
+        ctx = FrameContext(frame, timestamp if timestamp is not None else time.perf_counter(), index)
+        return self.process(ctx)
+
+    def _run_stage(self, stage, ctx):
+        if self.check_types:
+            stage.check_types(ctx)
+        args = stage.arguments(ctx)
+        with TRACER.span(stage.name):
+            start = time.perf_counter_ns()
+            result = stage.func(*args)
+            duration = time.perf_counter_ns() - start
+        stage.assign(ctx, result)
+        stage.histogram.record(duration)
+        ctx.timings[stage.name] = duration / 1e9
+
+    # --- streams --------------------------------------------------------
+
+    def run(self, packets, mode='inline', queue_size=2, process_workers=None):
+        """Yield a finished FrameContext for every packet from ``packets``"""
+        if mode == 'inline':
+            return self._run_inline(packets)
+        if mode in ('threaded', 'process'):
+            return self._run_threaded(packets, queue_size,
+                                      use_processes=(mode == 'process'),
+                                      process_workers=process_workers)
+        raise PipelineError(f"Unknown run mode: {mode} (expected one of {RUN_MODES})")
+
+    def _capture(self, packets):
+        """Iterate the source, timing each read as the 'capture' stage"""
+        histogram = METRICS.stage('capture')
+        iterator = iter(packets)
+        while True:
+            with TRACER.span('capture'):
+                start = time.perf_counter_ns()
+                try:
+                    packet = next(iterator)
+                except StopIteration:
+                    return
+                histogram.record(time.perf_counter_ns() - start)
+            yield packet
+
+    def _run_inline(self, packets):
+        for packet in self._capture(packets):
+            yield self.process(packet)
+
+    def _run_threaded(self, packets, queue_size, use_processes, process_workers):
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=queue_size) for _ in range(len(self.stages) + 1)]
+        pool = None
+        if use_processes and any(stage.cpu_bound for stage in self.stages):
+            pool = ProcessPoolExecutor(max_workers=process_workers)
+
+        def put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _END
+
+        def feed():
+            try:
+                for packet in self._capture(packets):
+                    if not put(queues[0], self.new_context(packet)):
+                        return
+            except Exception as e:
+                put(queues[0], _Failure(e))
+                return
+            put(queues[0], _END)
+
+        def run_stage(stage, q_in, q_out):
+            while True:
+                item = get(q_in)
+                if item is _END or isinstance(item, _Failure):
+                    put(q_out, item)
+                    return
+                try:
+                    self._run_stage(stage, item)
+                except Exception as e:
+                    put(q_out, _Failure(e))
+                    return
+                if not put(q_out, item):
+                    return
+
+        def run_pooled_stage(stage, q_in, q_out):
+            # Keep several frames in flight, emit them in order
+            in_flight = collections.deque()
+            max_in_flight = pool._max_workers
+
+            def emit_oldest():
+                ctx, future = in_flight.popleft()
+                result, duration = future.result()
+                stage.assign(ctx, result)
+                stage.histogram.record(duration)
+                ctx.timings[stage.name] = duration / 1e9
+                return put(q_out, ctx)
+
+            while True:
+                item = get(q_in)
+                try:
+                    if item is _END or isinstance(item, _Failure):
+                        while in_flight:
+                            emit_oldest()
+                        put(q_out, item)
+                        return
+                    in_flight.append((item, pool.submit(_timed_call, stage.func, stage.arguments(item))))
+                    while len(in_flight) >= max_in_flight:
+                        if not emit_oldest():
+                            return
+                except Exception as e:
+                    put(q_out, _Failure(e))
+                    return
+
+        threads = [threading.Thread(target=feed, name=f"{self.name}-source", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            target = run_pooled_stage if (pool is not None and stage.cpu_bound) else run_stage
+            threads.append(threading.Thread(target=target, args=(stage, queues[i], queues[i + 1]),
+                                            name=f"{self.name}-{stage.name}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = get(queues[-1])
+                if item is _END:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                self.fps_meter.tick()
+                yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join(timeout=1.0)
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
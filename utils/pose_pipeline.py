@@ -0,0 +1,496 @@
+import collections
+import functools
+import os
+import time
+
+import cv2
+import numpy as np
+
+from utils.features import FeatureEngine
+from utils.keyframe import KeyframePropagator
+from utils.letterbox import Letterbox
+from utils.lighting import LightingMonitor, small_gray
+from utils.motion_gate import MotionGate
+from utils.pipeline import Pipeline, Stage
+from utils.rate_governor import LandmarkHold
+from utils.session_store import frame_row
+from utils.reps import RepCounter
+from utils.swing_phases import SwingPhaseSegmenter, split_swings
+from utils.trajectory import TrajectoryPath, draw_trajectory
+
+
+def preprocess_frame(frame, max_width=1280, size=None):
+    """Downscale a BGR frame for display (inference gets its own image)"""
+    if size is not None:
+        return cv2.resize(frame, size)
+    height, width = frame.shape[:2]
+    if width > max_width:  # Scale down large frames
+        scale = max_width / width
+        frame = cv2.resize(frame, (int(width * scale), int(height * scale)))
+    return frame
+
+
+def encode_jpeg(frame, quality=50):
+    """Encode a BGR frame as JPEG bytes"""
+    _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return buffer.tobytes()
+
+
+class PipelineSettings:
+    """Knobs that differ between the desktop, Qt and websocket front ends"""
+
+    def __init__(self, max_width=1280, size=None, inference_size=(384, 384), enhance=True,
+                 render_3d=True, overlays=True, record=True, jpeg_quality=None,
+                 governor=None, extrapolate=False, keyframe_interval=None,
+                 motion_gate=False, reference_library=None, trajectory=True,
+                 heatmap=False, rep_joint='knee', coach=None, swing_index=None,
+                 session_store=None):
+        self.max_width = max_width
+        self.size = size                  # Fixed (width, height) for display
+        self.inference_size = inference_size  # Letterbox fed to MediaPipe; None = native
+        self.enhance = enhance            # Blur + contrast on the inference image in poor light
+        self.render_3d = render_3d        # Matplotlib 3D view (expensive)
+        self.overlays = overlays          # FPS / lighting / view text
+        self.record = record              # Write frames while the recorder is on
+        self.jpeg_quality = jpeg_quality  # Add an 'encode' stage producing JPEG bytes
+        self.governor = governor          # RateGovernor for inference / 3D rates
+        self.extrapolate = extrapolate    # Extrapolate held landmarks between inferences
+        self.keyframe_interval = keyframe_interval  # Optical flow between MediaPipe keyframes
+        self.motion_gate = motion_gate    # Skip inference while the scene is static
+        self.reference_library = reference_library  # Compare finished swings with experts
+        self.trajectory = trajectory      # Fading wrist trail in the 2D and 3D views
+        self.heatmap = heatmap            # Decaying hands/feet heatmap over the 2D view
+        self.rep_joint = rep_joint        # Angle the rep counter follows; None disables it
+        self.coach = coach                # CoachFeedback filling the Coach Chat panel
+        self.swing_index = swing_index    # SwingIndex archiving swings while recording
+        self.session_store = session_store  # SessionStore logging each recording's frames
+
+
+def build_pose_pipeline(visualizer, display, recorder=None, settings=None):
+    """Build the capture -> prepare inference -> preprocess -> infer -> draw
+    -> 3D -> layout -> overlay -> record pipeline shared by main.py,
+    main_interface.py and ming3.py. Display stays with the front end."""
+    settings = settings or PipelineSettings()
+    stages = []
+
+    governor = settings.governor
+    hold = LandmarkHold(extrapolate=settings.extrapolate)
+    controller = getattr(visualizer, 'model_controller', None)
+    keyframes = None
+    if settings.keyframe_interval:
+        keyframes = KeyframePropagator(interval=settings.keyframe_interval)
+    gate = MotionGate() if settings.motion_gate else None
+    lighting = LightingMonitor() if settings.enhance or settings.overlays else None
+
+    prepare_inputs = {'frame': np.ndarray, 'timestamp': float}
+    if gate is not None:
+        # Tiny grayscale copy for the motion gate, shared with the lighting monitor
+        stages.append(Stage(
+            'scene', small_gray,
+            inputs={'frame': np.ndarray},
+            outputs={'gray_small': np.ndarray},
+        ))
+        prepare_inputs['gray_small'] = np.ndarray
+
+    def prepare_image(frame, enhance):
+        # Cut from the source frame before display scaling; only this small
+        # image is enhanced and colour converted
+        size = controller.inference_size if controller is not None else settings.inference_size
+        return visualizer.prepare_inference(frame, size, enhance or False, bgr=True)
+
+    # In threaded mode every stage runs on its own thread, so each stateful
+    # helper belongs to one stage: this one owns the lighting monitor and
+    # the motion gate, the inference stage the keyframes, the landmark hold
+    # and the governor's inference channel. Decisions travel in the frame
+    # context. Only the gate can rule out inference here, so the image is
+    # prepared early only when nothing else decides.
+    prepare_early = keyframes is None and governor is None
+
+    def prepare_inference(frame, timestamp, gray_small=None):
+        lighting_info = enhance = None
+        if lighting is not None:
+            lighting_info = lighting.update(frame, gray_small)
+            enhance = lighting.enhancement() if settings.enhance else None
+        idle = resumed = False
+        gate_open = True
+        if gate is not None:
+            was_idle = gate.idle
+            gate.update(gray_small, timestamp)
+            idle = gate.idle
+            # Motion after idling: infer on this very frame
+            resumed = was_idle and not idle
+            gate_open = resumed or gate.should_infer(timestamp)
+        if not (gate_open and prepare_early):
+            return None, None, frame, enhance, idle, resumed, gate_open, lighting_info
+        image, letterbox = prepare_image(frame, enhance)
+        return image, letterbox, frame, enhance, idle, resumed, gate_open, lighting_info
+
+    stages.append(Stage(
+        'prepare_inference', prepare_inference,
+        inputs=prepare_inputs,
+        outputs={'inference_image': np.ndarray, 'letterbox': Letterbox,
+                 'source_frame': np.ndarray, 'enhancement': tuple, 'scene_idle': bool,
+                 'motion_resumed': bool, 'gate_open': bool, 'lighting_info': dict},
+    ))
+
+    stages.append(Stage(
+        'preprocess',
+        functools.partial(preprocess_frame, max_width=settings.max_width, size=settings.size),
+        inputs={'frame': np.ndarray},
+        outputs={'frame': np.ndarray},
+        cpu_bound=True,
+    ))
+
+    def infer(source_frame, inference_image, letterbox, timestamp, enhancement, scene_idle,
+              motion_resumed, gate_open):
+        if motion_resumed:
+            if keyframes is not None:
+                keyframes.request_keyframe()
+            if governor is not None:
+                governor.wake('inference')
+        # Between keyframes / inference slots the pose is propagated or held
+        # (still inferring while there is no pose to hold)
+        due = gate_open
+        if due and keyframes is not None:
+            due = keyframes.keyframe_due()
+        elif due and governor is not None:
+            due = governor.due('inference', timestamp)
+        if not due:
+            if keyframes is not None and not scene_idle:
+                results = keyframes.propagate(source_frame, timestamp)
+                if results is not None:
+                    return results, False
+            if hold.results is not None:
+                return hold.get(timestamp), False
+        if inference_image is None:
+            inference_image, letterbox = prepare_image(source_frame, enhancement)
+        start = time.perf_counter()
+        results = visualizer.infer(inference_image, letterbox, source_frame)
+        latency = time.perf_counter() - start
+        if controller is not None:
+            controller.observe(latency, results)
+        if governor is not None:
+            governor.observe('inference', latency)
+        if keyframes is not None:
+            keyframes.keyframe(source_frame, results, timestamp)
+        hold.update(results, timestamp)
+        return results, True
+
+    stages.append(Stage(
+        'pose_inference', infer,
+        inputs={'source_frame': np.ndarray, 'inference_image': np.ndarray,
+                'letterbox': Letterbox, 'timestamp': float, 'enhancement': tuple,
+                'scene_idle': bool, 'motion_resumed': bool, 'gate_open': bool},
+        outputs={'results': object, 'pose_fresh': bool},
+    ))
+
+    engine = FeatureEngine()
+    last_results = None
+
+    def features(results, timestamp):
+        # Only a new pose advances the derivatives; held poses reuse them
+        nonlocal last_results
+        if results is not last_results:
+            last_results = results
+            if results is not None and results.pose_world_landmarks:
+                engine.update(results.pose_world_landmarks, timestamp)
+            else:
+                engine.reset()
+        return engine.features
+
+    stages.append(Stage(
+        'features', features,
+        inputs={'results': object, 'timestamp': float},
+        outputs={'features': dict},
+    ))
+
+    segmenter = SwingPhaseSegmenter()
+    last_features = None
+
+    def phases(features):
+        nonlocal last_features
+        events = []
+        if features is not last_features:
+            last_features = features
+            events = segmenter.update(features)
+        return events, segmenter.summary()
+
+    stages.append(Stage(
+        'phases', phases,
+        inputs={'features': dict},
+        outputs={'phase_events': list, 'swing': dict},
+    ))
+
+    if settings.rep_joint:
+        counter = RepCounter(joint=settings.rep_joint)
+        last_counted = None
+
+        def reps(features):
+            nonlocal last_counted
+            if features is not last_counted:
+                last_counted = features
+                counter.update(features)
+            return counter.summary()
+
+        stages.append(Stage(
+            'reps', reps,
+            inputs={'features': dict},
+            outputs={'reps': dict},
+        ))
+
+    library = settings.reference_library
+    index = settings.swing_index
+    if library is not None or index is not None:
+        # Angles of the last few seconds; each finished swing is cut out once
+        history = collections.deque(maxlen=600)
+        swing_events = []
+
+        def finish_swing(features, phase_events):
+            if features is not None and (not history or history[-1][0] != features['timestamp']):
+                history.append((features['timestamp'], features['angles']))
+            finished = None
+            for event in phase_events:
+                swing_events.append(event)
+                swings = split_swings(swing_events)
+                if event.phase == 'idle':
+                    swing_events.clear()
+                if swings and history:
+                    timestamps = np.array([t for t, _ in history])
+                    angles = np.stack([a for _, a in history])
+                    finished = (angles, timestamps, swings[0])
+            return finished
+
+        stages.append(Stage(
+            'finish_swing', finish_swing,
+            inputs={'features': dict, 'phase_events': list},
+            outputs={'finished_swing': tuple},
+        ))
+
+    if library is not None:
+        comparison = None
+
+        def compare(finished_swing):
+            nonlocal comparison
+            if finished_swing is not None:
+                comparison = library.compare(*finished_swing) or comparison
+            return comparison
+
+        stages.append(Stage(
+            'compare', compare,
+            inputs={'finished_swing': tuple},
+            outputs={'comparison': object},
+        ))
+
+    if index is not None and recorder is not None:
+        archived = 0
+
+        def archive(finished_swing):
+            # Swings are kept with the video they were recorded to
+            nonlocal archived
+            if finished_swing is not None and recorder.is_recording:
+                archived += 1
+                index.add(f"{recorder.filename}#{archived}", *finished_swing,
+                          video=recorder.filename, time=time.time())
+
+        stages.append(Stage(
+            'archive', archive,
+            inputs={'finished_swing': tuple},
+        ))
+
+    store = settings.session_store
+    if store is not None and recorder is not None:
+        writer = None
+
+        def log_session(results, features, phase_events, timestamp):
+            # One session per recorded video, closed when recording stops
+            nonlocal writer
+            if writer is not None and (not recorder.is_recording or
+                                       writer.info['video'] != recorder.filename):
+                writer.close()
+                writer = None
+            if not recorder.is_recording:
+                return
+            if writer is None:
+                name = os.path.splitext(os.path.basename(recorder.filename))[0]
+                writer = store.create(name, video=recorder.filename)
+            writer.append(frame_row(timestamp, results, features))
+            for event in phase_events:
+                writer.add_event(event.phase, event.timestamp, hand=event.hand)
+
+        stages.append(Stage(
+            'session_store', log_session,
+            inputs={'results': object, 'features': dict, 'phase_events': list,
+                    'timestamp': float},
+        ))
+
+    coach = settings.coach
+    if coach is not None:
+        last_swings = 0
+        last_comparison = None
+
+        def feedback(swing, comparison=None):
+            # Swing timings and the expert comparison share the swing's key
+            nonlocal last_swings, last_comparison
+            if swing['swings'] != last_swings:
+                last_swings = swing['swings']
+                timings = swing['last_swing'] or {}
+                coach.submit(last_swings, details={phase: timings[phase] for phase in
+                                                   ('backswing', 'forward_swing')
+                                                   if phase in timings})
+            if comparison is not None and comparison is not last_comparison:
+                last_comparison = comparison
+                coach.submit(last_swings, comparison.worst(coach.max_issues))
+            return coach.snapshot()
+
+        coach_inputs = {'swing': dict}
+        if library is not None:
+            coach_inputs['comparison'] = object
+        stages.append(Stage(
+            'coach', feedback,
+            inputs=coach_inputs,
+            outputs={'coach': dict},
+        ))
+
+    trajectory = visualizer.trajectory if settings.trajectory else None
+    draw_inputs = {'frame': np.ndarray, 'results': object}
+    if trajectory is not None:
+        last_pushed = None
+
+        def track(results, timestamp):
+            # One sample per new pose. Only this stage touches the ring
+            # buffer: drawing gets the copy, with its segment colours
+            nonlocal last_pushed
+            if results is not last_pushed:
+                last_pushed = results
+                trajectory.push(results, timestamp)
+            return trajectory.path()
+
+        stages.append(Stage(
+            'trajectory', track,
+            inputs={'results': object, 'timestamp': float},
+            outputs={'trajectory_path': TrajectoryPath},
+        ))
+        draw_inputs['trajectory_path'] = TrajectoryPath
+
+    def draw_2d(frame, results, trajectory_path=None):
+        frame_2d = frame.copy()
+        if results.pose_landmarks:
+            frame_2d = visualizer.draw_2d_pose(frame_2d, results)
+        if trajectory_path is not None:
+            draw_trajectory(frame_2d, trajectory_path)
+        return frame_2d
+
+    stages.append(Stage(
+        'draw_2d', draw_2d,
+        inputs=draw_inputs,
+        outputs={'frame_2d': np.ndarray},
+    ))
+
+    if settings.render_3d:
+        last_3d = None
+        last_key = None
+
+        def render_3d(results, timestamp, trajectory_path=None):
+            nonlocal last_3d, last_key
+            # Nothing to redraw while the pose and the view are unchanged
+            key = (results, visualizer.elev, visualizer.azim, visualizer.z_offset)
+            if last_3d is not None and last_key is not None and \
+                    key[0] is last_key[0] and key[1:] == last_key[1:]:
+                return last_3d
+            if last_3d is None or governor is None or governor.due('render_3d', timestamp):
+                last_3d = visualizer.visualize_3d_pose(results, trajectory_path)
+                last_key = key
+            return last_3d
+    else:
+        blank_3d = None
+
+        def render_3d(results, timestamp, trajectory_path=None):
+            nonlocal blank_3d
+            if blank_3d is None:
+                blank_3d = np.zeros((240, 320, 3), np.uint8)
+            return blank_3d
+
+    render_inputs = {'results': object, 'timestamp': float}
+    if trajectory is not None and settings.render_3d:
+        render_inputs['trajectory_path'] = TrajectoryPath
+    stages.append(Stage(
+        'render_3d', render_3d,
+        inputs=render_inputs,
+        outputs={'frame_3d': np.ndarray},
+    ))
+
+    if settings.heatmap:
+        heatmap = visualizer.heatmap
+
+        def accumulate(results, timestamp):
+            # Every frame counts, held poses included: heat is time spent
+            heatmap.update(results, timestamp)
+            return heatmap.image(timestamp)
+
+        stages.append(Stage(
+            'heatmap', accumulate,
+            inputs={'results': object, 'timestamp': float},
+            outputs={'heatmap': tuple},
+        ))
+
+    # Inputs are passed positionally; the optional ones are matched by name
+    optional = {'comparison': object, 'heatmap': tuple, 'reps': dict, 'coach': dict}
+    enabled = {'comparison': library is not None, 'heatmap': settings.heatmap,
+               'reps': bool(settings.rep_joint), 'coach': coach is not None}
+    optional = {name: kind for name, kind in optional.items() if enabled[name]}
+
+    def layout(frame_2d, frame_3d, results, features, swing, *extra):
+        recording_time = None
+        if recorder is not None and recorder.is_recording:
+            recording_time = recorder.get_recording_time()
+        extra = dict(zip(optional, extra))
+        analysis = {'features': features, 'swing': swing,
+                    'comparison': extra.get('comparison'), 'reps': extra.get('reps')}
+        return display.create_quadrant_layout(frame_2d, frame_3d, results, recording_time, analysis,
+                                              extra.get('heatmap'), extra.get('coach'))
+
+    layout_inputs = {'frame_2d': np.ndarray, 'frame_3d': np.ndarray, 'results': object,
+                     'features': dict, 'swing': dict}
+    layout_inputs.update(optional)
+    stages.append(Stage(
+        'layout', layout,
+        inputs=layout_inputs,
+        outputs={'combined': np.ndarray},
+    ))
+
+    if settings.overlays:
+        def overlay(combined, lighting_info):
+            view_info = getattr(visualizer, 'current_view', None)
+            display.add_overlays(combined, pipeline.fps, lighting_info, view_info)
+            return combined
+
+        stages.append(Stage(
+            'overlays', overlay,
+            inputs={'combined': np.ndarray, 'lighting_info': dict},
+            outputs={'combined': np.ndarray},
+        ))
+
+    if recorder is not None and settings.record:
+        def record(combined, phase_events, timestamp):
+            if recorder.is_recording:
+                recorder.write_frame(combined)
+                # Impact events are stamped with the (earlier) speed peak
+                for event in phase_events:
+                    recorder.add_marker(event.phase, timestamp - event.timestamp)
+
+        stages.append(Stage(
+            'record', record,
+            inputs={'combined': np.ndarray, 'phase_events': list, 'timestamp': float},
+        ))
+
+    if settings.jpeg_quality is not None:
+        stages.append(Stage(
+            'encode',
+            functools.partial(encode_jpeg, quality=settings.jpeg_quality),
+            inputs={'combined': np.ndarray},
+            outputs={'jpeg': bytes},
+            cpu_bound=True,
+        ))
+
+    pipeline = Pipeline(stages, name='pose')
+    return pipeline
@@ -3,26 +3,46 @@ import numpy as np
 import matplotlib.pyplot as plt
 import mediapipe as mp
 from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 import platform
 
+from utils.landmarks import landmarks_to_array, write_landmarks
+from utils.letterbox import Letterbox
+from utils.roi_tracker import RoiTracker
+from utils.heatmap import MotionHeatmap
+from utils.trajectory import Trajectory
+
 class PoseVisualizer:
-    def __init__(self, smoothing_factor=0.5):
-        self._init_mediapipe()
+    def __init__(self, smoothing_factor=0.5, model_complexity=0,
+                 min_detection_confidence=0.7, min_tracking_confidence=0.7,
+                 model_controller=None, inference_size=None):
+        self.model_controller = model_controller
+        # Settings the landmarks depend on (offline results are cached by them)
+        self.model_complexity = model_complexity
+        self.min_detection_confidence = min_detection_confidence
+        self.min_tracking_confidence = min_tracking_confidence
+        # Letterbox size (width, height) for inference; None = crop at native size
+        self.inference_size = inference_size
+        self._init_mediapipe(model_complexity, min_detection_confidence, min_tracking_confidence)
         self._init_3d_visualization()
         self._init_smoothing(smoothing_factor)
         self._init_view_controls()
 
-    def _init_mediapipe(self):
+    def _init_mediapipe(self, model_complexity, min_detection_confidence, min_tracking_confidence):
         self.mp_pose = mp.solutions.pose
         self.mp_drawing = mp.solutions.drawing_utils
         self.mp_drawing_styles = mp.solutions.drawing_styles
-        self.pose = self.mp_pose.Pose(
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.7,
-            model_complexity=0,
-            smooth_landmarks=True,
-            enable_segmentation=False
-        )
+        if self.model_controller is not None:
+            # The controller owns the graphs and swaps self.pose as it adapts
+            self.model_controller.attach(self)
+        else:
+            self.pose = self.mp_pose.Pose(
+                min_detection_confidence=min_detection_confidence,
+                min_tracking_confidence=min_tracking_confidence,
+                model_complexity=model_complexity,
+                smooth_landmarks=True,
+                enable_segmentation=False
+            )
         self.pose_connections = self.mp_pose.POSE_CONNECTIONS
 
     def _init_3d_visualization(self):
@@ -37,6 +57,9 @@ class PoseVisualizer:
         self.fig.tight_layout()
 
     def _init_smoothing(self, smoothing_factor):
+        self.tracker = RoiTracker()
+        self.trajectory = Trajectory()
+        self.heatmap = MotionHeatmap()
         self.previous_landmarks = None
         self.smoothing_factor = smoothing_factor
         self.landmark_history = []
@@ -48,50 +71,47 @@ class PoseVisualizer:
         self.z_offset = 0.0
         self.z_step = 0.1
 
-    def process_frame(self, frame):
-        """Process frame with ROI tracking and automatic reset"""
-        results = None
-        
-        # Try processing with previous ROI
-        if self.previous_landmarks is not None:
-            x_coords = [l.x for l in self.previous_landmarks.landmark]
-            y_coords = [l.y for l in self.previous_landmarks.landmark]
-            
-            min_x, max_x = min(x_coords), max(x_coords)
-            min_y, max_y = min(y_coords), max(y_coords)
-            
-            # Add margin
-            margin = 0.1
-            roi_x1 = max(0, int((min_x - margin) * frame.shape[1]))
-            roi_y1 = max(0, int((min_y - margin) * frame.shape[0]))
-            roi_x2 = min(frame.shape[1], int((max_x + margin) * frame.shape[1]))
-            roi_y2 = min(frame.shape[0], int((max_y + margin) * frame.shape[0]))
-            
-            # Process ROI
-            roi = frame[roi_y1:roi_y2, roi_x1:roi_x2]
-            if roi.size > 0:  # Check if ROI is valid
-                results = self.pose.process(roi)
-                
-                # Adjust coordinates back to full frame if detection successful
-                if results and results.pose_landmarks:
-                    for landmark in results.pose_landmarks.landmark:
-                        landmark.x = (landmark.x * (roi_x2 - roi_x1) + roi_x1) / frame.shape[1]
-                        landmark.y = (landmark.y * (roi_y2 - roi_y1) + roi_y1) / frame.shape[0]
-        
-        # If ROI processing failed or no previous landmarks, process full frame
-        if results is None or not results.pose_landmarks:
-            results = self.pose.process(frame)
-            # Reset previous landmarks if no detection
-            if not results.pose_landmarks:
-                self.previous_landmarks = None
-        
-        # Update landmarks with smoothing if detection successful
+    def tracking_roi(self, frame_shape):
+        """Pixel crop (x1, y1, x2, y2) for the next inference, or None"""
+        return self.tracker.predict(frame_shape)
+
+    def reset_tracking(self):
+        self.previous_landmarks = None
+        self.tracker.reset()
+        self.trajectory.clear()
+
+    def prepare_inference(self, frame, size=None, enhance=False, bgr=False):
+        """Letterboxed RGB inference image (cropped to the tracking ROI when
+        there is one) plus the Letterbox that maps landmarks back"""
+        letterbox = Letterbox(frame.shape, size or self.inference_size,
+                              self.tracking_roi(frame.shape), enhance, bgr)
+        return letterbox.apply(frame), letterbox
+
+    def infer(self, image, letterbox, frame=None):
+        """Run the pose graph on a prepared inference image. A miss inside
+        the ROI is not retried; the tracker widens or drops the next crop."""
+        results = self.pose.process(image)
+        points = None
         if results.pose_landmarks:
+            points = letterbox.to_frame(landmarks_to_array(results.pose_landmarks))
+            write_landmarks(results.pose_landmarks, points)
+        self.tracker.update(points, letterbox.cropped)
+        
+        # Reset previous landmarks if no detection
+        if not results.pose_landmarks:
+            self.previous_landmarks = None
+        else:
+            # Update landmarks with smoothing if detection successful
             results.pose_landmarks = self.smooth_landmarks(results.pose_landmarks)
             self.previous_landmarks = results.pose_landmarks
         
         return results
 
+    def process_frame(self, frame, bgr=False):
+        """Process frame with ROI tracking and automatic reset"""
+        image, letterbox = self.prepare_inference(frame, bgr=bgr)
+        return self.infer(image, letterbox, frame)
+
     def draw_2d_pose(self, frame, results):
         if results.pose_landmarks:
             # Draw landmarks with thicker lines for visibility
@@ -116,7 +136,7 @@ class PoseVisualizer:
         
         return frame
 
-    def visualize_3d_pose(self, results):
+    def visualize_3d_pose(self, results, trajectory_path=None):
         self._setup_3d_plot()
         if results.pose_world_landmarks:
             print("Found world landmarks, drawing 3D pose...")  # Debug log
@@ -125,7 +145,7 @@ class PoseVisualizer:
                 'azimuth': self.azim,
                 'z_offset': self.z_offset
             }
-            self._draw_pose(results.pose_world_landmarks, view_params)
+            self._draw_pose(results.pose_world_landmarks, view_params, trajectory_path)
         else:
             print("No world landmarks found")  # Debug log
         self._update_view()
@@ -163,7 +183,7 @@ class PoseVisualizer:
         self.ax.set_zlabel('Z', fontsize=8, labelpad=8)
         self.ax.tick_params(axis='both', which='major', labelsize=7, length=4, width=1)
 
-    def _draw_pose(self, landmarks, view_params):
+    def _draw_pose(self, landmarks, view_params, trajectory_path=None):
         """Draw 3D pose with landmarks"""
         print("Drawing 3D pose...")  # Debug log
         
@@ -215,6 +235,10 @@ class PoseVisualizer:
         
         # Plot landmarks
         self.ax.scatter(x, y, z, c='r', s=50)
+
+        if trajectory_path is not None:
+            self._draw_trajectory_3d(trajectory_path, (centroid_x, centroid_y, centroid_z),
+                                     scale_factor)
         
         # Set view limits
         max_range = 1.0
@@ -224,6 +248,18 @@ class PoseVisualizer:
         
         print("3D pose drawing completed")  # Debug log
 
+    def _draw_trajectory_3d(self, path, centroid, scale_factor):
+        """Wrist path as one line collection, in the pose's plot coordinates"""
+        world = path.world
+        points = (np.column_stack([-world[:, 2], world[:, 0], -world[:, 1]]) - centroid) * scale_factor
+        keep = np.isfinite(points).all(axis=1)
+        keep = keep[:-1] & keep[1:] & (path.fade > 0)
+        if not keep.any():
+            return
+        segments = np.stack([points[:-1], points[1:]], axis=1)[keep]
+        rgba = np.column_stack([path.colors[keep][:, ::-1] / 255.0, path.alphas[keep]])
+        self.ax.add_collection3d(Line3DCollection(segments, colors=rgba, linewidths=3))
+
     def _update_view(self):
         self.ax.view_init(elev=self.elev, azim=self.azim)
         controls_text = "I/K: Tilt | J/L: Rotate | U/N: Height"
@@ -288,7 +324,10 @@ class PoseVisualizer:
 
     def cleanup(self):
         """Cleanup resources"""
-        self.pose.close()
+        if self.model_controller is not None:
+            self.model_controller.close()
+        else:
+            self.pose.close()
         plt.close(self.fig)
 
     # ... (rest of the methods) 
\ No newline at end of file
@@ -0,0 +1,194 @@
+import time
+
+from utils.landmarks import (PoseResults, copy_landmarks, landmarks_to_array,
+                             write_landmarks)
+
+CHANNELS = ('capture', 'inference', 'render_3d', 'display')
+
+
+class _Channel:
+    def __init__(self, rate):
+        self.target_rate = rate      # Hz, None = every frame
+        self.effective_rate = rate
+        self.next_time = 0.0
+        self.latency = None          # EMA of observed work time (seconds)
+
+
+class RateGovernor:
+    """Independent target rates for capture, inference, 3D rendering and
+    display.
+
+    ``due(channel)`` answers "should this channel do work on this frame?"
+    and books the next slot when it says yes. With ``adaptive`` set, the
+    inference rate is lowered so inference takes at most
+    ``inference_budget`` of wall time, given its measured latency; the
+    frames in between still get displayed with the most recent pose.
+
+    Channels share no state, so in a threaded pipeline each one may be
+    driven from its own stage, as long as a channel stays with one stage.
+    """
+
+    def __init__(self, capture_hz=None, inference_hz=None, render_3d_hz=15,
+                 display_hz=60, adaptive=True, inference_budget=0.6,
+                 min_inference_hz=5.0, smoothing=0.2):
+        self.channels = {
+            'capture': _Channel(capture_hz),
+            'inference': _Channel(inference_hz),
+            'render_3d': _Channel(render_3d_hz),
+            'display': _Channel(display_hz),
+        }
+        self.adaptive = adaptive
+        self.inference_budget = inference_budget
+        self.min_inference_hz = min_inference_hz
+        self.smoothing = smoothing
+
+    def set_rate(self, channel, hz):
+        state = self.channels[channel]
+        state.target_rate = hz
+        state.effective_rate = hz
+        state.next_time = 0.0
+
+    def rate(self, channel):
+        """Current effective rate in Hz (None = unlimited)"""
+        return self.channels[channel].effective_rate
+
+    def due(self, channel, now=None):
+        state = self.channels[channel]
+        rate = state.effective_rate
+        if not rate:
+            return True
+        now = time.perf_counter() if now is None else now
+        if now < state.next_time:
+            return False
+        interval = 1.0 / rate
+        # Stay on the grid, but never try to catch up on missed slots
+        state.next_time = max(state.next_time + interval, now + interval * 0.5)
+        return True
+
+    def wake(self, channel):
+        """Make the channel due immediately (e.g. motion after idling)"""
+        self.channels[channel].next_time = 0.0
+
+    def observe(self, channel, latency):
+        """Feed the measured work time of one run of ``channel`` (seconds)"""
+        state = self.channels[channel]
+        if state.latency is None:
+            state.latency = latency
+        else:
+            state.latency += self.smoothing * (latency - state.latency)
+
+        if channel == 'inference' and self.adaptive and state.latency > 0:
+            affordable = self.inference_budget / state.latency
+            if state.target_rate:
+                affordable = min(affordable, state.target_rate)
+            state.effective_rate = max(self.min_inference_hz, affordable)
+
+    def throttle(self, packets):
+        """Drop source packets that arrive faster than the capture rate"""
+        for packet in packets:
+            if self.due('capture', packet.timestamp):
+                yield packet
+
+    def stats(self):
+        return {
+            name: {
+                'target_hz': state.target_rate,
+                'effective_hz': state.effective_rate,
+                'latency_ms': None if state.latency is None else state.latency * 1000.0,
+            }
+            for name, state in self.channels.items()
+        }
+
+
+class LandmarkHold:
+    """Keeps the latest pose so skipped inference frames can reuse it,
+    optionally extrapolated with the velocity between the last two fresh
+    results (capped at ``max_extrapolation`` seconds)."""
+
+    def __init__(self, extrapolate=False, max_extrapolation=0.15):
+        self.extrapolate = extrapolate
+        self.max_extrapolation = max_extrapolation
+        self.results = None
+        self.timestamp = None
+        self._arrays = None      # (image, world) landmark arrays of the last result
+        self._velocity = None    # (image, world) per-second velocities
+
+    def update(self, results, timestamp):
+        """Store a fresh inference result"""
+        self.results = results
+        if not results.pose_landmarks:
+            self._arrays = None
+            self._velocity = None
+            self.timestamp = timestamp
+            return
+        arrays = (
+            landmarks_to_array(results.pose_landmarks),
+            landmarks_to_array(results.pose_world_landmarks) if results.pose_world_landmarks else None,
+        )
+        if self.extrapolate and self._arrays is not None and self.timestamp is not None:
+            dt = timestamp - self.timestamp
+            if dt > 0:
+                self._velocity = tuple(
+                    None if new is None or old is None else (new[:, :3] - old[:, :3]) / dt
+                    for new, old in zip(arrays, self._arrays)
+                )
+        self._arrays = arrays
+        self.timestamp = timestamp
+
+    def get(self, timestamp):
+        """Pose for a frame captured at ``timestamp`` without running inference"""
+        if self.results is None:
+            return None
+        if not self.extrapolate or self._velocity is None or not self.results.pose_landmarks:
+            return self.results
+        dt = min(max(timestamp - self.timestamp, 0.0), self.max_extrapolation)
+        if dt == 0.0:
+            return self.results
+
+        predicted = []
+        sources = (self.results.pose_landmarks, self.results.pose_world_landmarks)
+        for source, array, velocity in zip(sources, self._arrays, self._velocity):
+            if source is None or array is None or velocity is None:
+                predicted.append(source)
+                continue
+            moved = array[:, :3] + velocity * dt
+            predicted.append(write_landmarks(copy_landmarks(source), moved))
+        return PoseResults(*predicted)
+
+    def reset(self):
+        self.results = None
+        self.timestamp = None
+        self._arrays = None
+        self._velocity = None
+
+
+def add_rate_arguments(parser):
+    """Add the shared rate-governor options to a parser"""
+    parser.add_argument('--capture-hz', type=float, default=None,
+                        help="drop source frames above this rate (default: unlimited)")
+    parser.add_argument('--inference-hz', type=float, default=None,
+                        help="upper bound on pose inference rate (default: every frame)")
+    parser.add_argument('--render-3d-hz', type=float, default=15.0,
+                        help="3D view refresh rate (default 15)")
+    parser.add_argument('--display-hz', type=float, default=60.0,
+                        help="preview refresh rate (default 60)")
+    parser.add_argument('--no-adaptive-inference', action='store_true',
+                        help="do not lower the inference rate when inference is slow")
+    parser.add_argument('--extrapolate', action='store_true',
+                        help="extrapolate landmarks on frames without inference")
+    parser.add_argument('--keyframe-interval', type=int, default=None, metavar='N',
+                        help="run MediaPipe every N frames and track landmarks with "
+                             "optical flow in between (replaces the inference rate)")
+    parser.add_argument('--motion-gate', action='store_true',
+                        help="reuse the last pose and idle inference while the scene is static")
+    return parser
+
+
+def governor_from_args(args):
+    return RateGovernor(
+        capture_hz=args.capture_hz,
+        inference_hz=args.inference_hz,
+        render_3d_hz=args.render_3d_hz or None,
+        display_hz=args.display_hz or None,
+        adaptive=not args.no_adaptive_inference,
+    )
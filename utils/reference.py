@@ -0,0 +1,338 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from utils.features import ANGLE_NAMES
+from utils.swing_phases import PHASES
+
+SEQUENCE_LENGTH = 64    # Samples per normalized swing
+ANGLE_SCALE = 180.0     # Degrees per normalized unit
+_TRUNK = ANGLE_NAMES.index('trunk_rotation')
+
+
+def normalize_swing(angles, timestamps, start, end, length=SEQUENCE_LENGTH):
+    """Resample the (T, 9) joint angles of one swing, from ``start`` to
+    ``end`` seconds, onto ``length`` evenly spaced samples scaled to about
+    [-1, 1]. Frames with NaN angles are skipped. Trunk rotation is unwrapped
+    so it stays continuous through +-180 degrees. Returns (length, 9)
+    float32, or None when the swing has fewer than two usable frames."""
+    angles = np.asarray(angles, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    keep = (timestamps >= start) & (timestamps <= end) & np.isfinite(angles).all(axis=1)
+    if keep.sum() < 2:
+        return None
+    times, angles = timestamps[keep], angles[keep].copy()
+    trunk = np.unwrap(angles[:, _TRUNK], period=360.0)
+    angles[:, _TRUNK] = trunk - 360.0 * np.round(trunk.mean() / 360.0)
+    samples = np.linspace(times[0], times[-1], length)
+    resampled = np.stack([np.interp(samples, times, angles[:, j])
+                          for j in range(angles.shape[1])], axis=1)
+    return (resampled / ANGLE_SCALE).astype(np.float32)
+
+
+def phase_labels(events, length=SEQUENCE_LENGTH):
+    """Phase name of each normalized sample of a swing (``split_swings``
+    output: preparation ... idle)"""
+    start, end = events[0].timestamp, events[-1].timestamp
+    samples = np.linspace(start, end, length)
+    times = np.array([e.timestamp for e in events[:-1]])
+    index = np.clip(np.searchsorted(times, samples, side='right') - 1, 0, len(times) - 1)
+    return [events[i].phase for i in index]
+
+
+def _wrap_trunk(error):
+    """Wrap the trunk rotation column of (..., 9) degree differences into
+    [-180, 180)"""
+    error[..., _TRUNK] = (error[..., _TRUNK] + 180.0) % 360.0 - 180.0
+    return error
+
+
+def _save_atomic(path, array):
+    """np.save through a temporary file, so neither this process's memory
+    maps nor other readers ever see a partly written array"""
+    handle, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            np.save(f, array)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+def envelope(sequences, radius):
+    """Running max / min over +-radius samples: (..., L, J) -> upper, lower"""
+    pad = [(0, 0)] * (sequences.ndim - 2) + [(radius, radius), (0, 0)]
+    upper = np.pad(sequences, pad, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(upper, 2 * radius + 1, axis=-2)
+    return windows.max(axis=-1), windows.min(axis=-1)
+
+
+def lb_kim(query, first_last):
+    """LB_Kim (first and last point) of one query against (N, 2, J)"""
+    ends = query[[0, -1]]
+    return ((first_last - ends) ** 2).sum(axis=(1, 2))
+
+
+def lb_keogh(query, upper, lower):
+    """LB_Keogh of one (L, J) query against (N, L, J) envelopes"""
+    above = np.maximum(query - upper, 0.0)
+    below = np.maximum(lower - query, 0.0)
+    return (above ** 2 + below ** 2).sum(axis=(1, 2))
+
+
+def banded_dtw(query, candidates, radius, abandon=np.inf, return_cost=False):
+    """DTW distances (sum of squared errors) between one (L, J) query and
+    (K, L, J) candidates inside a Sakoe-Chiba band of ``radius`` samples.
+
+    Works in band coordinates (row i, offset d = j - i), vectorized over the
+    candidates and the band; the in-row dependency is a prefix minimum.
+    Candidates whose best partial cost exceeds ``abandon`` are dropped
+    (distance inf) as soon as they do. With
+    ``return_cost`` also returns the (K, L, 2r + 1) accumulated cost for
+    ``warping_path``."""
+    count, length, _ = candidates.shape
+    offsets = np.arange(-radius, radius + 1)
+    columns = np.arange(length)[:, None] + offsets          # (L, 2r+1)
+    valid = (columns >= 0) & (columns < length)
+    gathered = candidates[:, np.clip(columns, 0, length - 1)]  # (K, L, 2r+1, J)
+    cost = ((gathered - query[None, :, None, :]) ** 2).sum(axis=-1)
+    cost = np.where(valid, cost, 0.0)
+
+    width = 2 * radius + 1
+    previous = np.full((count, width), np.inf)
+    rows = np.empty((count, length, width)) if return_cost else None
+    active = np.arange(count)       # Candidates not abandoned yet
+    for i in range(length):
+        if i == 0:
+            t = np.full((len(active), width), np.inf)
+            t[:, radius] = cost[:, 0, radius]
+        else:
+            # Diagonal (i-1, j-1) is offset d; vertical (i-1, j) is offset d+1
+            vertical = np.concatenate([previous[:, 1:], np.full((len(active), 1), np.inf)], axis=1)
+            t = cost[:, i] + np.minimum(previous, vertical)
+        t = np.where(valid[i], t, np.inf)
+        running = np.cumsum(cost[:, i], axis=1)
+        row = running + np.minimum.accumulate(t - running, axis=1)
+        row = np.where(valid[i], row, np.inf)
+        if rows is not None:
+            rows[:, i] = row
+        previous = row
+        if rows is None and np.isfinite(abandon):
+            keep = row.min(axis=1) <= abandon
+            if not keep.all():
+                active, cost, previous = active[keep], cost[keep], previous[keep]
+                if not len(active):
+                    break
+    distances = np.full(count, np.inf)
+    distances[active] = previous[:, radius]
+    return (distances, rows) if return_cost else distances
+
+
+def warping_path(rows, radius):
+    """Backtrack one (L, 2r + 1) accumulated cost into [(i, j)] pairs"""
+    length = rows.shape[0]
+    i, d = length - 1, radius
+    path = [(i, i + d - radius)]
+    while i > 0 or d != radius:
+        steps = []
+        if d > 0:
+            steps.append((rows[i, d - 1], i, d - 1))          # (i, j-1)
+        if i > 0:
+            steps.append((rows[i - 1, d], i - 1, d))          # (i-1, j-1)
+            if d + 1 < rows.shape[1]:
+                steps.append((rows[i - 1, d + 1], i - 1, d + 1))  # (i-1, j)
+        _, i, d = min(steps, key=lambda step: step[0])
+        path.append((i, i + d - radius))
+    return path[::-1]
+
+
+class Comparison:
+    """Best expert match for one swing, with per-joint deviations in degrees
+    (user minus expert, along the warping path), overall and per phase"""
+
+    def __init__(self, reference, distance, deviations, phase_deviations, stats):
+        self.reference = reference                # Library entry metadata
+        self.distance = distance                  # Mean squared error per aligned sample
+        self.deviations = deviations              # {joint: degrees}
+        self.phase_deviations = phase_deviations  # {phase: {joint: degrees}}
+        self.stats = stats                        # Pruning counts
+
+    def worst(self, count=3):
+        """The largest (phase, joint, degrees) deviations"""
+        items = [(phase, joint, value)
+                 for phase, joints in self.phase_deviations.items()
+                 for joint, value in joints.items()]
+        return sorted(items, key=lambda item: -abs(item[2]))[:count]
+
+
+class ReferenceLibrary:
+    """On-disk library of normalized expert swings.
+
+    ``path`` holds ``sequences.npy`` (N, L, 9), the precomputed LB_Keogh
+    envelopes ``upper.npy`` / ``lower.npy``, ``first_last.npy`` for LB_Kim
+    and ``index.json`` with one metadata entry per swing. Arrays are memory
+    mapped, so only the rows that survive pruning are read.
+
+    Matching bounds every reference with LB_Kim and a subsampled LB_Keogh,
+    seeds the best-so-far with DTW on the few lowest bounds, prunes the rest
+    with the full LB_Keogh and then runs banded DTW in order of increasing
+    lower bound until the bound exceeds the k-th best distance.
+    """
+
+    def __init__(self, path, length=SEQUENCE_LENGTH, band=0.1, seed=8, batch=32, coarse_step=4):
+        self.path = path
+        self.seed = seed            # DTW runs that set the first best-so-far
+        self.batch = batch          # Candidates per vectorized DTW call
+        self.coarse_step = coarse_step
+        self.entries = []
+        self._arrays = None
+        if os.path.exists(os.path.join(path, 'index.json')):
+            with open(os.path.join(path, 'index.json')) as f:
+                index = json.load(f)
+            self.length = index['length']
+            self.radius = index['radius']
+            self.entries = index['entries']
+            self._arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+                            for name in ('sequences', 'upper', 'lower', 'first_last')}
+        else:
+            self.length = length
+            self.radius = max(1, int(round(band * length)))
+        self._pending = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, name, angles, timestamps, events, **meta):
+        """Add the swing delimited by ``events`` (one ``split_swings`` item)
+        from a (T, 9) angle sequence; extra keyword arguments (e.g. sport)
+        are stored with it. Call ``save`` to write it to disk."""
+        sequence = normalize_swing(angles, timestamps, events[0].timestamp,
+                                   events[-1].timestamp, self.length)
+        if sequence is None:
+            return False
+        start, end = events[0].timestamp, events[-1].timestamp
+        entry = dict(meta, name=name, duration=end - start,
+                     phases={e.phase: (e.timestamp - start) / (end - start) for e in events[:-1]})
+        self.entries.append(entry)
+        self._pending.append(sequence)
+        return True
+
+    def save(self):
+        """Append pending swings (and their envelopes) to the files on disk"""
+        if not self._pending:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        added = np.stack(self._pending)
+        upper, lower = envelope(added, self.radius)
+        arrays = {'sequences': added, 'upper': upper, 'lower': lower,
+                  'first_last': added[:, [0, -1]]}
+        if self._arrays is not None:
+            arrays = {name: np.concatenate([np.asarray(self._arrays[name]), array])
+                      for name, array in arrays.items()}
+        # Drop the maps of the old files before replacing them
+        self._arrays = None
+        for name, array in arrays.items():
+            _save_atomic(os.path.join(self.path, f"{name}.npy"), array.astype(np.float32))
+        index = os.path.join(self.path, 'index.json')
+        with open(index + '.tmp', 'w') as f:
+            json.dump({'length': self.length, 'radius': self.radius,
+                       'angles': list(ANGLE_NAMES), 'entries': self.entries}, f, indent=1)
+        os.replace(index + '.tmp', index)
+        self._pending = []
+        self._arrays = {name: np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r')
+                        for name in arrays}
+
+    def nearest(self, query, k=1):
+        """k nearest references of a normalized (L, 9) query by banded DTW.
+        Returns ([(index, distance)], stats)"""
+        stats = {'references': len(self), 'coarse_pruned': 0, 'keogh_pruned': 0, 'dtw': 0}
+        if self._arrays is None:
+            return [], stats
+        arrays = self._arrays
+        query = np.asarray(query, dtype=np.float32)
+        best = {}  # index -> distance
+
+        def kth_best():
+            if len(best) < k:
+                return np.inf
+            return sorted(best.values())[k - 1]
+
+        def run_dtw(indices):
+            indices = np.sort(indices)
+            distances = banded_dtw(query, np.asarray(arrays['sequences'][indices]),
+                                   self.radius, kth_best())
+            stats['dtw'] += len(indices)
+            for index, distance in zip(indices, distances):
+                if np.isfinite(distance):
+                    best[int(index)] = float(distance)
+
+        # Cheap bounds on everything: LB_Kim and LB_Keogh over every
+        # coarse_step-th sample (a partial sum, so still a lower bound)
+        step = self.coarse_step
+        bound = np.maximum(lb_kim(query, arrays['first_last']),
+                           lb_keogh(query[::step], arrays['upper'][:, ::step],
+                                    arrays['lower'][:, ::step]))
+        order = np.argsort(bound)
+        seeds = max(k, self.seed)
+        run_dtw(order[:seeds])
+        rest = order[seeds:]
+        survivors = np.sort(rest[bound[rest] <= kth_best()])
+        stats['coarse_pruned'] = len(rest) - len(survivors)
+        if not len(survivors):
+            return sorted(best.items(), key=lambda item: item[1])[:k], stats
+
+        # Full LB_Keogh on the survivors, then DTW in order of the bound
+        keogh = np.maximum(bound[survivors], lb_keogh(query, arrays['upper'][survivors],
+                                                      arrays['lower'][survivors]))
+        order = np.argsort(keogh)
+        survivors, keogh = survivors[order], keogh[order]
+        position = 0
+        while position < len(survivors) and keogh[position] <= kth_best():
+            end = position + self.batch
+            run_dtw(survivors[position:end][keogh[position:end] <= kth_best()])
+            position = end
+        stats['keogh_pruned'] = len(survivors) - (stats['dtw'] - seeds)
+        return sorted(best.items(), key=lambda item: item[1])[:k], stats
+
+    def compare(self, angles, timestamps, events, k=1):
+        """Compare one swing (``split_swings`` item over a (T, 9) angle
+        sequence) with its nearest expert swing; None if nothing matches"""
+        query = normalize_swing(angles, timestamps, events[0].timestamp,
+                                events[-1].timestamp, self.length)
+        if query is None:
+            return None
+        matches, stats = self.nearest(query, k)
+        if not matches:
+            return None
+        index, distance = matches[0]
+        reference = np.asarray(self._arrays['sequences'][index])
+        _, rows = banded_dtw(query, reference[None], self.radius, return_cost=True)
+        path = np.array(warping_path(rows[0], self.radius))
+        error = _wrap_trunk((query[path[:, 0]] - reference[path[:, 1]]) * ANGLE_SCALE)
+
+        labels = np.array(phase_labels(events, self.length))[path[:, 0]]
+        phase_deviations = {}
+        for phase in PHASES:
+            mask = labels == phase
+            if mask.any():
+                phase_deviations[phase] = dict(zip(ANGLE_NAMES, error[mask].mean(axis=0).tolist()))
+        stats['matches'] = [(self.entries[i]['name'], d) for i, d in matches]
+        return Comparison(self.entries[index], distance / len(path),
+                          dict(zip(ANGLE_NAMES, error.mean(axis=0).tolist())),
+                          phase_deviations, stats)
+
+
+def add_reference_arguments(parser):
+    parser.add_argument('--library', metavar='DIR',
+                        help="compare each completed swing with the expert swings in DIR")
+
+
+def library_from_args(args):
+    if not getattr(args, 'library', None):
+        return None
+    library = ReferenceLibrary(args.library)
+    print(f"Reference library: {len(library)} expert swings")
+    return library
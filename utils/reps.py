@@ -0,0 +1,277 @@
+import numpy as np
+from scipy.signal import lfilter, lfilter_zi
+
+from utils.features import ANGLE_NAMES
+
+REP_PHASES = ('top', 'descent', 'bottom', 'ascent')
+
+
+def _signal(angles, joint):
+    """The tracked angle of (..., 9) angles: a named angle, or the mean of
+    the left and right ones ('knee', 'elbow', ...), ignoring a NaN side"""
+    angles = np.asarray(angles, dtype=np.float32)
+    if joint in ANGLE_NAMES:
+        return angles[..., ANGLE_NAMES.index(joint)]
+    pair = angles[..., [ANGLE_NAMES.index('left_' + joint), ANGLE_NAMES.index('right_' + joint)]]
+    finite = np.isfinite(pair)
+    with np.errstate(invalid='ignore'):
+        return np.where(finite, pair, 0).sum(axis=-1) / finite.sum(axis=-1)
+
+
+class RepCounter:
+    """Streaming repetition counter over one joint angle (both knees by
+    default, for squats).
+
+    The angle is smoothed with an EMA (factor ``smoothing``) and split into
+    tops and bottoms by peak/valley detection with hysteresis: an extreme
+    is confirmed once the angle has moved ``hysteresis`` degrees back from
+    it. A top -> bottom -> top cycle with at least ``min_rom`` degrees of
+    range is a rep. The angle counts as at the top or bottom while within
+    ``band`` degrees of the extreme, which splits each rep into descent,
+    bottom and ascent; time under tension runs from leaving the top to
+    reaching it again. A rep ends on getting back within ``band`` of the
+    top it started from, or, when it falls short, once the next top is
+    confirmed.
+
+    Memory is constant: the first time the angle crossed each of a fixed
+    set of levels (every ``level_step`` degrees) since the last extreme
+    stands in for the frame history, so band entry times are exact to
+    within one level.
+    """
+
+    def __init__(self, joint='knee', smoothing=0.5, hysteresis=20.0, band=10.0, min_rom=30.0,
+                 hold_speed=20.0, speed_smoothing=0.2, level_step=2.5):
+        self.joint = joint
+        self.smoothing = smoothing
+        self.hysteresis = hysteresis
+        self.band = band
+        self.min_rom = min_rom
+        self.hold_speed = hold_speed    # deg/s below which the angle is held
+        self.speed_smoothing = speed_smoothing  # EMA of the angular speed for the phase
+        self.level_step = level_step
+        self.levels = np.arange(-180.0, 180.0 + level_step, level_step)
+        self._down = np.empty_like(self.levels)   # First time below each level since the top
+        self._up = np.empty_like(self.levels)     # First time above each level since the bottom
+        self.reset()
+
+    def reset(self):
+        self.reps = 0
+        self.phase = 'top'
+        self.last_rep = None
+        self.time_under_tension = 0.0
+        self._value = None
+        self._time = None
+        self._speed = 0.0
+        self._looking = 'max'     # Extreme being tracked
+        self._extreme = None
+        self._near = None         # Last time within band of the tracked extreme
+        self._top = None          # (value, time it was left) of the confirmed top
+        self._bottom = None       # (value, entered, left) of the confirmed bottom
+        self._down.fill(np.nan)
+        self._up.fill(np.nan)
+
+    def update(self, features):
+        """Advance by one frame of ``FeatureEngine`` features; returns the
+        rep completed on this frame, or None"""
+        if features is None:
+            return None
+        value = float(_signal(features['angles'], self.joint))
+        if not np.isfinite(value):
+            return None
+        timestamp = float(features['timestamp'])
+        if self._value is None:
+            self._value, self._time = value, timestamp
+            self._track('max', value, timestamp)
+            return None
+        previous, dt = self._value, timestamp - self._time
+        self._value += self.smoothing * (value - self._value)
+        self._time = timestamp
+        x = self._value
+
+        down, up = self._down, self._up
+        down[np.isnan(down) & (self.levels > x)] = timestamp
+        up[np.isnan(up) & (self.levels < x)] = timestamp
+
+        rep = None
+        if self._looking == 'max':
+            if x > self._extreme:
+                self._track('max', x, timestamp)
+            elif x >= self._extreme - self.band:
+                self._near = timestamp
+            elif x < self._extreme - self.hysteresis:
+                if self._bottom is not None:
+                    rep = self._finish(float(up[self._level(self._extreme, False)]))
+                self._top = (self._extreme, self._near)
+                self._track('min', x, timestamp)
+        else:
+            if x < self._extreme:
+                self._track('min', x, timestamp)
+            elif x <= self._extreme + self.band:
+                self._near = timestamp
+            elif x > self._extreme + self.hysteresis:
+                self._confirm_bottom(self._extreme, self._near)
+                self._track('max', x, timestamp)
+        if self._bottom is not None:
+            entered = up[self._level(self._top[0], False)]
+            if not np.isnan(entered):
+                rep = self._finish(float(entered))
+
+        if dt > 0:
+            self._speed += self.speed_smoothing * ((x - previous) / dt - self._speed)
+        # Moving phases end at half the speed that starts them
+        moving = {'descent': -self._speed, 'ascent': self._speed}.get(self.phase, 0.0)
+        if moving <= self.hold_speed / 2:
+            if self._speed < -self.hold_speed:
+                self.phase = 'descent'
+            elif self._speed > self.hold_speed:
+                self.phase = 'ascent'
+            else:
+                self.phase = 'bottom' if self._at_bottom(x) else 'top'
+        return rep
+
+    def _track(self, looking, x, timestamp):
+        """Start tracking a new extreme; crossings restart from it"""
+        self._looking, self._extreme, self._near = looking, x, timestamp
+        crossings = self._down if looking == 'max' else self._up
+        crossings.fill(np.nan)
+        crossings[(self.levels > x) if looking == 'max' else (self.levels < x)] = timestamp
+
+    def _at_bottom(self, x):
+        # Past a top with no bottom confirmed yet, or still near the bottom
+        return self._looking == 'min' or \
+            (self._bottom is not None and x <= self._bottom[0] + self.band)
+
+    def _level(self, value, down):
+        """Index of the level that marks entering the band around ``value``"""
+        if down:
+            index = np.floor((value + self.band - self.levels[0]) / self.level_step)
+        else:
+            index = np.ceil((value - self.band - self.levels[0]) / self.level_step)
+        return int(np.clip(index, 0, len(self.levels) - 1))
+
+    def _confirm_bottom(self, value, left):
+        self._bottom = (value, float(self._down[self._level(value, True)]), left)
+
+    def _finish(self, top_entered):
+        """Close the rep started at the last top; None when too shallow"""
+        rep = _make_rep(self._top, self._bottom, top_entered)
+        self._bottom = None
+        if rep['rom'] < self.min_rom:
+            return None
+        self.reps += 1
+        self.last_rep = rep
+        self.time_under_tension += rep['time_under_tension']
+        return rep
+
+    def summary(self):
+        """Snapshot for the analysis quadrant"""
+        return {
+            'reps': self.reps,
+            'phase': self.phase,
+            'active': self.reps > 0 or self._bottom is not None,
+            'last_rep': self.last_rep,
+            'time_under_tension': self.time_under_tension,
+        }
+
+    def count(self, features):
+        """Bulk counterpart of ``update``: the reps of a whole
+        ``compute_features`` sequence (T frames), as a list of rep dicts.
+
+        The same filter runs as one ``lfilter`` call; the extremes are found
+        by a walk that jumps from one confirmation to the next with
+        vectorized searches over windows that grow until they contain it, so
+        the Python loop runs a few times per rep. Streaming state is left
+        untouched."""
+        values = _signal(features['angles'], self.joint)
+        timestamps = np.asarray(features['timestamp'], dtype=np.float64)
+        valid = np.isfinite(values)
+        values, timestamps = values[valid].astype(np.float64), timestamps[valid]
+        count = len(values)
+        if count < 2:
+            return []
+        a = self.smoothing
+        b, den = [a], [1.0, a - 1.0]
+        x, _ = lfilter(b, den, values, zi=lfilter_zi(b, den) * values[0])
+
+        def confirm(start, sign):
+            """(extreme frame, confirming frame) of the extreme tracked from
+            ``start``, or None when the sequence ends first"""
+            window = 256
+            while True:
+                segment = sign * x[start:start + window]
+                running = np.maximum.accumulate(segment)
+                hit = np.flatnonzero(segment < running - self.hysteresis)
+                if hit.size:
+                    end = start + int(hit[0])
+                    return start + int(np.argmax(segment[:hit[0]])), end
+                if start + window >= count:
+                    return None
+                window *= 2
+
+        def last_near(extreme, end, sign):
+            near = sign * x[extreme:end] >= sign * x[extreme] - self.band
+            return float(timestamps[extreme + np.flatnonzero(near)[-1]])
+
+        def first_cross(start, stop, value, down):
+            """Time the band around ``value`` was entered, or None"""
+            level = self.levels[self._level(value, down)]
+            crossed = x[start:stop + 1] < level if down else x[start:stop + 1] > level
+            if not crossed.any():
+                return None
+            return float(timestamps[start + int(np.argmax(crossed))])
+
+        reps = []
+        found = confirm(0, 1)
+        if found is None:
+            return reps
+        top, start = found
+        top_left = last_near(top, start, 1)
+        while True:
+            found = confirm(start, -1)
+            if found is None:
+                break
+            bottom, start = found
+            bottom_state = (x[bottom], first_cross(top, bottom, x[bottom], True),
+                            last_near(bottom, start, -1))
+            found = confirm(start, 1)
+            # Back at the starting top before the next top is confirmed?
+            entered = first_cross(bottom, found[1] if found else count - 1, x[top], False)
+            if entered is None and found is not None:
+                entered = first_cross(bottom, found[0], x[found[0]], False)
+            if entered is not None:
+                rep = _make_rep((x[top], top_left), bottom_state, entered)
+                if rep['rom'] >= self.min_rom:
+                    reps.append(rep)
+            if found is None:
+                break
+            next_top, start = found
+            top, top_left = next_top, last_near(next_top, start, 1)
+        return reps
+
+
+def _make_rep(top, bottom, top_entered):
+    """Rep dict from the starting top (value, left), the bottom (value,
+    entered, left) and the time the next top was reached"""
+    top_value, start = top
+    bottom_value, bottom_entered, bottom_left = bottom
+    return {
+        'start': start,
+        'end': top_entered,
+        'descent': bottom_entered - start,
+        'bottom': bottom_left - bottom_entered,
+        'ascent': top_entered - bottom_left,
+        'time_under_tension': top_entered - start,
+        'rom': float(top_value - bottom_value),
+        'top_angle': float(top_value),
+        'bottom_angle': float(bottom_value),
+    }
+
+
+def tempo(rep):
+    """Descent-bottom-ascent seconds, e.g. '2.0-0.5-1.0'"""
+    return f"{rep['descent']:.1f}-{rep['bottom']:.1f}-{rep['ascent']:.1f}"
+
+
+def count_reps(features, **kwargs):
+    """Bulk reps of a ``compute_features`` sequence"""
+    return RepCounter(**kwargs).count(features)
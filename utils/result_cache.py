@@ -0,0 +1,164 @@
+import hashlib
+import importlib
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from utils.metrics import METRICS
+from utils.swing_phases import PhaseEvent
+
+CACHE_HITS = METRICS.counter('result_cache_total', result='hit')
+CACHE_MISSES = METRICS.counter('result_cache_total', result='miss')
+CACHE_EVICTIONS = METRICS.counter('result_cache_total', result='evicted')
+
+
+def code_version(*modules):
+    """Digest of the source files of ``modules`` (names or module objects),
+    so cached results are invalidated when the code producing them changes"""
+    digest = hashlib.sha256()
+    for module in modules:
+        module = importlib.import_module(module) if isinstance(module, str) else module
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def events_to_arrays(events):
+    return {
+        'phases': np.array([e.phase for e in events], dtype='U16'),
+        'timestamps': np.array([e.timestamp for e in events], dtype=np.float64),
+        'hands': np.array([e.hand or '' for e in events], dtype='U8'),
+    }
+
+
+def events_from_arrays(arrays):
+    return [PhaseEvent(str(phase), float(timestamp), str(hand) or None)
+            for phase, timestamp, hand in zip(arrays['phases'], arrays['timestamps'],
+                                              arrays['hands'])]
+
+
+class ResultCache:
+    """Content-addressed cache of offline analysis artifacts on local disk.
+
+    Keys hash everything a result depends on: the video's content digest,
+    the settings and ``code_version`` of the stage, and the key of the stage
+    it was computed from. Changing a later stage therefore reuses the
+    earlier artifacts, while new settings or code start over from the
+    first stage they affect.
+
+    Each artifact is one ``.npz`` of arrays. Hits refresh the file's
+    modification time; once the cache exceeds ``max_bytes``, the least
+    recently used artifacts are deleted. Content digests are remembered by
+    path, size and modification time, so unchanged videos are not re-read.
+    """
+
+    def __init__(self, root, max_bytes=2 << 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._digests_path = os.path.join(root, 'digests.json')
+        self._digests = {}
+        if os.path.exists(self._digests_path):
+            with open(self._digests_path) as f:
+                self._digests = json.load(f)
+
+    def digest(self, path, block=1 << 20):
+        """SHA-256 of a file's contents"""
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        path = os.path.abspath(path)
+        known = self._digests.get(path)
+        if known is not None and known[0] == stamp:
+            return known[1]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(block), b''):
+                digest.update(data)
+        self._digests[path] = [stamp, digest.hexdigest()]
+        self._write_atomic(self._digests_path,
+                           lambda f: f.write(json.dumps(self._digests).encode()))
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(stage, *parts):
+        """Cache key of a stage from its inputs and settings (JSON-able)"""
+        text = json.dumps([stage, *parts], sort_keys=True, default=str)
+        return f"{stage}-{hashlib.sha256(text.encode()).hexdigest()[:32]}"
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.npz')
+
+    def load(self, key):
+        """The artifact's arrays, or None"""
+        path = self._path(key)
+        try:
+            with np.load(path) as arrays:
+                loaded = {name: arrays[name] for name in arrays.files}
+        except FileNotFoundError:
+            CACHE_MISSES.inc()
+            return None
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            # Damaged artifact: drop it so it is recomputed and stored again
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            CACHE_MISSES.inc()
+            return None
+        os.utime(path)
+        CACHE_HITS.inc()
+        return loaded
+
+    def store(self, key, arrays):
+        self._write_atomic(self._path(key), lambda f: np.savez(f, **arrays))
+        self.evict()
+
+    def fetch(self, key, compute):
+        """Cached arrays of ``key``, or ``compute()``'s dict of arrays, stored"""
+        arrays = self.load(key)
+        if arrays is None:
+            arrays = compute()
+            self.store(key, arrays)
+        return arrays
+
+    def evict(self):
+        """Delete the least recently used artifacts beyond ``max_bytes``,
+        always keeping the most recent one"""
+        entries = sorted((entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                         for entry in os.scandir(self.root) if entry.name.endswith('.npz'))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            CACHE_EVICTIONS.inc()
+
+    def _write_atomic(self, path, write):
+        # Readers never see a partly written file
+        handle, temp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                write(f)
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+
+def add_cache_arguments(parser):
+    parser.add_argument('--cache', metavar='DIR',
+                        help="reuse landmarks, features and swing phases cached in DIR for "
+                             "videos analyzed before with the same settings")
+    parser.add_argument('--cache-size', type=float, default=2048,
+                        help="megabytes kept in the --cache before the least recently used "
+                             "results are evicted (default 2048)")
+
+
+def cache_from_args(args):
+    if not getattr(args, 'cache', None):
+        return None
+    return ResultCache(args.cache, max_bytes=int(args.cache_size * (1 << 20)))
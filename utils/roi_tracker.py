@@ -0,0 +1,139 @@
+import bisect
+
+from utils.metrics import METRICS
+
+# Square crop sides as fractions of the frame's short side
+DEFAULT_BUCKETS = (0.25, 0.35, 0.5, 0.7, 1.0)
+
+
+class RoiTracker:
+    """Chooses the crop for the next pose inference.
+
+    The crop is a square around the last pose's bounding box, moved by the
+    box's velocity and padded by ``margin``. Its side snaps to one of a few
+    ``buckets`` (with hysteresis) so the scale MediaPipe sees stays stable.
+    A lost pose widens the crop one bucket per miss and only falls back to
+    the full frame after ``max_misses``; the full frame is also searched
+    every ``redetect_interval`` inferences to pick up people entering.
+
+    Only the bounding box is computed from the landmark array; the rest is
+    scalar bookkeeping, with the bucket found by bisection.
+    """
+
+    def __init__(self, margin=0.1, buckets=DEFAULT_BUCKETS, redetect_interval=30,
+                 max_misses=2, velocity_smoothing=0.5, min_visibility=0.3):
+        self.margin = margin
+        self.buckets = tuple(sorted(buckets))
+        self.redetect_interval = redetect_interval
+        self.max_misses = max_misses
+        self.velocity_smoothing = velocity_smoothing
+        self.min_visibility = min_visibility
+
+        self.counts = {'hit': 0, 'miss': 0, 'redetect': 0, 'fallback': 0}
+        self._counters = {name: METRICS.counter('roi_tracker_total', result=name)
+                          for name in self.counts}
+        self.reset()
+
+    def reset(self):
+        self.box = None          # (cx, cy, w, h) normalised
+        self.velocity = None     # (vx, vy) normalised per inference
+        self.bucket = None       # index into buckets
+        self.misses = 0
+        self._since_full = 0
+        self._full_reason = None
+
+    def _count(self, name):
+        self.counts[name] += 1
+        self._counters[name].inc()
+
+    def predict(self, frame_shape):
+        """Pixel crop (x1, y1, x2, y2) for the next inference, or None for
+        the full frame"""
+        self._full_reason = None
+        if self.box is None:
+            self._full_reason = 'fallback'
+            return None
+        if self.misses > self.max_misses:
+            self._full_reason = 'fallback'
+            return None
+        if self.redetect_interval and self._since_full >= self.redetect_interval:
+            self._full_reason = 'redetect'
+            return None
+
+        frame_h, frame_w = frame_shape[:2]
+        cx, cy, w, h = self.box
+        vx, vy = self.velocity if self.velocity is not None else (0.0, 0.0)
+        cx, cy = cx + vx, cy + vy
+
+        # Side in pixels needed to hold the box, its margin and its motion
+        need = max(w * frame_w + 2 * abs(vx) * frame_w,
+                   h * frame_h + 2 * abs(vy) * frame_h) * (1 + 2 * self.margin)
+        short = min(frame_w, frame_h)
+        bucket = self._pick_bucket(need / short) + self.misses
+        if bucket >= len(self.buckets):
+            self._full_reason = 'fallback'
+            return None
+        self.bucket = bucket - self.misses
+
+        side = self.buckets[bucket] * short
+        side_w, side_h = min(side, frame_w), min(side, frame_h)
+        # Shift rather than clip at the edges so the size stays quantised
+        x1 = int(round(min(max(cx * frame_w - side_w / 2, 0), frame_w - side_w)))
+        y1 = int(round(min(max(cy * frame_h - side_h / 2, 0), frame_h - side_h)))
+        return x1, y1, x1 + int(round(side_w)), y1 + int(round(side_h))
+
+    def _pick_bucket(self, fraction):
+        best = bisect.bisect_left(self.buckets, fraction)
+        current = self.bucket
+        if current is not None and best < current <= len(self.buckets) - 1:
+            # Only shrink once the box clearly fits the smaller bucket
+            if fraction > self.buckets[current - 1] * 0.85:
+                return current
+        return best
+
+    def update(self, points, cropped):
+        """Record an inference outcome; ``points`` is an (N, >=2) array of
+        normalised frame landmarks, or None if no pose was found"""
+        if cropped:
+            self._since_full += 1
+            self._count('hit' if points is not None else 'miss')
+        else:
+            self._since_full = 0
+            self._count(self._full_reason or 'fallback')
+
+        if points is None:
+            self.misses += 1
+            if not cropped:
+                self.reset()
+            return
+
+        self.misses = 0
+        visible = points
+        if points.shape[1] > 3:
+            mask = points[:, 3] >= self.min_visibility
+            if mask.sum() >= 4:
+                visible = points[mask]
+        lo = visible[:, :2].min(axis=0)
+        hi = visible[:, :2].max(axis=0)
+        cx, cy = (lo + hi) / 2
+        w, h = hi - lo
+
+        if self.box is not None:
+            step = (cx - self.box[0], cy - self.box[1])
+            if self.velocity is None:
+                self.velocity = step
+            else:
+                a = self.velocity_smoothing
+                self.velocity = (self.velocity[0] + a * (step[0] - self.velocity[0]),
+                                 self.velocity[1] + a * (step[1] - self.velocity[1]))
+        self.box = (float(cx), float(cy), float(w), float(h))
+
+    def stats(self):
+        """Counts plus hit / miss / full-frame fallback rates"""
+        cropped = self.counts['hit'] + self.counts['miss']
+        total = cropped + self.counts['redetect'] + self.counts['fallback']
+        stats = dict(self.counts)
+        stats['hit_rate'] = self.counts['hit'] / cropped if cropped else 0.0
+        stats['miss_rate'] = self.counts['miss'] / cropped if cropped else 0.0
+        stats['fallback_rate'] = self.counts['fallback'] / total if total else 0.0
+        return stats
@@ -0,0 +1,317 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from utils.features import ANGLE_NAMES
+from utils.landmarks import NUM_LANDMARKS, landmarks_to_array
+
+# name: (per-frame shape, encoding); one file per column, one column per angle
+COLUMNS = {
+    'timestamp': ((), 'f64'),
+    'landmarks': ((NUM_LANDMARKS, 4), 'q16'),
+    'world_landmarks': ((NUM_LANDMARKS, 4), 'q16'),
+    **{f'angle.{name}': ((), 'q16') for name in ANGLE_NAMES},
+    'speed': ((8,), 'q16'),
+}
+
+# Fixed-width encodings keep every column memory-mappable. Quantized codes
+# map linearly onto each chunk's per-channel [min, max]; the top code is NaN.
+ENCODINGS = {'f64': np.float64, 'f32': np.float32, 'f16': np.float16,
+             'q16': np.uint16, 'q8': np.uint8}
+
+CHUNK_DTYPE = np.dtype([('start', '<f8'), ('end', '<f8'), ('first', '<i8'), ('frames', '<i8')])
+
+
+def _quantized(encoding):
+    return encoding.startswith('q')
+
+
+def _encode(values, encoding):
+    """(frames, C) float values -> (codes, (2, C) zero/scale or None)"""
+    dtype = ENCODINGS[encoding]
+    if not _quantized(encoding):
+        return values.astype(dtype), None
+    top = np.iinfo(dtype).max
+    finite = np.isfinite(values)
+    with np.errstate(invalid='ignore'):
+        low = np.where(finite, values, np.inf).min(axis=0)
+        high = np.where(finite, values, -np.inf).max(axis=0)
+    empty = ~np.isfinite(low)
+    low[empty], high[empty] = 0.0, 0.0
+    scale = (high - low) / (top - 1)
+    scale[scale == 0] = 1.0
+    codes = np.rint((np.where(finite, values, low) - low) / scale)
+    codes = np.where(finite, np.clip(codes, 0, top - 1), top).astype(dtype)
+    return codes, np.stack([low, scale]).astype(np.float32)
+
+
+def _decode(codes, encoding, scales=None, counts=None):
+    """Decode (frames, C) codes; quantized columns need each chunk's (2, C)
+    ``scales`` and its frame ``counts``"""
+    if not _quantized(encoding):
+        return codes.astype(np.float64 if encoding == 'f64' else np.float32)
+    zero = np.repeat(scales[:, 0], counts, axis=0)
+    scale = np.repeat(scales[:, 1], counts, axis=0)
+    values = codes.astype(np.float32) * scale + zero
+    values[codes == np.iinfo(ENCODINGS[encoding]).max] = np.nan
+    return values
+
+
+def _file_name(column, suffix):
+    return f"{column}.{suffix}"
+
+
+def feature_columns(features):
+    """Store columns of ``FeatureEngine`` features (one frame) or a
+    ``compute_features`` sequence"""
+    if features is None:
+        return {}
+    columns = {f'angle.{name}': np.asarray(features['angles'])[..., i]
+               for i, name in enumerate(ANGLE_NAMES)}
+    columns['speed'] = features['speed']
+    return columns
+
+
+def frame_row(timestamp, results=None, features=None):
+    """One frame of store columns from a pose result and its features"""
+    row = {'timestamp': timestamp}
+    if results is not None and results.pose_landmarks:
+        row['landmarks'] = landmarks_to_array(results.pose_landmarks)
+    if results is not None and getattr(results, 'pose_world_landmarks', None):
+        row['world_landmarks'] = landmarks_to_array(results.pose_world_landmarks)
+    row.update(feature_columns(features))
+    return row
+
+
+class SessionWriter:
+    """Appends frames to one session in chunks of ``chunk_frames`` rows.
+
+    Rows collect in preallocated buffers; a full chunk is encoded and
+    appended to every column file before its record goes into the chunk
+    index, so readers only ever see whole chunks. Missing columns are NaN.
+    """
+
+    def __init__(self, path, info):
+        self.path = path
+        self.info = info
+        self.chunk_frames = info['chunk_frames']
+        self.columns = {name: (tuple(spec['shape']), spec['encoding'])
+                        for name, spec in info['columns'].items()}
+        self._buffers = {name: np.full((self.chunk_frames,) + shape, np.nan, dtype=np.float64)
+                         for name, (shape, _) in self.columns.items()}
+        self._rows = 0
+        self._frames = info.get('frames', 0)
+        self.closed = False
+
+    def append(self, row):
+        """Add one frame: {column: value}, including 'timestamp'"""
+        for name, value in row.items():
+            buffer = self._buffers.get(name)
+            if buffer is not None and value is not None:
+                buffer[self._rows] = value
+        self._rows += 1
+        if self._rows == self.chunk_frames:
+            self._flush()
+
+    def extend(self, columns):
+        """Add many frames at once: {column: (frames, ...) array}"""
+        count, done = len(columns['timestamp']), 0
+        while done < count:
+            take = min(count - done, self.chunk_frames - self._rows)
+            for name, values in columns.items():
+                if name in self._buffers and values is not None:
+                    self._buffers[name][self._rows:self._rows + take] = values[done:done + take]
+            self._rows += take
+            done += take
+            if self._rows == self.chunk_frames:
+                self._flush()
+
+    def add_event(self, phase, timestamp, **extra):
+        with open(os.path.join(self.path, 'events.jsonl'), 'a') as f:
+            f.write(json.dumps(dict(extra, phase=phase, timestamp=float(timestamp))) + "\n")
+
+    def _flush(self):
+        rows = self._rows
+        if rows == 0:
+            return
+        timestamps = self._buffers['timestamp'][:rows]
+        record = np.array([(np.nanmin(timestamps), np.nanmax(timestamps), self._frames, rows)],
+                          dtype=CHUNK_DTYPE)
+        for name, (shape, encoding) in self.columns.items():
+            buffer = self._buffers[name]
+            codes, scales = _encode(buffer[:rows].reshape(rows, -1), encoding)
+            with open(os.path.join(self.path, _file_name(name, 'bin')), 'ab') as f:
+                f.write(codes.tobytes())
+            if scales is not None:
+                with open(os.path.join(self.path, _file_name(name, 'scale')), 'ab') as f:
+                    f.write(scales.tobytes())
+            buffer.fill(np.nan)
+        with open(os.path.join(self.path, 'chunks.idx'), 'ab') as f:
+            f.write(record.tobytes())
+        self._frames += rows
+        self._rows = 0
+
+    def close(self):
+        """Write the last, partial chunk and the session totals"""
+        if self.closed:
+            return
+        self._flush()
+        self.closed = True
+        self.info['frames'] = self._frames
+        self.info['end'] = time.time()
+        with open(os.path.join(self.path, 'session.json'), 'w') as f:
+            json.dump(self.info, f)
+
+
+class Session:
+    """Memory-mapped reader of one stored session"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'session.json')) as f:
+            self.info = json.load(f)
+        self.name = self.info['name']
+        self.start = self.info['start']
+        index = os.path.join(path, 'chunks.idx')
+        self.chunks = np.fromfile(index, dtype=CHUNK_DTYPE) if os.path.exists(index) else \
+            np.zeros(0, dtype=CHUNK_DTYPE)
+        self.frames = int(self.chunks['first'][-1] + self.chunks['frames'][-1]) \
+            if len(self.chunks) else 0
+
+    @property
+    def columns(self):
+        return list(self.info['columns'])
+
+    def chunk_range(self, start=None, end=None):
+        """Chunks overlapping [start, end] seconds of session time"""
+        first = 0 if start is None else int(np.searchsorted(self.chunks['end'], start))
+        last = len(self.chunks) if end is None else \
+            int(np.searchsorted(self.chunks['start'], end, side='right'))
+        return first, max(first, last)
+
+    def _column(self, name, first, last):
+        spec = self.info['columns'][name]
+        shape, encoding = tuple(spec['shape']), spec['encoding']
+        chunks = self.chunks[first:last]
+        if not len(chunks):
+            return np.zeros((0,) + shape, dtype=np.float32)
+        begin, stop = int(chunks['first'][0]), int(chunks['first'][-1] + chunks['frames'][-1])
+        width = int(np.prod(shape, dtype=np.int64))
+        codes = np.memmap(os.path.join(self.path, _file_name(name, 'bin')),
+                          dtype=ENCODINGS[encoding], mode='r', shape=(self.frames, width))
+        scales = None
+        if _quantized(encoding):
+            scales = np.memmap(os.path.join(self.path, _file_name(name, 'scale')),
+                               dtype=np.float32, mode='r', shape=(len(self.chunks), 2, width))
+            scales = np.asarray(scales[first:last])
+        values = _decode(np.asarray(codes[begin:stop]), encoding, scales, chunks['frames'])
+        return values.reshape((stop - begin,) + shape)
+
+    def read(self, columns, start=None, end=None):
+        """{column: array} for the frames between ``start`` and ``end``
+        seconds; only the chunks in range of the named columns (and the
+        timestamps) are read. 'timestamp' is always included."""
+        first, last = self.chunk_range(start, end)
+        timestamps = self._column('timestamp', first, last)
+        keep = slice(None)
+        if start is not None or end is not None:
+            lower = -np.inf if start is None else start
+            upper = np.inf if end is None else end
+            keep = (timestamps >= lower) & (timestamps <= upper)
+        data = {'timestamp': timestamps[keep]}
+        for name in columns:
+            if name != 'timestamp':
+                data[name] = self._column(name, first, last)[keep]
+        return data
+
+    def events(self, start=None, end=None):
+        path = os.path.join(self.path, 'events.jsonl')
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+        return [e for e in events if (start is None or e['timestamp'] >= start) and
+                (end is None or e['timestamp'] <= end)]
+
+
+class SessionStore:
+    """Directory of sessions, each a folder of column files (see
+    ``COLUMNS``) written in time-indexed chunks.
+
+    ``query`` walks the sessions started in a wall-clock range and reads
+    only the requested columns and chunks, e.g. a month of right-elbow
+    angles is ``store.query(['angle.right_elbow'], since=time.time() - 30 * 86400)``.
+    """
+
+    def __init__(self, root, chunk_frames=256, encodings=None):
+        self.root = root
+        self.chunk_frames = chunk_frames
+        self.encodings = dict(encodings or {})
+        self._writers = []
+
+    def create(self, name, video=None, start=None):
+        """New session (a unique folder named after ``name``) for appending"""
+        os.makedirs(self.root, exist_ok=True)
+        folder, suffix = name, 1
+        while os.path.exists(os.path.join(self.root, folder)):
+            suffix += 1
+            folder = f"{name}_{suffix}"
+        path = os.path.join(self.root, folder)
+        os.makedirs(path)
+        info = {
+            'name': folder,
+            'video': video,
+            'start': time.time() if start is None else start,
+            'chunk_frames': self.chunk_frames,
+            'columns': {column: {'shape': list(shape),
+                                 'encoding': self.encodings.get(column, encoding)}
+                        for column, (shape, encoding) in COLUMNS.items()},
+        }
+        with open(os.path.join(path, 'session.json'), 'w') as f:
+            json.dump(info, f)
+        writer = SessionWriter(path, info)
+        self._writers = [w for w in self._writers if not w.closed] + [writer]
+        return writer
+
+    def sessions(self, since=None, until=None):
+        """Sessions started between ``since`` and ``until`` (epoch
+        seconds), oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        sessions = []
+        for folder in os.listdir(self.root):
+            header = os.path.join(self.root, folder, 'session.json')
+            if not os.path.exists(header):
+                continue
+            with open(header) as f:
+                started = json.load(f)['start']
+            if (since is None or started >= since) and (until is None or started <= until):
+                sessions.append(Session(os.path.join(self.root, folder)))
+        return sorted(sessions, key=lambda session: session.start)
+
+    def query(self, columns, since=None, until=None, start=None, end=None):
+        """(session, {column: array}) for each session in the wall-clock
+        range, limited to ``start``..``end`` seconds of session time"""
+        for session in self.sessions(since, until):
+            yield session, session.read(columns, start, end)
+
+    def cleanup(self):
+        for writer in self._writers:
+            writer.close()
+        self._writers = []
+
+
+def add_store_arguments(parser):
+    parser.add_argument('--session-store', metavar='DIR',
+                        help="store the landmarks, features and swing phases of every "
+                             "recording as a session in DIR")
+
+
+def store_from_args(args):
+    if not getattr(args, 'session_store', None):
+        return None
+    store = SessionStore(args.session_store)
+    print(f"Session store: {len(store.sessions())} sessions")
+    return store
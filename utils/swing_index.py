@@ -0,0 +1,315 @@
+import json
+import os
+
+import numpy as np
+
+from utils.features import ANGLE_NAMES
+from utils.reference import ANGLE_SCALE, normalize_swing
+
+EMBEDDING_LENGTH = 16   # Samples per swing in the embedding
+
+
+def swing_embedding(angles, timestamps, events, length=EMBEDDING_LENGTH):
+    """Fixed-length embedding of one swing (``split_swings`` item over a
+    (T, 9) angle sequence): the normalized angles resampled onto ``length``
+    samples, flattened to (length * 9,) float32. None when unusable."""
+    sequence = normalize_swing(angles, timestamps, events[0].timestamp, events[-1].timestamp,
+                               length)
+    return None if sequence is None else sequence.reshape(-1)
+
+
+def _squared_distances(queries, rows, row_norms):
+    """(Q, N) squared Euclidean distances as one matrix product"""
+    distances = row_norms[None, :] - 2.0 * (queries @ rows.T)
+    distances += (queries ** 2).sum(axis=1)[:, None]
+    return np.maximum(distances, 0.0, out=distances)
+
+
+def _kmeans(data, count, iterations, rng):
+    """Lloyd's k-means: (count, D) centroids"""
+    centroids = data[rng.choice(len(data), count, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _squared_distances(data, centroids, (centroids ** 2).sum(axis=1)).argmin(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        sizes = np.bincount(labels, minlength=count)
+        empty = sizes == 0
+        centroids[~empty] = sums[~empty] / sizes[~empty, None]
+        # Restart empty clusters on random points
+        centroids[empty] = data[rng.choice(len(data), int(empty.sum()))]
+    return centroids
+
+
+def _top_k(distances, indices, k):
+    """Row-wise k smallest (distances, indices), sorted"""
+    k = min(k, distances.shape[1])
+    part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    distances = np.take_along_axis(distances, part, axis=1)
+    indices = np.take_along_axis(indices, part, axis=1)
+    order = np.argsort(distances, axis=1)
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+class SwingIndex:
+    """Archive of swing embeddings for similar-swing search.
+
+    ``path`` holds ``embeddings.f32``, a raw (N, D) float32 matrix read
+    through a memory map, ``entries.jsonl`` with one metadata line per row
+    and ``index.json``. Inserting appends to both files, so swings can be
+    added while sessions are recorded without rewriting the archive.
+
+    Exact search computes squared distances for a batch of queries with one
+    matrix product per block of ``block`` rows. ``build_ivf`` adds an
+    inverted-file index with product-quantized residuals for large
+    archives: a query then scores only the ``nprobe`` closest lists from
+    lookup tables and re-ranks the best ``rerank`` * k exactly.
+    """
+
+    def __init__(self, path, length=EMBEDDING_LENGTH, block=8192):
+        self.path = path
+        self.block = block
+        self.length = length
+        self.ivf = None             # {'lists', 'subspaces'} once build_ivf has run
+        header = os.path.join(path, 'index.json')
+        if os.path.exists(header):
+            with open(header) as f:
+                index = json.load(f)
+            self.length, self.ivf = index['length'], index.get('ivf')
+        self.dim = self.length * len(ANGLE_NAMES)
+        self.entries = []
+        entries = os.path.join(path, 'entries.jsonl')
+        if os.path.exists(entries):
+            with open(entries) as f:
+                self.entries = [json.loads(line) for line in f if line.strip()]
+        self._ivf_arrays = None
+        if self.ivf is not None:
+            with np.load(os.path.join(path, 'ivf.npz')) as arrays:
+                self._ivf_arrays = {'centroids': arrays['centroids'],
+                                    'codebooks': arrays['codebooks']}
+        self._reload()
+        self._repair()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _rows(self, name, dtype, width):
+        """Memory map of an appended raw file, or an empty array"""
+        path = self._file(name)
+        itemsize = np.dtype(dtype).itemsize * width
+        rows = os.path.getsize(path) // itemsize if os.path.exists(path) else 0
+        if rows == 0:
+            return np.zeros((0, width), dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(rows, width))
+
+    def _reload(self, norms=None):
+        """Map the files again; ``norms`` of rows already known are kept"""
+        self._matrix = self._rows('embeddings.f32', np.float32, self.dim)
+        count = min(len(self._matrix), len(self.entries))
+        if self.ivf is not None:
+            self._lists = self._rows('ivf_lists.i32', np.int32, 1)[:, 0]
+            self._codes = self._rows('ivf_codes.u8', np.uint8, self.ivf['subspaces'])
+            count = min(count, len(self._lists), len(self._codes))
+            self._lists, self._codes = self._lists[:count], self._codes[:count]
+        self._matrix, self.entries = self._matrix[:count], self.entries[:count]
+        known = 0 if norms is None else min(len(norms), count)
+        self._norms = np.empty(count, dtype=np.float32)
+        self._norms[:known] = norms[:known] if known else 0
+        for start in range(known, count, self.block):
+            rows = np.asarray(self._matrix[start:start + self.block])
+            self._norms[start:start + len(rows)] = (rows ** 2).sum(axis=1)
+        self._inverted = None
+
+    def _repair(self):
+        """Cut every file back to the rows they all have, so appends after
+        an interrupted insert stay aligned"""
+        count = len(self.entries)
+        files = [('embeddings.f32', self.dim * 4)]
+        if self.ivf is not None:
+            files += [('ivf_lists.i32', 4), ('ivf_codes.u8', self.ivf['subspaces'])]
+        for name, row_bytes in files:
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > count * row_bytes:
+                os.truncate(path, count * row_bytes)
+        path = self._file('entries.jsonl')
+        if os.path.exists(path):
+            with open(path) as f:
+                lines = sum(1 for line in f if line.strip())
+            if lines > count:
+                with open(path, 'w') as f:
+                    f.writelines(json.dumps(entry) + "\n" for entry in self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _write_header(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file('index.json'), 'w') as f:
+            json.dump({'length': self.length, 'angles': list(ANGLE_NAMES), 'ivf': self.ivf}, f)
+
+    def add(self, name, angles, timestamps, events, **meta):
+        """Append the swing delimited by ``events`` (one ``split_swings``
+        item); extra keyword arguments are stored with it. Returns False
+        when the swing has too few usable frames."""
+        embedding = swing_embedding(angles, timestamps, events, self.length)
+        if embedding is None:
+            return False
+        start, end = events[0].timestamp, events[-1].timestamp
+        self.add_embeddings(embedding[None], [dict(meta, name=name, duration=end - start)])
+        return True
+
+    def add_embeddings(self, embeddings, entries):
+        """Append (n, D) embeddings and their metadata dicts"""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if not os.path.exists(self._file('index.json')):
+            self._write_header()
+        if self.ivf is not None:
+            lists, codes = self._encode(embeddings)
+            with open(self._file('ivf_lists.i32'), 'ab') as f:
+                f.write(lists.astype(np.int32).tobytes())
+            with open(self._file('ivf_codes.u8'), 'ab') as f:
+                f.write(codes.tobytes())
+        with open(self._file('embeddings.f32'), 'ab') as f:
+            f.write(embeddings.tobytes())
+        with open(self._file('entries.jsonl'), 'a') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        self.entries.extend(entries)
+        self._reload(self._norms)
+
+    def search(self, queries, k=5, nprobe=8, rerank=10):
+        """k nearest swings of each (D,) or (Q, D) query: (distances,
+        indices), both (Q, k), with squared distances in normalized units and
+        -1 indices where the archive has fewer than k swings. Uses the IVF
+        index when there is one (``nprobe`` lists per query)."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        count = len(self)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        if count == 0:
+            return distances, indices
+        if self.ivf is not None:
+            return self._search_ivf(queries, k, nprobe, rerank)
+        for start in range(0, count, self.block):
+            rows = np.asarray(self._matrix[start:start + self.block])
+            block = _squared_distances(queries, rows, self._norms[start:start + len(rows)])
+            if np.isfinite(distances[:, -1]).all():
+                # Only rows beating the current k-th best can enter
+                hits, columns = np.nonzero(block < distances[:, -1:])
+                if not len(hits):
+                    continue
+                counts = np.bincount(hits, minlength=len(queries))
+                slots = np.arange(len(hits)) - np.repeat(np.cumsum(counts) - counts, counts)
+                candidates = np.full((len(queries), counts.max()), np.inf, dtype=np.float32)
+                positions = np.full(candidates.shape, -1, dtype=np.int64)
+                candidates[hits, slots] = block[hits, columns]
+                positions[hits, slots] = columns + start
+            elif block.shape[1] > k:
+                part = np.argpartition(block, k - 1, axis=1)[:, :k]
+                candidates, positions = np.take_along_axis(block, part, axis=1), part + start
+            else:
+                candidates = block
+                positions = np.broadcast_to(np.arange(start, start + block.shape[1]), block.shape)
+            distances, indices = _top_k(np.hstack([distances, candidates]),
+                                        np.hstack([indices, positions]), k)
+        return distances, indices
+
+    def similar(self, angles, timestamps, events, k=5):
+        """The k archived swings closest to one swing: [(entry, RMS degrees)]"""
+        embedding = swing_embedding(angles, timestamps, events, self.length)
+        if embedding is None:
+            return []
+        distances, indices = self.search(embedding, k)
+        return [(self.entries[i], float(np.sqrt(d / self.dim)) * ANGLE_SCALE)
+                for d, i in zip(distances[0], indices[0]) if i >= 0]
+
+    def build_ivf(self, lists=None, subspaces=16, iterations=10, sample=20000, seed=0):
+        """Train the coarse quantizer (``lists`` centroids, default about
+        4 * sqrt(N)) and the residual product quantizer (``subspaces``
+        codebooks of 256 codes) on a sample, then encode every swing"""
+        count = len(self)
+        if count == 0 or self.dim % subspaces:
+            raise Exception(f"Cannot build IVF: {count} swings, {self.dim} dims / {subspaces}")
+        rng = np.random.default_rng(seed)
+        lists = min(count, lists or max(1, int(4 * np.sqrt(count))))
+        picked = np.sort(rng.choice(count, min(count, sample), replace=False))
+        data = np.asarray(self._matrix[picked])
+        centroids = _kmeans(data, lists, iterations, rng)
+        labels = _squared_distances(data, centroids, (centroids ** 2).sum(axis=1)).argmin(axis=1)
+        residuals = (data - centroids[labels]).reshape(len(data), subspaces, -1)
+        codes = min(256, len(data))
+        codebooks = np.stack([_kmeans(residuals[:, m], codes, iterations, rng)
+                              for m in range(subspaces)])
+        self._ivf_arrays = {'centroids': centroids.astype(np.float32),
+                            'codebooks': codebooks.astype(np.float32)}
+        self.ivf = {'lists': int(lists), 'subspaces': int(subspaces)}
+
+        os.makedirs(self.path, exist_ok=True)
+        np.savez(self._file('ivf.npz'), **self._ivf_arrays)
+        with open(self._file('ivf_lists.i32'), 'wb') as lists_file, \
+                open(self._file('ivf_codes.u8'), 'wb') as codes_file:
+            for start in range(0, count, self.block):
+                list_ids, codes = self._encode(np.asarray(self._matrix[start:start + self.block]))
+                lists_file.write(list_ids.astype(np.int32).tobytes())
+                codes_file.write(codes.tobytes())
+        self._write_header()
+        self._reload()
+
+    def _encode(self, rows):
+        """Nearest list and residual PQ codes of (n, D) rows"""
+        centroids, codebooks = self._ivf_arrays['centroids'], self._ivf_arrays['codebooks']
+        lists = _squared_distances(rows, centroids, (centroids ** 2).sum(axis=1)).argmin(axis=1)
+        residuals = (rows - centroids[lists]).reshape(len(rows), len(codebooks), -1)
+        codes = np.stack([_squared_distances(residuals[:, m], codebook,
+                                             (codebook ** 2).sum(axis=1)).argmin(axis=1)
+                          for m, codebook in enumerate(codebooks)], axis=1)
+        return lists, codes.astype(np.uint8)
+
+    def _search_ivf(self, queries, k, nprobe, rerank):
+        centroids, codebooks = self._ivf_arrays['centroids'], self._ivf_arrays['codebooks']
+        if self._inverted is None:
+            order = np.argsort(self._lists, kind='stable')
+            offsets = np.searchsorted(self._lists[order], np.arange(len(centroids) + 1))
+            self._inverted = (order, offsets, (centroids ** 2).sum(axis=1),
+                              (codebooks ** 2).sum(axis=-1))
+        order, offsets, centroid_norms, code_norms = self._inverted
+        nprobe = min(nprobe, len(centroids))
+        coarse = _squared_distances(queries, centroids, centroid_norms)
+        probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        subspaces = np.arange(len(codebooks))
+        for q, (query, probe) in enumerate(zip(queries, probes)):
+            members = [order[offsets[p]:offsets[p + 1]] for p in probe]
+            sizes = np.array([len(m) for m in members])
+            members = np.concatenate(members)
+            if not len(members):
+                continue
+            # Lookup tables of the query residual against every code: (P, M, 256)
+            residual = (query - centroids[probe]).reshape(len(probe), len(codebooks), -1)
+            tables = code_norms - 2.0 * np.einsum('pmd,mjd->pmj', residual, codebooks)
+            tables += (residual ** 2).sum(axis=-1)[..., None]
+            owner = np.repeat(np.arange(len(probe)), sizes)
+            approximate = tables[owner[:, None], subspaces, self._codes[members]].sum(axis=1)
+
+            # Exact distances for the best candidates
+            keep = min(len(members), k * rerank)
+            best = np.sort(members[np.argpartition(approximate, keep - 1)[:keep]])
+            exact = _squared_distances(query[None], np.asarray(self._matrix[best]),
+                                       self._norms[best])
+            found_d, found_i = _top_k(exact, best[None], k)
+            distances[q, :found_d.shape[1]], indices[q, :found_i.shape[1]] = found_d[0], found_i[0]
+        return distances, indices
+
+
+def add_index_arguments(parser):
+    parser.add_argument('--swing-index', metavar='DIR',
+                        help="archive every swing recorded to video in the swing index in DIR")
+
+
+def index_from_args(args):
+    if not getattr(args, 'swing_index', None):
+        return None
+    index = SwingIndex(args.swing_index)
+    print(f"Swing index: {len(index)} swings")
+    return index
@@ -0,0 +1,297 @@
+import numpy as np
+from scipy.signal import lfilter
+
+from utils.features import POINT_NAMES
+
+PHASES = ('idle', 'preparation', 'backswing', 'forward_swing', 'impact', 'follow_through')
+HANDS = ('left', 'right')
+
+_WRISTS = [POINT_NAMES.index('left_wrist'), POINT_NAMES.index('right_wrist')]
+_SHOULDERS = [POINT_NAMES.index('left_shoulder'), POINT_NAMES.index('right_shoulder')]
+
+
+class PhaseEvent:
+    """A phase change: ``phase`` started at ``timestamp`` (seconds)"""
+
+    def __init__(self, phase, timestamp, hand=None):
+        self.phase = phase
+        self.timestamp = timestamp
+        self.hand = hand          # 'left' / 'right' once the swinging hand is known
+
+    def __repr__(self):
+        return f"PhaseEvent({self.phase!r}, {self.timestamp:.3f}, {self.hand!r})"
+
+
+def _wrist_velocity(velocity):
+    """Wrist velocity relative to the shoulder midpoint: (..., 8, 3) -> (..., 2, 3)"""
+    return velocity[..., _WRISTS, :] - velocity[..., _SHOULDERS, :].mean(axis=-2, keepdims=True)
+
+
+class SwingPhaseSegmenter:
+    """Streaming swing-phase state machine over the feature engine's output.
+
+    Both wrists' velocities relative to the shoulders are low-pass filtered
+    (an EMA with factor ``smoothing``). The swing then runs through:
+
+    - idle -> preparation when either wrist moves faster than ``start_speed``
+    - preparation -> backswing when a wrist passes ``swing_speed``; that
+      wrist becomes the swinging hand
+    - backswing -> forward swing at the zero crossing, when the hand's
+      velocity turns against its last fast direction (top of the swing)
+    - forward swing -> impact at the speed peak, once the speed has dropped
+      to ``impact_drop`` of a peak above ``impact_speed``. The event carries
+      the peak's timestamp, so it arrives a few frames late
+    - impact -> follow-through immediately, then idle once both wrists stay
+      below ``rest_speed`` for ``settle_time`` seconds
+
+    Preparation, forward swing and follow-through also settle back to idle,
+    and any phase longer than ``max_phase`` seconds is abandoned. Speeds are
+    in m/s (MediaPipe world landmarks). Each update does constant work.
+    """
+
+    def __init__(self, smoothing=0.4, start_speed=0.4, rest_speed=0.25, swing_speed=0.8,
+                 impact_speed=2.0, impact_drop=0.8, settle_time=0.3, max_phase=3.0,
+                 history=32):
+        self.smoothing = smoothing
+        self.start_speed = start_speed
+        self.rest_speed = rest_speed
+        self.swing_speed = swing_speed
+        self.impact_speed = impact_speed
+        self.impact_drop = impact_drop
+        self.settle_time = settle_time
+        self.max_phase = max_phase
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        self.phase = 'idle'
+        self.phase_start = None
+        self.hand = None
+        self.swings = 0
+        self.events = []          # Most recent events, at most ``history``
+        self.last_swing = None    # {phase: duration} of the last completed swing
+        self._velocity = None     # Filtered (2, 3) wrist velocities
+        self._direction = np.full((2, 3), np.nan, dtype=np.float32)
+        self._rest_since = None
+        self._peak = 0.0
+        self._peak_time = None
+        self._swing = []
+
+    def update(self, features):
+        """Advance by one frame of ``FeatureEngine`` features; returns the
+        events emitted on this frame (usually none)"""
+        if features is None:
+            return []
+        velocity = _wrist_velocity(np.asarray(features['velocity'], dtype=np.float32))
+        if not np.isfinite(velocity).all():
+            return []
+        timestamp = float(features['timestamp'])
+        if self._velocity is None:
+            self._velocity = velocity.copy()
+        else:
+            self._velocity += self.smoothing * (velocity - self._velocity)
+        velocity = self._velocity
+        speeds = np.linalg.norm(velocity, axis=1)
+
+        # Zero crossing against the last fast direction, before updating it
+        reversed_ = (velocity * self._direction).sum(axis=1) < 0
+        fast = speeds > self.swing_speed / 2
+        self._direction[fast] = velocity[fast] / speeds[fast, None]
+
+        if speeds.max() < self.rest_speed:
+            if self._rest_since is None:
+                self._rest_since = timestamp
+        else:
+            self._rest_since = None
+        settled = self._rest_since is not None and timestamp - self._rest_since >= self.settle_time
+
+        events = []
+        phase = self.phase
+        if phase != 'idle' and timestamp - self.phase_start > self.max_phase:
+            self._change('idle', timestamp, events)
+        elif phase == 'idle':
+            if speeds.max() > self.start_speed:
+                self._change('preparation', timestamp, events)
+        elif phase == 'preparation':
+            hand = int(np.argmax(speeds))
+            if speeds[hand] > self.swing_speed:
+                self.hand = hand
+                self._change('backswing', timestamp, events)
+            elif settled:
+                self._change('idle', timestamp, events)
+        elif phase == 'backswing':
+            if reversed_[self.hand]:
+                self._peak, self._peak_time = float(speeds[self.hand]), timestamp
+                self._change('forward_swing', timestamp, events)
+        elif phase == 'forward_swing':
+            speed = float(speeds[self.hand])
+            if speed > self._peak:
+                self._peak, self._peak_time = speed, timestamp
+            elif self._peak >= self.impact_speed and speed < self.impact_drop * self._peak:
+                self._change('impact', self._peak_time, events)
+                self._change('follow_through', timestamp, events)
+            elif settled:
+                self._change('idle', timestamp, events)
+        elif phase == 'follow_through':
+            if settled:
+                self._change('idle', timestamp, events)
+        return events
+
+    def _change(self, phase, timestamp, events):
+        if phase == 'idle':
+            if self.phase == 'follow_through':
+                self.swings += 1
+                self.last_swing = _durations(self._swing + [PhaseEvent('idle', timestamp)])
+            self._swing = []
+            self.hand = None
+        event = PhaseEvent(phase, timestamp, HANDS[self.hand] if self.hand is not None else None)
+        self._swing.append(event)
+        events.append(event)
+        self.events.append(event)
+        if len(self.events) > self.history:
+            del self.events[0]
+        self.phase = phase
+        self.phase_start = timestamp
+
+    def summary(self):
+        """Snapshot for the analysis quadrant"""
+        return {
+            'phase': self.phase,
+            'hand': HANDS[self.hand] if self.hand is not None else None,
+            'swings': self.swings,
+            'last_swing': self.last_swing,
+        }
+
+    def segment(self, features):
+        """Offline counterpart of ``update``: segment a whole sequence of
+        ``compute_features`` output (T frames) in one vectorized pass over the
+        frames; only the per-event bookkeeping is a Python loop. Frames with
+        NaN velocities are dropped, as the streaming segmenter ignores them.
+        Returns the list of events. Streaming state is left untouched."""
+        velocity = _wrist_velocity(np.asarray(features['velocity'], dtype=np.float32))
+        timestamps = np.asarray(features['timestamp'], dtype=np.float64)
+        valid = np.isfinite(velocity).all(axis=(1, 2))
+        velocity, timestamps = velocity[valid], timestamps[valid]
+        count = len(timestamps)
+        if count == 0:
+            return []
+
+        # Same EMA as the streaming filter, which starts at the first sample
+        a = self.smoothing
+        velocity, _ = lfilter([a], [1.0, a - 1.0], velocity, axis=0,
+                              zi=(1.0 - a) * velocity[:1])
+        speeds = np.linalg.norm(velocity, axis=2)        # (T, 2)
+        top = speeds.max(axis=1)
+        frames = np.arange(count)
+
+        # Last fast direction before each frame, per hand (forward fill)
+        fast = speeds > self.swing_speed / 2
+        last_fast = np.maximum.accumulate(np.where(fast, frames[:, None], -1), axis=0)
+        previous = np.vstack([np.full((1, 2), -1), last_fast[:-1]])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            unit = velocity / speeds[..., None]
+        direction = unit[np.maximum(previous, 0), [0, 1]]
+        reversed_ = ((velocity * direction).sum(axis=2) < 0) & (previous >= 0)
+
+        # Settled: inside a run of resting frames that began settle_time ago
+        resting = top < self.rest_speed
+        rest_start = np.maximum.accumulate(np.where(resting, 0, frames + 1))
+        settled = resting & (timestamps - timestamps[np.minimum(rest_start, count - 1)]
+                             >= self.settle_time)
+
+        starts = np.flatnonzero(top > self.start_speed)
+        swing_hand = np.argmax(speeds, axis=1)
+        swinging = np.flatnonzero(speeds[frames, swing_hand] > self.swing_speed)
+        settled_at = np.flatnonzero(settled)
+        reversed_at = [np.flatnonzero(reversed_[:, hand]) for hand in (0, 1)]
+
+        def after(indices, frame):
+            """First index in ``indices`` after ``frame``, or None"""
+            pos = np.searchsorted(indices, frame, side='right')
+            return int(indices[pos]) if pos < len(indices) else None
+
+        events = []
+
+        def change(phase, frame, hand=None, timestamp=None):
+            timestamp = float(timestamps[frame]) if timestamp is None else timestamp
+            events.append(PhaseEvent(phase, timestamp, HANDS[hand] if hand is not None else None))
+            return frame
+
+        def timeout(frame):
+            return int(np.searchsorted(timestamps, timestamps[frame] + self.max_phase,
+                                       side='right'))
+
+        frame = -1
+        while True:
+            # idle -> preparation (a phase's conditions apply from the next frame)
+            frame = after(starts, frame)
+            if frame is None:
+                break
+            frame = change('preparation', frame)
+            nxt, phase = _earliest([(after(swinging, frame), 'backswing'),
+                                    (after(settled_at, frame), 'idle')], timeout(frame))
+            if phase == 'backswing':
+                hand = int(swing_hand[nxt])
+                frame = change('backswing', nxt, hand)
+                nxt, phase = _earliest([(after(reversed_at[hand], frame), 'forward_swing')],
+                                       timeout(frame))
+            if phase == 'forward_swing':
+                frame = change('forward_swing', nxt, hand)
+                # Impact: first frame below impact_drop of the running peak.
+                # As in ``update``, a new peak takes precedence over both
+                # impact and settling, and impact over settling
+                end = timeout(frame)
+                window = speeds[frame:end, hand]
+                peak = np.maximum.accumulate(window)
+                hit = np.flatnonzero((peak[:-1] >= self.impact_speed) &
+                                     (window[1:] < self.impact_drop * peak[:-1]))
+                impact = frame + 1 + int(hit[0]) if hit.size else None
+                calm = np.flatnonzero(settled[frame + 1:end] & (window[1:] <= peak[:-1]))
+                settle = frame + 1 + int(calm[0]) if calm.size else None
+                nxt, phase = _earliest([(impact, 'impact'), (settle, 'idle')], end)
+            if phase == 'impact':
+                peak_frame = frame + int(np.argmax(speeds[frame:nxt, hand]))
+                change('impact', nxt, hand, float(timestamps[peak_frame]))
+                frame = change('follow_through', nxt, hand)
+                nxt, phase = _earliest([(after(settled_at, frame), 'idle')], timeout(frame))
+            if nxt >= count:
+                break  # Still mid-swing when the sequence ends
+            frame = change('idle', nxt)
+        return events
+
+
+def _earliest(candidates, timeout):
+    """The earliest (frame, phase) candidate, or (timeout, 'idle') when none
+    comes before the frame at which the phase times out"""
+    found = [(frame, phase) for frame, phase in candidates
+             if frame is not None and frame < timeout]
+    if not found:
+        return timeout, 'idle'
+    return min(found, key=lambda item: item[0])
+
+
+def _durations(swing):
+    """{phase: seconds} from the events of one swing"""
+    return {event.phase: nxt.timestamp - event.timestamp
+            for event, nxt in zip(swing, swing[1:]) if event.phase != 'impact'}
+
+
+def split_swings(events):
+    """Group events into complete swings: lists running from 'preparation'
+    to 'idle' that include an impact"""
+    swings, current = [], []
+    for event in events:
+        if event.phase == 'preparation':
+            current = [event]
+        elif current:
+            current.append(event)
+            if event.phase == 'idle':
+                if any(e.phase == 'impact' for e in current):
+                    swings.append(current)
+                current = []
+    return swings
+
+
+def segment_phases(features, **kwargs):
+    """Offline swing phases of a ``compute_features`` sequence"""
+    return SwingPhaseSegmenter(**kwargs).segment(features)
@@ -0,0 +1,204 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+# Set YOACH_TRACE=<path> to enable tracing and dump a Chrome trace on exit
+TRACE_ENV = "YOACH_TRACE"
+DEFAULT_CAPACITY = 1 << 16
+
+
+class _NullSpan:
+    """Shared no-op span returned while tracing is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _RingBuffer:
+    """Fixed-size event buffer owned and written by a single thread.
+
+    Only the owning thread appends, so no lock is needed; the exporter reads
+    a best-effort snapshot. Once full, the oldest events are overwritten.
+    """
+
+    def __init__(self, capacity, thread):
+        self.capacity = capacity
+        self.names = [None] * capacity
+        self.starts = [0] * capacity
+        self.durations = [0] * capacity
+        self.args = [None] * capacity
+        self.position = 0
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+
+    def append(self, name, start_ns, duration_ns, args):
+        index = self.position % self.capacity
+        self.names[index] = name
+        self.starts[index] = start_ns
+        self.durations[index] = duration_ns
+        self.args[index] = args
+        self.position += 1
+
+    def events(self):
+        """Yield (name, start_ns, duration_ns, args) oldest first"""
+        end = self.position
+        begin = max(0, end - self.capacity)
+        for i in range(begin, end):
+            index = i % self.capacity
+            yield self.names[index], self.starts[index], self.durations[index], self.args[index]
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.tracer._buffer().append(self.name, self.start, end - self.start, self.args)
+        return False
+
+
+class Tracer:
+    """Records named spans into per-thread ring buffers.
+
+    Usage::
+
+        with TRACER.span("pose_inference"):
+            ...
+
+        @TRACER.traced("layout")
+        def create_layout(...):
+            ...
+
+    While disabled, ``span`` returns a shared no-op object and ``traced``
+    adds a single attribute check per call.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.enabled = False
+        self.capacity = capacity
+        self.output_path = None
+        self._local = threading.local()
+        self._buffers = []
+        self._lock = threading.Lock()
+        self._origin_ns = time.perf_counter_ns()
+        self._exit_hook_installed = False
+
+    def enable(self, output_path=None, capacity=None):
+        """Start recording; if a path is given the trace is written at exit"""
+        if capacity:
+            self.capacity = capacity
+        self.output_path = output_path or self.output_path
+        self.enabled = True
+        if self.output_path and not self._exit_hook_installed:
+            atexit.register(self._dump_at_exit)
+            self._exit_hook_installed = True
+        return self
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **args):
+        """Context manager recording the enclosed block as one span"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args or None)
+
+    def traced(self, name=None):
+        """Decorator recording every call of the wrapped function"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, span_name, None):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _buffer(self):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = _RingBuffer(self.capacity, threading.current_thread())
+            self._local.buffer = buffer
+            with self._lock:
+                self._buffers.append(buffer)
+        return buffer
+
+    def clear(self):
+        with self._lock:
+            self._buffers = []
+        self._local = threading.local()
+
+    def to_chrome_trace(self):
+        """Build a Chrome ``trace_event`` document (viewable in Perfetto)"""
+        pid = os.getpid()
+        events = []
+        with self._lock:
+            buffers = list(self._buffers)
+        for buffer in buffers:
+            events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': buffer.thread_id,
+                'args': {'name': buffer.thread_name},
+            })
+            for name, start_ns, duration_ns, args in buffer.events():
+                event = {
+                    'name': name,
+                    'ph': 'X',
+                    'ts': (start_ns - self._origin_ns) / 1000.0,
+                    'dur': duration_ns / 1000.0,
+                    'pid': pid,
+                    'tid': buffer.thread_id,
+                }
+                if args:
+                    event['args'] = args
+                events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path=None):
+        """Write the recorded spans as Chrome trace JSON"""
+        path = path or self.output_path
+        if not path:
+            raise ValueError("No trace output path given")
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+        print(f"Trace written to {path}")
+        return path
+
+    def _dump_at_exit(self):
+        if self.enabled and self.output_path:
+            self.export()
+
+
+# Process-wide tracer, enabled from the environment if requested
+TRACER = Tracer()
+if os.environ.get(TRACE_ENV):
+    TRACER.enable(os.environ[TRACE_ENV])
+
+span = TRACER.span
+traced = TRACER.traced
+
+
+def enable_tracing(output_path):
+    """Enable the process-wide tracer (used by the --trace CLI flags)"""
+    return TRACER.enable(output_path)
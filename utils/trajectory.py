@@ -0,0 +1,144 @@
+import cv2
+import numpy as np
+
+RIGHT_WRIST = 16
+
+# Slow (blue) to fast (red)
+SPEED_COLORS = cv2.applyColorMap(np.linspace(0, 255, 8).astype(np.uint8)[:, None],
+                                 cv2.COLORMAP_JET)[:, 0].astype(np.float32)
+
+
+class TrajectoryPath:
+    """Chronological copy of a trajectory for drawing: ``image`` (N, 2)
+    normalized and ``world`` (N, 3) metres (NaN where the pose was lost),
+    plus per-segment ``speed`` and ``fade`` (N - 1,) and the quantized
+    BGR ``colors`` (N - 1, 3) and opacities ``alphas`` (N - 1,) they map to.
+    Drawing needs nothing else, so it never reads the live ring buffer."""
+
+    def __init__(self, image, world, speed, fade, colors=None, alphas=None):
+        self.image = image
+        self.world = world
+        self.speed = speed
+        self.fade = fade
+        self.colors = colors
+        self.alphas = alphas
+
+    def __len__(self):
+        return len(self.image)
+
+
+class Trajectory:
+    """Fixed-capacity ring buffer of one landmark's 2D and 3D positions
+    (the right wrist by default) with timestamps.
+
+    Memory and drawing cost depend on ``capacity`` only, never on the
+    session length. Segments older than ``max_age`` seconds are faded out;
+    colours encode speed up to ``max_speed`` (m/s for world landmarks).
+    """
+
+    def __init__(self, capacity=64, landmark=RIGHT_WRIST, max_age=1.5, max_speed=6.0,
+                 min_visibility=0.5, fade_levels=4):
+        self.capacity = capacity
+        self.landmark = landmark
+        self.max_age = max_age
+        self.max_speed = max_speed
+        self.min_visibility = min_visibility
+        self.fade_levels = fade_levels
+        self._image = np.full((capacity, 2), np.nan, dtype=np.float32)
+        self._world = np.full((capacity, 3), np.nan, dtype=np.float32)
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self.clear()
+
+    def clear(self):
+        self._image.fill(np.nan)
+        self._world.fill(np.nan)
+        self._head = 0      # Next slot to write
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def push(self, results, timestamp):
+        """Record the landmark from a pose result (NaN when it is missing or
+        not visible, which breaks the line)"""
+        slot = self._head
+        self._image[slot] = np.nan
+        self._world[slot] = np.nan
+        landmarks = getattr(results, 'pose_landmarks', None)
+        if landmarks:
+            point = landmarks.landmark[self.landmark]
+            if point.visibility >= self.min_visibility:
+                self._image[slot] = (point.x, point.y)
+                world = results.pose_world_landmarks
+                if world:
+                    point = world.landmark[self.landmark]
+                    self._world[slot] = (point.x, point.y, point.z)
+        self._times[slot] = timestamp
+        self._head = (slot + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def path(self):
+        """Chronological snapshot for drawing, or None when empty"""
+        if self._count < 2:
+            return None
+        order = (self._head - self._count + np.arange(self._count)) % self.capacity
+        image, world, times = self._image[order], self._world[order], self._times[order]
+
+        dt = np.maximum(np.diff(times), 1e-6)
+        moved = world if np.isfinite(world).any() else image
+        with np.errstate(invalid='ignore'):
+            speed = np.linalg.norm(np.diff(moved, axis=0), axis=1) / dt
+        fade = np.clip(1.0 - (times[-1] - times[1:]) / self.max_age, 0.0, 1.0)
+        path = TrajectoryPath(image, world, speed.astype(np.float32), fade.astype(np.float32))
+        path.colors, path.alphas = self.segment_colors(path)
+        return path
+
+    def segment_colors(self, path):
+        """Per-segment BGR speed colours (N - 1, 3) and opacities (N - 1,),
+        quantized to ``len(SPEED_COLORS)`` colours and ``fade_levels`` steps"""
+        levels = len(SPEED_COLORS) - 1
+        speed_level = np.clip(np.nan_to_num(path.speed) / self.max_speed * levels, 0, levels)
+        alpha = np.ceil(path.fade * self.fade_levels) / self.fade_levels
+        return SPEED_COLORS[np.rint(speed_level).astype(np.int32)], alpha.astype(np.float32)
+
+
+def draw_trajectory(frame, path, thickness=3):
+    """Draw a ``Trajectory.path`` snapshot onto a BGR frame in place.
+
+    Segments are grouped by quantized colour and fade, and each group is a
+    single ``cv2.polylines`` call into a premultiplied overlay and an alpha
+    mask; fading is one blend over the trail's bounding box."""
+    if path is None:
+        return frame
+    h, w = frame.shape[:2]
+    points = path.image * (w, h)
+    valid = np.isfinite(points).all(axis=1)
+    keep = valid[:-1] & valid[1:] & (path.fade > 0)
+    if not keep.any():
+        return frame
+    segments = np.rint(np.stack([points[:-1], points[1:]], axis=1)[keep]).astype(np.int32)
+    colors, alphas = path.colors[keep], path.alphas[keep]
+
+    # Draw into a small overlay over the trail's bounding box
+    pad = thickness + 1
+    x1, y1 = np.maximum(segments.reshape(-1, 2).min(axis=0) - pad, 0)
+    x2, y2 = np.minimum(segments.reshape(-1, 2).max(axis=0) + pad + 1, (w, h))
+    if x1 >= x2 or y1 >= y2:
+        return frame
+    segments -= (x1, y1)
+    overlay = np.zeros((y2 - y1, x2 - x1, 3), dtype=np.uint8)
+    mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+    alpha_levels = np.rint(alphas * 255).astype(np.int32)
+    keys = np.rint(colors).astype(np.int32) @ (1 << 16, 1 << 8, 1) + (alpha_levels << 24)
+    for key in np.unique(keys):
+        group = segments[keys == key]
+        alpha = (key >> 24) & 255
+        color = tuple(int(c * alpha / 255) for c in ((key >> 16) & 255, (key >> 8) & 255, key & 255))
+        cv2.polylines(overlay, group, False, color, thickness)
+        cv2.polylines(mask, group, False, int(alpha), thickness)
+
+    # roi * (1 - alpha) + premultiplied overlay; untouched pixels keep alpha 0
+    roi = frame[y1:y2, x1:x2]
+    keep = cv2.cvtColor(cv2.bitwise_not(mask), cv2.COLOR_GRAY2BGR)
+    cv2.add(cv2.multiply(roi, keep, scale=1.0 / 255), overlay, dst=roi)
+    return frame
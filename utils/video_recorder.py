@@ -1,4 +1,6 @@
+import csv
 import cv2
+import os
 import time
 from datetime import datetime
 
@@ -6,19 +8,26 @@ class VideoRecorder:
     def __init__(self):
         self.is_recording = False
         self.video_writer = None
+        self.frame_size = None
         self.start_time = None
         self.frame_count = 0
+        self.fps = None
+        self.filename = None
+        self.markers = []
         
     def start_recording(self, frame_size, fps):
         if not self.is_recording:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"pose_recording_{timestamp}.mp4"
             fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            self.video_writer = cv2.VideoWriter(filename, fourcc, fps, 
-                                              (frame_size[1], frame_size[0]))
+            self.frame_size = (frame_size[1], frame_size[0])
+            self.video_writer = cv2.VideoWriter(filename, fourcc, fps, self.frame_size)
             self.is_recording = True
             self.start_time = time.time()
             self.frame_count = 0
+            self.fps = fps
+            self.filename = filename
+            self.markers = []
             print(f"Started recording: {filename}")
             
     def stop_recording(self):
@@ -30,9 +39,32 @@ class VideoRecorder:
                 self.video_writer.release()
                 self.video_writer = None
                 print(f"Recording stopped. Duration: {duration:.1f}s, Frames: {self.frame_count}, FPS: {fps:.1f}")
+            if self.markers:
+                print(f"Saved {len(self.markers)} markers: {self._write_markers()}")
+
+    def add_marker(self, label, delay=0.0):
+        """Mark the frame written ``delay`` seconds ago (e.g. a swing phase)"""
+        if self.is_recording:
+            fps = self.fps or 30
+            frame = max(0, self.frame_count - 1 - int(round(delay * fps)))
+            self.markers.append((frame, frame / fps, label))
+
+    def _write_markers(self):
+        """Write markers next to the video as <name>_markers.csv"""
+        path = os.path.splitext(self.filename)[0] + "_markers.csv"
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('frame', 'time', 'label'))
+            for frame, seconds, label in self.markers:
+                writer.writerow((frame, f"{seconds:.3f}", label))
+        return path
                 
     def write_frame(self, frame):
         if self.is_recording and self.video_writer:
+            # The writer silently drops frames of the wrong size (e.g. after
+            # the display was resized), so match the size we started with
+            if (frame.shape[1], frame.shape[0]) != self.frame_size:
+                frame = cv2.resize(frame, self.frame_size)
             self.video_writer.write(frame)
             self.frame_count += 1
             